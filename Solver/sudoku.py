@@ -1,10 +1,181 @@
 import logging
+from array import array
+
+BOX_SIZE = 3
+MIN_BOX_SIZE = 2
+MAX_BOX_SIZE = 5
+# one character per value, 0 being a blank: grids up to 25x25 are written one cell per character
+VALUE_CHARS = ".123456789ABCDEFGHIJKLMNOP"
+
+
+class GridGeometry:
+    """
+    Index tables of a grid made of size x size boxes of box_size x box_size cells,
+    built once per box size (see get_geometry). Cells are identified by their flat index
+    row * size + col
+
+    Attributes:
+    - box_size: number of rows and columns of a box (3 for the classic sudoku)
+    - size: number of values, and of rows, columns and boxes
+    - nb_cells: number of cells
+    - all_candidates: bitmask of all the values, bit i set means that i + 1 is a candidate
+    - mask_typecode: array typecode wide enough for the candidate bitmasks
+    - rows, cols, squares: flat indices of the cells of each row, column and box
+    - units: rows, then columns, then boxes
+    - row_units, col_units, square_units: numbers of the units of each kind, indices in units
+    - cell_units: for each cell, the numbers of its row, column and box units
+    - peers: for each cell, the other cells sharing a unit with it
+    """
+
+    __slots__ = (
+        "box_size",
+        "size",
+        "nb_cells",
+        "all_candidates",
+        "mask_typecode",
+        "rows",
+        "cols",
+        "squares",
+        "units",
+        "row_units",
+        "col_units",
+        "square_units",
+        "cell_units",
+        "peers",
+    )
+
+    def __init__(self, box_size):
+        if not MIN_BOX_SIZE <= box_size <= MAX_BOX_SIZE:
+            raise ValueError(f"The box size must be between {MIN_BOX_SIZE} and {MAX_BOX_SIZE}")
+        size = box_size * box_size
+        self.box_size = box_size
+        self.size = size
+        self.nb_cells = size * size
+        self.all_candidates = (1 << size) - 1
+        self.mask_typecode = "H" if size <= 16 else "L"
+        self.rows = tuple(tuple(row * size + col for col in range(size)) for row in range(size))
+        self.cols = tuple(tuple(row * size + col for row in range(size)) for col in range(size))
+        self.squares = tuple(
+            tuple(
+                (square // box_size * box_size + i) * size + square % box_size * box_size + j
+                for i in range(box_size)
+                for j in range(box_size)
+            )
+            for square in range(size)
+        )
+        self.units = self.rows + self.cols + self.squares
+        self.row_units = range(0, size)
+        self.col_units = range(size, 2 * size)
+        self.square_units = range(2 * size, 3 * size)
+        self.cell_units = tuple(
+            (
+                index // size,
+                size + index % size,
+                2 * size + index // size // box_size * box_size + index % size // box_size,
+            )
+            for index in range(self.nb_cells)
+        )
+        self.peers = tuple(
+            tuple(
+                sorted(
+                    {peer for unit in self.cell_units[index] for peer in self.units[unit]}
+                    - {index}
+                )
+            )
+            for index in range(self.nb_cells)
+        )
+
+
+_geometries = {}
+
+
+def get_geometry(box_size=BOX_SIZE):
+    """
+    :param box_size: number of rows and columns of a box, 3 for a 9x9 grid, 4 for 16x16...
+    :return: the shared GridGeometry of this box size
+    """
+    geometry = _geometries.get(box_size)
+    if geometry is None:
+        geometry = _geometries[box_size] = GridGeometry(box_size)
+    return geometry
+
+
+def get_geometry_of_cells(nb_cells):
+    """
+    :param nb_cells: number of cells of a grid
+    :return: the GridGeometry of the grids with this number of cells
+    """
+    box_size = round(nb_cells**0.25)
+    if box_size**4 != nb_cells:
+        raise ValueError(f"No grid has {nb_cells} cells")
+    return get_geometry(box_size)
+
+
+# Index tables of the 9x9 grid, built once
+GEOMETRY = get_geometry(BOX_SIZE)
+SIZE = GEOMETRY.size
+NB_CELLS = GEOMETRY.nb_cells
+ALL_CANDIDATES = GEOMETRY.all_candidates  # bit i set means that i + 1 is a candidate
+ROWS = GEOMETRY.rows
+COLS = GEOMETRY.cols
+SQUARES = GEOMETRY.squares
+# the 27 units: rows are 0-8, columns 9-17 and squares 18-26
+UNITS = GEOMETRY.units
+ROW_UNITS = GEOMETRY.row_units
+COL_UNITS = GEOMETRY.col_units
+SQUARE_UNITS = GEOMETRY.square_units
+# for each cell, the numbers of its row, column and square units
+CELL_UNITS = GEOMETRY.cell_units
+# for each cell, the 20 other cells sharing a unit with it
+PEERS = GEOMETRY.peers
+
+
+def candidates_from_mask(mask):
+    """
+    Get the candidates encoded in a bitmask
+
+    :param mask: bitmask of candidates, bit i standing for candidate i + 1
+    :return: tuple of the candidates in increasing order
+    """
+    candidates = []
+    while mask:
+        low_bit = mask & -mask
+        candidates.append(low_bit.bit_length())
+        mask ^= low_bit
+    return tuple(candidates)
 
 
 class SudokuCell:
-    def __init__(self):
-        self.value = None
-        self.candidates = set(range(1, 10))
+    """
+    View on one cell of a sudoku.
+    The state of the cell lives in the flat arrays of the sudoku, the view only knows its index.
+    """
+
+    __slots__ = ("sudoku", "index")
+
+    def __init__(self, sudoku, index):
+        self.sudoku = sudoku
+        self.index = index
+
+    @property
+    def row(self):
+        return self.index // self.sudoku.geometry.size
+
+    @property
+    def col(self):
+        return self.index % self.sudoku.geometry.size
+
+    @property
+    def value(self):
+        return self.sudoku.values[self.index] or None
+
+    @property
+    def mask(self):
+        return self.sudoku.masks[self.index]
+
+    @property
+    def candidates(self):
+        return candidates_from_mask(self.sudoku.masks[self.index])
 
     def set_value(self, value):
         """
@@ -12,9 +183,12 @@ class SudokuCell:
         :param value: value to put (1-9)
         :return: True is value was placed in the cell, False otherwise
         """
-        if value in self.candidates:
-            self.candidates = []
-            self.value = value
+        size = self.sudoku.geometry.size
+        if 1 <= value <= size and self.sudoku.masks[self.index] & 1 << (value - 1):
+            self.sudoku.masks[self.index] = 0
+            self.sudoku.values[self.index] = value
+            self.sudoku.nb_unsolved -= 1
+            self.sudoku.mark_changed(self.index)
             return True
         else:
             return False
@@ -27,20 +201,114 @@ class SudokuCell:
         :param value: value to remove (1-9)
         :return: True is value was removed, False otherwise
         """
-        if value in self.candidates:
-            self.candidates.remove(value)
+        bit = 1 << (value - 1)
+        if self.sudoku.masks[self.index] & bit:
+            self.sudoku.masks[self.index] ^= bit
+            if not self.sudoku.masks[self.index]:
+                self.sudoku.nb_empty += 1
+            self.sudoku.mark_changed(self.index)
             return True
         else:
-            logging.debug(str(value) + " not in the candidates of this cell")
+            logging.debug("%d not in the candidates of this cell", value)
             return False
 
     def nb_remaining_candidates(self):
-        return len(self.candidates)
+        return self.sudoku.masks[self.index].bit_count()
 
 
 class Sudoku:
-    def __init__(self):
-        self.cells = [[SudokuCell() for _ in range(9)] for _ in range(9)]
+    """
+    Sudoku grid, 9x9 by default
+
+    Attributes:
+    - geometry: GridGeometry with the size and the index tables of the grid
+    - masks: flat array of the 81 candidate bitmasks, in latin reading order (0 once a value is placed)
+    - values: flat array of the 81 values, 0 for an empty cell
+    - unit_versions: for each of the units of the geometry, counter increased every time one of its cells changes
+    - nb_unsolved: number of cells without a value
+    - nb_empty: number of cells without a value and without any candidate left
+    - hooks: None, or object whose set_value(sudoku, index, value) places the values instead of
+      place_value_at, to observe them (see SolverInstrumentation)
+    """
+
+    __slots__ = (
+        "geometry",
+        "masks",
+        "values",
+        "unit_versions",
+        "nb_unsolved",
+        "nb_empty",
+        "hooks",
+        "_cells",
+    )
+
+    def __init__(self, box_size=BOX_SIZE):
+        """
+        :param box_size: number of rows and columns of a box, 4 for a 16x16 grid...
+        """
+        geometry = self.geometry = get_geometry(box_size)
+        self.masks = array(geometry.mask_typecode, [geometry.all_candidates]) * geometry.nb_cells
+        self.values = bytearray(geometry.nb_cells)
+        self.unit_versions = array("L", [0]) * len(geometry.units)
+        self.nb_unsolved = geometry.nb_cells
+        self.nb_empty = 0
+        self.hooks = None
+        self._cells = None
+
+    @property
+    def cells(self):
+        """
+        Rows of cell views, built on first access only
+
+        :return: list of the rows, each one being a list of SudokuCell
+        """
+        if self._cells is None:
+            size = self.geometry.size
+            self._cells = [
+                [SudokuCell(self, row * size + col) for col in range(size)]
+                for row in range(size)
+            ]
+        return self._cells
+
+    def snapshot(self):
+        """
+        Save the state of the grid, to restore it later.
+        The state is the packed arrays, copying it does not depend on the cell views
+
+        :return: immutable state, to give to restore
+        """
+        return self.masks.tobytes(), bytes(self.values), self.nb_unsolved, self.nb_empty
+
+    def restore(self, snapshot):
+        """
+        Put the grid back in a saved state. Every unit is marked as changed,
+        so that the solvers scan them again
+
+        :param snapshot: state returned by snapshot
+        """
+        masks, values, self.nb_unsolved, self.nb_empty = snapshot
+        self.masks[:] = array(self.masks.typecode, masks)
+        self.values[:] = values
+        versions = self.unit_versions
+        for unit in range(len(versions)):
+            versions[unit] += 1
+
+    def clone(self):
+        """
+        Independent copy of the grid, sharing nothing with it. The hooks are not copied
+
+        :return: the new Sudoku
+        """
+        sudoku = Sudoku.__new__(Sudoku)
+        sudoku.geometry = self.geometry
+        sudoku.masks = array(self.masks.typecode, self.masks)
+        sudoku.values = bytearray(self.values)
+        sudoku.unit_versions = array("L", self.unit_versions)
+        sudoku.nb_unsolved = self.nb_unsolved
+        sudoku.nb_empty = self.nb_empty
+        sudoku.hooks = None
+        sudoku._cells = None
+        return sudoku
 
     def set_value(self, row, col, value):
         """
@@ -53,35 +321,115 @@ class Sudoku:
         :param value: sudoku cell value (1-9)
         :return: True is value was placed in the cell, False otherwise
         """
-        logging.debug(
-            "Setting value "
-            + str(value)
-            + " in square ("
-            + str(row)
-            + ", "
-            + str(col)
-            + ")"
-        )
-        is_ok = self.cells[row][col].set_value(value)
-        if not is_ok:
-            logging.debug(
-                str(value) + " cannot be in square (" + str(row) + ", " + str(col) + ")"
-            )
-            return False
+        return self.set_value_at(row * self.geometry.size + col, value)
+
+    def set_value_at(self, index, value):
+        """
+        Same as set_value, with the cell identified by its flat index
 
+        :param index: flat index of the cell (0-80)
+        :param value: sudoku cell value (1-9)
+        :return: True is value was placed in the cell, False otherwise
+        """
+        if self.hooks is not None:
+            return self.hooks.set_value(self, index, value)
+        return self.place_value_at(index, value)
 
-        self.remove_candidate_from_cells(value, [(row, i) for i in range(9)])
-        self.remove_candidate_from_cells(value, [(i, col) for i in range(9)])
-        self.remove_candidate_from_cells(value, [(row // 3 * 3 + i, col // 3 * 3 + j) for i in range(3) for j in range(3)])
+    def place_value_at(self, index, value):
+        """
+        Same as set_value_at, without calling the hooks
+        """
+        masks = self.masks
+        geometry = self.geometry
+        bit = 1 << (value - 1) if 1 <= value <= geometry.size else 0
+        if not masks[index] & bit:
+            return False
+        cell_units = geometry.cell_units
+
+        masks[index] = 0
+        self.values[index] = value
+        self.nb_unsolved -= 1
+        versions = self.unit_versions
+        for unit in cell_units[index]:
+            versions[unit] += 1
+        for peer in geometry.peers[index]:
+            if masks[peer] & bit:
+                masks[peer] ^= bit
+                if not masks[peer]:
+                    self.nb_empty += 1
+                for unit in cell_units[peer]:
+                    versions[unit] += 1
         return True
 
     def remove_candidate_from_cells(self, candidate, cell_positions):
+        return self.remove_candidate_at(
+            candidate, [i * self.geometry.size + j for i, j in cell_positions]
+        )
+
+    def remove_candidate_at(self, candidate, indices):
+        """
+        Removes a candidate from the cells at the given flat indices
+
+        :param candidate: candidate to remove (1-9)
+        :param indices: flat indices of the cells (0-80)
+        :return: number of cells the candidate was removed from
+        """
         nb_removed = 0
-        for i,j in cell_positions:
-            if self.cells[i][j].remove_candidate(candidate):
+        bit = 1 << (candidate - 1)
+        masks = self.masks
+        for index in indices:
+            if masks[index] & bit:
+                masks[index] ^= bit
+                if not masks[index]:
+                    self.nb_empty += 1
+                self.mark_changed(index)
                 nb_removed += 1
         return nb_removed
 
+    def keep_candidates_at(self, index, keep):
+        """
+        Removes from the candidates of a cell the ones that are not in the given bitmask
+
+        :param index: flat index of the cell (0-80)
+        :param keep: bitmask of the candidates to keep
+        :return: number of candidates removed
+        """
+        removed = self.masks[index] & ~keep
+        if not removed:
+            return 0
+        self.masks[index] ^= removed
+        if not self.masks[index]:
+            self.nb_empty += 1
+        self.mark_changed(index)
+        return removed.bit_count()
+
+    def mark_changed(self, index):
+        """
+        Record that the cell at the given flat index changed, so that its units get scanned again
+
+        :param index: flat index of the cell (0-80)
+        """
+        versions = self.unit_versions
+        for unit in self.geometry.cell_units[index]:
+            versions[unit] += 1
+
+    def get_changed_rows(self, seen_versions):
+        """
+        Rows with a cell changed since they were last seen, for the views updating only
+        what changed. Every change of a cell marks its row, see mark_changed
+
+        :param seen_versions: list of the row versions seen last time (None for a row never
+            seen), updated in place
+        :return: list of the numbers of the changed rows
+        """
+        versions = self.unit_versions
+        changed = []
+        for row in self.geometry.row_units:
+            if seen_versions[row] != versions[row]:
+                seen_versions[row] = versions[row]
+                changed.append(row)
+        return changed
+
     def get_square_cells(self, number):
         """
         Get the cells of the square identified by its number.
@@ -90,11 +438,7 @@ class Sudoku:
         :param number: index of the square (0-8)
         :return: list of the cells in the square
         """
-        return [
-            self.cells[number // 3 * 3 + i][number % 3 * 3 + j]
-            for i in range(3)
-            for j in range(3)
-        ]
+        return self.get_cells(self.geometry.squares[number])
 
     def get_row_cells(self, number):
         """
@@ -114,7 +458,18 @@ class Sudoku:
         :param number: index of the column (0-8)
         :return: list of the cells in the column
         """
-        return [self.cells[i][number] for i in range(9)]
+        return self.get_cells(self.geometry.cols[number])
+
+    def get_cells(self, indices):
+        """
+        Get the cells at the given flat indices, typically one of the units of the geometry
+
+        :param indices: flat indices of the cells (0-80)
+        :return: list of the cells
+        """
+        cells = self.cells
+        size = self.geometry.size
+        return [cells[index // size][index % size] for index in indices]
 
     def get_position_from_cell(self, cell):
         """
@@ -123,29 +478,29 @@ class Sudoku:
         :param cell: cell to find
         :return: position of the cell in the sudoku
         """
-        for i, row in enumerate(self.cells):
-            for j, c in enumerate(row):
-                if c == cell:
-                    return i, j
+        return divmod(cell.index, self.geometry.size)
 
     def is_sudoku_solved(self):
-        logging.debug("Checking if sudoku is solved")
-        return all(cell.value for row in self.cells for cell in row)
+        return self.nb_unsolved == 0
 
     def is_impossible(self):
-        logging.debug("Checking if sudoku is impossible")
-        return any(
-            not cell.value and cell.nb_remaining_candidates() == 0
-            for row in self.cells
-            for cell in row
-        )
+        return self.nb_empty > 0
+
+    def to_string(self):
+        """
+        :return: the values on one line in latin reading order, with . for the blanks
+            and letters for the values after 9, see VALUE_CHARS
+        """
+        return "".join(VALUE_CHARS[value] for value in self.values)
 
     def print_sudoku(self):
-        for i, row in enumerate(self.cells):
-            if i % 3 == 0 and i != 0:
-                print("—" * 21)
-            for j, cell in enumerate(row):
-                if j % 3 == 0 and j != 0:
+        box_size, size = self.geometry.box_size, self.geometry.size
+        for i in range(size):
+            if i % box_size == 0 and i != 0:
+                print("—" * (2 * (size + box_size - 1) - 1))
+            for j in range(size):
+                if j % box_size == 0 and j != 0:
                     print("│", end=" ")
-                print(cell.value if cell.value else " ", end=" ")
-            print()
\ No newline at end of file
+                value = self.values[i * size + j]
+                print(VALUE_CHARS[value] if value else " ", end=" ")
+            print()
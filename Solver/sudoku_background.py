@@ -0,0 +1,99 @@
+import queue
+import threading
+
+from sudoku_human_solver import SudokuSolver
+from sudoku_trace import SolveTrace
+
+
+class SolveCancelled(Exception):
+    """
+    Raised in the worker thread to stop a cancelled solve before its next strategy
+    """
+
+
+class BackgroundSolve:
+    """
+    Solve of a copy of a sudoku on a worker thread. The steps of the solve are streamed back
+    in batches, one per strategy call, to be replayed on the sudoku with SolveTrace.replay
+    as they come, typically by polling from the Tk event loop
+
+    Attributes:
+    - solver: SudokuSolver of the copy, instrumented
+    - trace: SolveTrace of the solve, written by the worker thread only
+    - batches: queue of the lists of events of the solve, None once it is over
+    - cancelled: set to stop the solve before its next strategy
+    - thread: the worker thread
+    - is_finished: True once the last batch was read by get_batches
+    """
+
+    def __init__(self, sudoku, backtracking=False, count_strategies=None):
+        """
+        :param sudoku: the sudoku to solve, not changed
+        :param backtracking: finish the sudoku with a search when the human strategies are stuck
+        :param count_strategies: strategy stats to add the ones of this solve to, not changed
+        """
+        self.solver = SudokuSolver(sudoku.clone(), backtracking=backtracking)
+        if count_strategies is not None:
+            for strategy, counts in count_strategies.items():
+                self.solver.count_strategies[strategy] = counts[:]
+        self.solver.instrument().before_strategy.append(self.check_cancelled)
+        self.trace = SolveTrace()
+        self.batches = queue.Queue()
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.is_finished = False
+        self._nb_sent = 0
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        """
+        Stop the solve before its next strategy, the batches already sent stay in the queue
+        """
+        self.cancelled.set()
+
+    def check_cancelled(self, solver, strategy):
+        if self.cancelled.is_set():
+            raise SolveCancelled()
+
+    def run(self):
+        solver = self.solver
+        self.trace.attach(solver)
+        # after the hook of the trace, which records the eliminations of the strategy
+        solver.instrumentation.after_strategy.append(self.send_batch)
+        try:
+            solver.solve()
+        except SolveCancelled:
+            pass
+        finally:
+            self.trace.detach()
+            self.send_batch()
+            self.batches.put(None)
+
+    def send_batch(self, solver=None, strategy=None, found=None):
+        """
+        Send the events recorded since the last batch, called after each strategy
+        """
+        nb_events = len(self.trace)
+        if nb_events > self._nb_sent:
+            self.batches.put(list(self.trace.iter_events(self._nb_sent)))
+            self._nb_sent = nb_events
+
+    def get_batches(self):
+        """
+        Read the batches sent so far, without waiting
+
+        :return: list of the batches, each one a list of (kind, strategy, index, data) events
+        """
+        batches = []
+        while not self.is_finished:
+            try:
+                batch = self.batches.get_nowait()
+            except queue.Empty:
+                break
+            if batch is None:
+                self.is_finished = True
+            else:
+                batches.append(batch)
+        return batches
@@ -0,0 +1,263 @@
+import argparse
+import json
+import logging
+import os
+import sys
+from functools import partial
+from itertools import islice
+from multiprocessing import Pool
+
+from sudoku_human_solver import SudokuSolver
+from sudoku_parser import SudokuParser
+from sudoku_search import count_solutions
+
+STATUS_SOLVED = "solved"
+STATUS_IMPOSSIBLE = "impossible"
+STATUS_UNSOLVED = "unsolved"
+STATUS_MULTIPLE = "multiple"
+STATUS_ERROR = "error"
+STATUS_TIMEOUT = "timeout"
+
+ENGINE_PYTHON = "python"
+ENGINE_NUMPY = "numpy"
+
+
+def get_status(sudoku):
+    if sudoku.is_sudoku_solved():
+        return STATUS_SOLVED
+    elif sudoku.is_impossible():
+        return STATUS_IMPOSSIBLE
+    else:
+        return STATUS_UNSOLVED
+
+
+def check_status(sudoku, deadline=None):
+    """
+    Count the solutions of a puzzle before solving it, see sudoku_search.count_solutions
+
+    :param sudoku: the parsed sudoku
+    :param deadline: time.time() after which the count gives up, None for no deadline
+    :return: STATUS_IMPOSSIBLE without solution, STATUS_MULTIPLE with several ones,
+        STATUS_TIMEOUT if the deadline was over first, None if the solution is unique
+    """
+    nb_solutions = count_solutions(sudoku.masks, sudoku.values, deadline=deadline)
+    if nb_solutions is None:
+        return STATUS_TIMEOUT
+    elif nb_solutions == 0:
+        return STATUS_IMPOSSIBLE
+    elif nb_solutions > 1:
+        return STATUS_MULTIPLE
+    return None
+
+
+def iter_jobs(path):
+    """
+    List the puzzles to solve, lazily
+
+    :param path: directory of row,col,value CSV files, or corpus file with one puzzle per line
+    :return: generator of (name, is_file, data) jobs, data being a file path or a sudoku line
+    """
+    if os.path.isdir(path):
+        for file_name in sorted(os.listdir(path)):
+            if file_name.endswith(".csv"):
+                yield file_name, True, os.path.join(path, file_name)
+    else:
+        for line_number, puzzle, _ in SudokuParser.iter_sudoku_lines(path):
+            yield str(line_number), False, puzzle
+
+
+def load_job(job):
+    """
+    :param job: (name, is_file, data) as built by iter_jobs
+    :return: the parsed sudoku
+    """
+    _, is_file, data = job
+    if is_file:
+        return SudokuParser.parse_sudoku(data)
+    else:
+        return SudokuParser.parse_sudoku_string(data)
+
+
+def make_result(name, sudoku, count_strategies, status=None):
+    return {
+        "name": name,
+        "status": status or get_status(sudoku),
+        "values": sudoku.to_string(),
+        "strategies": count_strategies,
+    }
+
+
+def solve_job(job, backtracking=False, check=False):
+    """
+    Solve one puzzle, in a worker process
+
+    :param job: (name, is_file, data) as built by iter_jobs
+    :param backtracking: finish the puzzles the human strategies cannot solve with a search
+    :param check: count the solutions first, the puzzles without a unique one are not solved
+    :return: dictionary with the name, status, values and strategy stats of the puzzle
+    """
+    try:
+        sudoku = load_job(job)
+    except ValueError as e:
+        return {"name": job[0], "status": STATUS_ERROR, "error": str(e)}
+    status = check_status(sudoku) if check else None
+    if status is not None:
+        return make_result(job[0], sudoku, {}, status)
+    solver = SudokuSolver(sudoku, backtracking=backtracking)
+    solver.solve()
+    return make_result(job[0], sudoku, solver.count_strategies)
+
+
+def solve_jobs_numpy(jobs, backtracking=False, check=False):
+    """
+    Solve a chunk of puzzles with the vectorized singles engine, in a worker process
+
+    :param jobs: list of (name, is_file, data) as built by iter_jobs
+    :param backtracking: finish the puzzles the human strategies cannot solve with a search
+    :param check: count the solutions first, the puzzles without a unique one are not solved
+    :return: list of the results, as for solve_job
+    """
+    from sudoku_numpy import NumpySinglesSolver
+
+    results = [None] * len(jobs)
+    loaded = []
+    for k, job in enumerate(jobs):
+        try:
+            sudoku = load_job(job)
+        except ValueError as e:
+            results[k] = {"name": job[0], "status": STATUS_ERROR, "error": str(e)}
+            continue
+        status = check_status(sudoku) if check else None
+        if status is not None:
+            results[k] = make_result(job[0], sudoku, {}, status)
+        else:
+            loaded.append((k, sudoku))
+    sudokus, count_strategies = NumpySinglesSolver(sudoku for _, sudoku in loaded).solve(
+        backtracking=backtracking
+    )
+    for (k, _), sudoku, stats in zip(loaded, sudokus, count_strategies):
+        results[k] = make_result(jobs[k][0], sudoku, stats)
+    return results
+
+
+def iter_chunks(jobs, chunk_size):
+    jobs = iter(jobs)
+    while True:
+        chunk = list(islice(jobs, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def map_jobs(function, path, workers=None, chunk_size=64, ordered=True):
+    """
+    Apply a function to every puzzle of a directory or corpus file on a process pool
+
+    :param function: picklable function taking a (name, is_file, data) job, see iter_jobs
+    :param path: directory of CSV files or corpus file
+    :param workers: number of worker processes, defaults to the number of CPUs
+    :param chunk_size: number of puzzles sent to a worker at once
+    :param ordered: yield the results in the input order, otherwise as soon as they are completed
+    :return: generator of the results of the function
+    """
+    with Pool(workers) as pool:
+        imap = pool.imap if ordered else pool.imap_unordered
+        yield from imap(function, iter_jobs(path), chunk_size)
+
+
+def solve_batch(
+    path,
+    workers=None,
+    chunk_size=64,
+    ordered=True,
+    engine=ENGINE_PYTHON,
+    backtracking=False,
+    check=False,
+):
+    """
+    Solve every puzzle of a directory or corpus file on a process pool
+
+    :param path: directory of CSV files or corpus file
+    :param workers: number of worker processes, defaults to the number of CPUs
+    :param chunk_size: number of puzzles sent to a worker at once
+    :param ordered: yield the results in the input order, otherwise as soon as they are completed
+    :param engine: ENGINE_PYTHON to solve each puzzle with SudokuSolver,
+        ENGINE_NUMPY to solve each chunk with the vectorized singles first (requires NumPy)
+    :param backtracking: finish the puzzles the human strategies cannot solve with a search
+    :param check: count the solutions first, the puzzles without a unique one are not solved
+        and get the status STATUS_IMPOSSIBLE or STATUS_MULTIPLE
+    :return: generator of the results of solve_job
+    """
+    if engine == ENGINE_NUMPY:
+        with Pool(workers) as pool:
+            imap = pool.imap if ordered else pool.imap_unordered
+            solve_chunk = partial(solve_jobs_numpy, backtracking=backtracking, check=check)
+            for results in imap(solve_chunk, iter_chunks(iter_jobs(path), chunk_size)):
+                yield from results
+    else:
+        solve = partial(solve_job, backtracking=backtracking, check=check)
+        yield from map_jobs(solve, path, workers, chunk_size, ordered)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Solve every puzzle of a directory or corpus file, one JSON result per line"
+    )
+    parser.add_argument(
+        "path", help="directory of row,col,value CSV files, or file with one puzzle per line"
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int, default=None, help="number of worker processes"
+    )
+    parser.add_argument(
+        "-c", "--chunk-size", type=int, default=64, help="puzzles sent to a worker at once"
+    )
+    parser.add_argument(
+        "-u", "--unordered", action="store_true", help="output results as they are completed"
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        choices=[ENGINE_PYTHON, ENGINE_NUMPY],
+        default=ENGINE_PYTHON,
+        help="numpy applies the singles to whole chunks at once before SudokuSolver",
+    )
+    parser.add_argument(
+        "-b",
+        "--backtracking",
+        action="store_true",
+        help="finish the puzzles the human strategies cannot solve with a search",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="skip the puzzles without a unique solution, reported as impossible or multiple",
+    )
+    parser.add_argument(
+        "-o", "--output", default=None, help="output file, standard output by default"
+    )
+    args = parser.parse_args(argv)
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    counts = {}
+    try:
+        for result in solve_batch(
+            args.path,
+            args.workers,
+            args.chunk_size,
+            not args.unordered,
+            args.engine,
+            args.backtracking,
+            args.check,
+        ):
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            output.write(json.dumps(result) + "\n")
+    finally:
+        if args.output:
+            output.close()
+    logging.info("Batch done: %s", ", ".join(f"{nb} {status}" for status, nb in counts.items()))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,211 @@
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+from sudoku_human_solver import SudokuSolver
+from sudoku_parser import SudokuParser
+
+DEFAULT_THRESHOLD = 0.1
+
+
+def load_directory(directory):
+    """
+    Group the example sudoku files by tier, from their names (sudoku_<tier>_<number>.csv)
+
+    :param directory: directory of row,col,value CSV files
+    :return: dictionary tier -> list of (loader, argument) puzzles
+    """
+    tiers = defaultdict(list)
+    for file_name in sorted(os.listdir(directory)):
+        if file_name.endswith(".csv"):
+            tier = file_name[: -len(".csv")].split("_")[1]
+            tiers[tier].append((SudokuParser.parse_sudoku, os.path.join(directory, file_name)))
+    return tiers
+
+
+def load_corpus(corpus_file, limit=None):
+    """
+    :param corpus_file: file with one sudoku per line, its name without extension is the tier
+    :param limit: maximum number of puzzles to take from the file
+    :return: dictionary tier -> list of (loader, argument) puzzles
+    """
+    tier = os.path.splitext(os.path.basename(corpus_file))[0]
+    puzzles = []
+    for _, puzzle, _ in SudokuParser.iter_sudoku_lines(corpus_file):
+        if limit is not None and len(puzzles) >= limit:
+            break
+        puzzles.append((SudokuParser.parse_sudoku_string, puzzle))
+    return {tier: puzzles}
+
+
+def summarize(samples):
+    """
+    :param samples: durations in seconds
+    :return: dictionary with the count, median, 90th and 99th percentiles, min and max
+        in milliseconds, None without samples
+    """
+    samples = sorted(sample * 1000 for sample in samples)
+    if not samples:
+        return {"count": 0, "median": None, "p90": None, "p99": None, "min": None, "max": None}
+    if len(samples) > 1:
+        percentiles = statistics.quantiles(samples, n=100, method="inclusive")
+        p90, p99 = percentiles[89], percentiles[98]
+    else:
+        p90 = p99 = samples[0]
+    return {
+        "count": len(samples),
+        "median": statistics.median(samples),
+        "p90": p90,
+        "p99": p99,
+        "min": samples[0],
+        "max": samples[-1],
+    }
+
+
+def time_solve(sudoku, backtracking=False):
+    """
+    Solve the sudoku, then solve a copy of it again with the instrumentation to time each
+    strategy call: the instrumentation overhead does not count in the solve time
+
+    :return: (total solve time, dictionary strategy -> time spent in it), in seconds
+    """
+    copy = sudoku.clone()
+    solver = SudokuSolver(sudoku, backtracking=backtracking)
+    start = time.perf_counter()
+    solver.solve()
+    solve_time = time.perf_counter() - start
+
+    solver = SudokuSolver(copy, backtracking=backtracking)
+    instrumentation = solver.instrument()
+    solver.solve()
+    return solve_time, {
+        strategy: stats["time"] for strategy, stats in instrumentation.strategies.items()
+    }
+
+
+def run_benchmark(tiers, repeat=5, backtracking=False):
+    """
+    :param tiers: dictionary tier -> list of (loader, argument) puzzles
+    :param repeat: number of runs over each puzzle
+    :param backtracking: let the solver finish the puzzles with a search when it is stuck
+    :return: JSON-serializable results, with the parse, solve and strategy timings of each tier
+    """
+    results = {"unit": "ms", "repeat": repeat, "backtracking": backtracking, "tiers": {}}
+    for tier, puzzles in tiers.items():
+        parse_times, solve_times = [], []
+        strategy_times = defaultdict(list)
+        nb_solved = 0
+        for loader, argument in puzzles:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                sudoku = loader(argument)
+                parse_times.append(time.perf_counter() - start)
+                solve_time, times = time_solve(sudoku, backtracking)
+                solve_times.append(solve_time)
+                for strategy, strategy_time in times.items():
+                    strategy_times[strategy].append(strategy_time)
+            nb_solved += sudoku.is_sudoku_solved()
+        results["tiers"][tier] = {
+            "nb_puzzles": len(puzzles),
+            "nb_solved": nb_solved,
+            "parse": summarize(parse_times),
+            "solve": summarize(solve_times),
+            "strategies": {
+                strategy: summarize(times) for strategy, times in strategy_times.items()
+            },
+        }
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare the medians of two benchmark results
+
+    :param results: results of run_benchmark
+    :param baseline: results of a previous run_benchmark
+    :param threshold: relative slow down above which a median is a regression (0.1 for 10%)
+    :return: list of (tier, measure, baseline median, new median) for the regressions
+    """
+    regressions = []
+    for tier, tier_results in results["tiers"].items():
+        tier_baseline = baseline["tiers"].get(tier)
+        if tier_baseline is None:
+            continue
+        measures = [("parse", tier_results["parse"], tier_baseline["parse"])]
+        measures.append(("solve", tier_results["solve"], tier_baseline["solve"]))
+        for strategy, summary in tier_results["strategies"].items():
+            if strategy in tier_baseline["strategies"]:
+                measures.append((strategy, summary, tier_baseline["strategies"][strategy]))
+        for measure, summary, baseline_summary in measures:
+            if summary["median"] is None or baseline_summary["median"] is None:
+                continue
+            if summary["median"] > baseline_summary["median"] * (1 + threshold):
+                regressions.append(
+                    (tier, measure, baseline_summary["median"], summary["median"])
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time the parsing, the strategies and the solving of sudokus by tier"
+    )
+    parser.add_argument(
+        "-d", "--directory", default=None, help="directory of sudoku_<tier>_<n>.csv files"
+    )
+    parser.add_argument(
+        "-c",
+        "--corpus",
+        action="append",
+        default=[],
+        help="file with one sudoku per line, benchmarked as its own tier (can be repeated)",
+    )
+    parser.add_argument("-l", "--limit", type=int, default=None, help="puzzles per corpus")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="runs over each puzzle")
+    parser.add_argument(
+        "-b", "--backtracking", action="store_true", help="finish stuck puzzles with a search"
+    )
+    parser.add_argument("-o", "--output", default=None, help="JSON output file")
+    parser.add_argument("--baseline", default=None, help="JSON results to compare with")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="relative slow down of a median reported as a regression",
+    )
+    args = parser.parse_args(argv)
+
+    tiers = {}
+    if args.directory or not args.corpus:
+        tiers.update(load_directory(args.directory or "example_sudoku"))
+    for corpus_file in args.corpus:
+        tiers.update(load_corpus(corpus_file, args.limit))
+
+    results = run_benchmark(tiers, args.repeat, args.backtracking)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for tier, measure, old, new in regressions:
+            logging.warning("Regression in %s / %s: %.3f ms -> %.3f ms", tier, measure, old, new)
+        if regressions:
+            return 1
+        logging.info("No regression against %s", args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
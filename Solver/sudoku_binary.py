@@ -0,0 +1,342 @@
+import argparse
+import logging
+import mmap
+import os
+import struct
+from array import array
+
+from sudoku import NB_CELLS, SIZE, Sudoku
+from sudoku_parser import SudokuParser
+
+MAGIC = b"SDKB"
+VERSION = 1
+# magic, version, parts of the records, record size, padding up to 16 bytes
+HEADER = struct.Struct("<4sBBH8x")
+
+# 81 values of 4 bits, and 81 candidate masks of 9 bits, rounded up to whole bytes
+VALUES_SIZE = (NB_CELLS * 4 + 7) // 8
+MASKS_SIZE = (NB_CELLS * SIZE + 7) // 8
+MASK_BITS = (1 << SIZE) - 1
+
+# parts a record can hold, stored in this order
+PART_GIVENS = 1  # the puzzle, VALUES_SIZE bytes
+PART_SOLUTION = 2  # the solution, VALUES_SIZE bytes, all 0 when unknown
+PART_STATE = 4  # values and candidates of a grid being solved, VALUES_SIZE + MASKS_SIZE bytes
+PARTS = {PART_GIVENS: "givens", PART_SOLUTION: "solution", PART_STATE: "state"}
+PART_SIZES = {
+    PART_GIVENS: VALUES_SIZE,
+    PART_SOLUTION: VALUES_SIZE,
+    PART_STATE: VALUES_SIZE + MASKS_SIZE,
+}
+
+
+def pack_values(values):
+    """
+    :param values: the 81 values of a grid, 0 for an empty cell
+    :return: VALUES_SIZE bytes, 2 cells per byte, the first one in the high nibble
+    :raise ValueError: if there are not 81 values from 0 to 9, which would break the layout
+    """
+    if len(values) != NB_CELLS or not all(0 <= value <= SIZE for value in values):
+        raise ValueError(f"A record needs {NB_CELLS} values from 0 to {SIZE}")
+    return bytes.fromhex("".join(map(str, values)) + "0")
+
+
+def unpack_values(data):
+    """
+    :param data: VALUES_SIZE bytes written by pack_values
+    :return: list of the 81 values
+    """
+    return list(bytes.fromhex("0" + "0".join(data.hex()[:NB_CELLS])))
+
+
+def pack_masks(masks):
+    """
+    :param masks: the 81 candidate bitmasks of a grid, as in Sudoku.masks
+    :return: MASKS_SIZE bytes, the masks of 9 bits one after the other in little endian order
+    """
+    packed = 0
+    for mask in reversed(masks):
+        packed = packed << SIZE | mask
+    return packed.to_bytes(MASKS_SIZE, "little")
+
+
+def unpack_masks(data):
+    """
+    :param data: MASKS_SIZE bytes written by pack_masks
+    :return: list of the 81 masks
+    """
+    packed = int.from_bytes(data, "little")
+    return [packed >> shift & MASK_BITS for shift in range(0, NB_CELLS * SIZE, SIZE)]
+
+
+def pack_state(sudoku):
+    """
+    :param sudoku: 9x9 sudoku, possibly with candidates removed by the solver
+    :return: VALUES_SIZE + MASKS_SIZE bytes with its values and candidates
+    """
+    if sudoku.geometry.nb_cells != NB_CELLS:
+        raise ValueError("Only 9x9 grids have a binary form")
+    return pack_values(sudoku.values) + pack_masks(sudoku.masks)
+
+
+def unpack_state(data):
+    """
+    Rebuild a sudoku from its values and candidates, without placing the values again
+
+    :param data: bytes written by pack_state
+    :return: the Sudoku, in the same state as the packed one
+    """
+    values = unpack_values(data[:VALUES_SIZE])
+    masks = unpack_masks(data[VALUES_SIZE:])
+    nb_unsolved = values.count(0)
+    nb_empty = sum(1 for value, mask in zip(values, masks) if not value and not mask)
+    sudoku = Sudoku()
+    sudoku.restore((array(sudoku.masks.typecode, masks), bytes(values), nb_unsolved, nb_empty))
+    return sudoku
+
+
+def get_record_size(parts):
+    """
+    :param parts: sum of the PART_ constants stored in each record
+    :return: size of a record in bytes
+    """
+    if not parts or parts & ~sum(PARTS):
+        raise ValueError(f"Unknown record parts {parts}")
+    return sum(size for part, size in PART_SIZES.items() if parts & part)
+
+
+def pack_record(record, parts):
+    """
+    :param record: dictionary with the givens and the solution as lists of 81 values,
+        or puzzle strings, and the state as a Sudoku, for the parts stored
+    :param parts: sum of the PART_ constants stored in the record
+    :return: the record bytes
+    """
+    chunks = []
+    for part, name in PARTS.items():
+        if parts & part:
+            data = record.get(name)
+            if part == PART_STATE:
+                chunks.append(pack_state(data))
+            elif data is None:
+                chunks.append(bytes(VALUES_SIZE))
+            else:
+                if isinstance(data, str):
+                    data = SudokuParser.parse_values(data)
+                chunks.append(pack_values(data))
+    return b"".join(chunks)
+
+
+def write_records(path, records, parts=PART_GIVENS):
+    """
+    Write a binary corpus: a 16 bytes header, then fixed size records
+
+    :param path: file to write
+    :param records: iterable of the records, see pack_record
+    :param parts: sum of the PART_ constants stored in each record
+    :return: number of records written
+    """
+    record_size = get_record_size(parts)
+    nb_records = 0
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, parts, record_size))
+        for record in records:
+            f.write(pack_record(record, parts))
+            nb_records += 1
+    return nb_records
+
+
+class BinaryCorpus:
+    """
+    Binary corpus written by write_records, memory-mapped: a record is read at its offset
+    without parsing the ones before it, and only the pages read are loaded.
+    Use it as a context manager, or close it
+
+    Attributes:
+    - parts: sum of the PART_ constants stored in each record
+    - record_size: size of a record in bytes
+    - offsets: offset of each stored part in a record, by PART_ constant
+    - data: the mapped file
+    """
+
+    def __init__(self, path):
+        """
+        :param path: file written by write_records
+        :raise ValueError: if it is not a binary corpus, or it is truncated
+        """
+        self.data = None
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                raise ValueError(f"{path} is not a binary sudoku corpus")
+            magic, version, self.parts, self.record_size = HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a binary sudoku corpus of version {VERSION}")
+            if get_record_size(self.parts) != self.record_size:
+                raise ValueError(f"{path} has an invalid record size")
+            if (size - HEADER.size) % self.record_size:
+                raise ValueError(f"{path} is truncated")
+            self._len = (size - HEADER.size) // self.record_size
+            if self._len:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.offsets = {}
+        offset = 0
+        for part in PARTS:
+            if self.parts & part:
+                self.offsets[part] = offset
+                offset += PART_SIZES[part]
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._len
+
+    def get_part(self, index, part):
+        """
+        :param index: index of the record, negative ones count from the end
+        :param part: PART_ constant of a part stored in the records
+        :return: the bytes of the part
+        """
+        if part not in self.offsets:
+            raise KeyError(f"The records have no {PARTS.get(part, part)}")
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("Record index out of range")
+        start = HEADER.size + index * self.record_size + self.offsets[part]
+        return self.data[start : start + PART_SIZES[part]]
+
+    def get_givens(self, index):
+        """
+        :return: list of the 81 values of the puzzle of a record
+        """
+        return unpack_values(self.get_part(index, PART_GIVENS))
+
+    def get_solution(self, index):
+        """
+        :return: list of the 81 values of the solution of a record, None when unknown
+        """
+        solution = unpack_values(self.get_part(index, PART_SOLUTION))
+        return solution if any(solution) else None
+
+    def get_state(self, index):
+        """
+        :return: Sudoku in the state stored in a record
+        """
+        return unpack_state(self.get_part(index, PART_STATE))
+
+    def get_sudoku(self, index):
+        """
+        :return: Sudoku of a record: its stored state, otherwise its puzzle
+        :raise ValueError: if the givens of the puzzle conflict
+        """
+        if self.parts & PART_STATE:
+            return self.get_state(index)
+        return SudokuParser.make_sudoku(self.get_givens(index))
+
+    def __getitem__(self, index):
+        """
+        :return: dictionary with the stored parts of a record, as read by get_givens,
+            get_solution and get_state
+        """
+        record = {}
+        if self.parts & PART_GIVENS:
+            record["givens"] = self.get_givens(index)
+        if self.parts & PART_SOLUTION:
+            record["solution"] = self.get_solution(index)
+        if self.parts & PART_STATE:
+            record["state"] = self.get_state(index)
+        return record
+
+    def __iter__(self):
+        return (self[index] for index in range(self._len))
+
+    def iter_sudokus(self):
+        return (self.get_sudoku(index) for index in range(self._len))
+
+    def get_values_array(self, part=PART_GIVENS):
+        """
+        Unpack the values of all the records at once with NumPy (optional dependency)
+
+        :param part: PART_GIVENS, PART_SOLUTION or PART_STATE
+        :return: (N, 81) uint8 array of the values of the part in each record
+        """
+        import numpy as np
+
+        if part not in self.offsets:
+            raise KeyError(f"The records have no {PARTS.get(part, part)}")
+        values = np.zeros((self._len, VALUES_SIZE * 2), dtype=np.uint8)
+        if self._len:
+            records = np.frombuffer(
+                self.data, dtype=np.uint8, count=self._len * self.record_size, offset=HEADER.size
+            ).reshape(self._len, self.record_size)
+            offset = self.offsets[part]
+            packed = records[:, offset : offset + VALUES_SIZE]
+            values[:, 0::2] = packed >> 4
+            values[:, 1::2] = packed & 0xF
+            # the views of the mapped file must be gone before it can be closed
+            del records, packed
+        return values[:, :NB_CELLS]
+
+
+def iter_corpus_records(corpus_file):
+    """
+    :param corpus_file: text corpus, one puzzle per line optionally followed by its solution
+    :return: generator of the records of its puzzles, see pack_record.
+        The malformed lines are logged and skipped
+    """
+    for line_number, puzzle, solution in SudokuParser.iter_sudoku_lines(corpus_file):
+        try:
+            record = {"givens": SudokuParser.parse_values(puzzle)}
+            if solution is not None:
+                record["solution"] = SudokuParser.parse_values(solution)
+        except ValueError as e:
+            logging.warning("Line %s of %s skipped: %s", line_number, corpus_file, e)
+            continue
+        yield record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert a text corpus to the binary corpus format, or back"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    pack_parser = subparsers.add_parser("pack", help="text corpus to binary corpus")
+    pack_parser.add_argument("corpus", help="file with one puzzle per line")
+    pack_parser.add_argument("output", help="binary corpus to write")
+    pack_parser.add_argument(
+        "-s", "--solutions", action="store_true", help="keep the solutions of the corpus too"
+    )
+    unpack_parser = subparsers.add_parser("unpack", help="binary corpus to text corpus")
+    unpack_parser.add_argument("corpus", help="binary corpus")
+    unpack_parser.add_argument("output", help="text corpus to write")
+    args = parser.parse_args(argv)
+
+    if args.command == "pack":
+        parts = PART_GIVENS | (PART_SOLUTION if args.solutions else 0)
+        nb_records = write_records(args.output, iter_corpus_records(args.corpus), parts)
+    else:
+        with BinaryCorpus(args.corpus) as corpus, open(args.output, "w") as output:
+            for record in corpus:
+                values = record.get("givens") or list(record["state"].values)
+                line = "".join(str(value) if value else "." for value in values)
+                if record.get("solution"):
+                    line += " " + "".join(map(str, record["solution"]))
+                output.write(line + "\n")
+            nb_records = len(corpus)
+    logging.info("%s puzzles written to %s", nb_records, args.output)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,121 @@
+import dbm
+import json
+from array import array
+from collections import OrderedDict
+
+from sudoku_canonical import canonical_form
+from sudoku_human_solver import SudokuSolver
+from sudoku_trace import SolveTrace
+
+DEFAULT_CACHE_SIZE = 4096
+
+
+class SolveCache:
+    """
+    Results of solves, shared by the sudokus equivalent by the symmetries of the grid.
+    A result is stored in the orientation of the canonical form of the puzzle, and transformed
+    back to the orientation of each sudoku asking for it. Its strategy stats are the ones of
+    the first equivalent sudoku solved
+
+    Attributes:
+    - max_size: number of results kept in memory
+    - backtracking: finish the sudokus the human strategies cannot solve with a search
+    - entries: canonical form -> (strategy stats, SolveTrace), least recently used first
+    - forms: puzzle -> (canonical form, SymmetryTransform) of the last puzzles, so that
+      exact repeats are not canonicalized again
+    - db: dbm database of the disk tier, None to keep the results in memory only
+    - hits, misses: number of solves answered from the cache, and solved
+    """
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, path=None, backtracking=False):
+        """
+        :param max_size: number of results kept in memory
+        :param path: file of the disk tier, created if needed
+        :param backtracking: finish the sudokus the human strategies cannot solve with a search
+        """
+        self.max_size = max_size
+        self.backtracking = backtracking
+        self.entries = OrderedDict()
+        self.forms = OrderedDict()
+        self.db = dbm.open(path, "c") if path else None
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def remember(cache, key, value, max_size):
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > max_size:
+            cache.popitem(last=False)
+
+    def get_form(self, sudoku):
+        puzzle = sudoku.to_string()
+        form = self.forms.get(puzzle)
+        if form is None:
+            form = canonical_form(sudoku.values)
+        self.remember(self.forms, puzzle, form, self.max_size)
+        return form
+
+    def get_entry(self, key):
+        """
+        :param key: canonical form of a puzzle
+        :return: (strategy stats, SolveTrace) stored for it, None if it was never solved
+        """
+        entry = self.entries.get(key)
+        if entry is None and self.db is not None:
+            data = self.db.get(self.get_db_key(key))
+            if data is not None:
+                data = json.loads(data)
+                trace = SolveTrace()
+                trace.events = array("H", data["steps"])
+                entry = data["strategies"], trace
+        if entry is not None:
+            self.remember(self.entries, key, entry, self.max_size)
+        return entry
+
+    def put_entry(self, key, count_strategies, trace):
+        self.remember(self.entries, key, (count_strategies, trace), self.max_size)
+        if self.db is not None:
+            data = {"strategies": count_strategies, "steps": list(trace.events)}
+            self.db[self.get_db_key(key)] = json.dumps(data)
+
+    def get_db_key(self, key):
+        # the results with and without backtracking differ
+        return ("b" if self.backtracking else "h") + key
+
+    def solve(self, sudoku):
+        """
+        Solve the sudoku in place like SudokuSolver.solve, or replay the solve of an equivalent one.
+        The sudoku must be as parsed, without candidates removed other than by its givens
+
+        :param sudoku: the sudoku to solve
+        :return: strategy stats, as SudokuSolver.count_strategies,
+            and SolveTrace of the solve, in the orientation of the sudoku
+        """
+        key, transform = self.get_form(sudoku)
+        entry = self.get_entry(key)
+        if entry is None:
+            self.misses += 1
+            trace = SolveTrace()
+            solver = SudokuSolver(sudoku, backtracking=self.backtracking)
+            solver.solve(trace=trace)
+            canonical_trace = SolveTrace.from_events(map(transform.step_to_canonical, trace))
+            self.put_entry(key, solver.count_strategies, canonical_trace)
+            count_strategies = solver.count_strategies
+        else:
+            self.hits += 1
+            count_strategies, canonical_trace = entry
+            trace = SolveTrace.from_events(map(transform.step_from_canonical, canonical_trace))
+            SolveTrace.replay(trace, sudoku)
+        return {strategy: list(counts) for strategy, counts in count_strategies.items()}, trace
@@ -0,0 +1,240 @@
+from itertools import permutations
+
+from sudoku import NB_CELLS, SIZE
+from sudoku_trace import EVENT_ELIMINATION, EVENT_PLACEMENT
+
+BOX_SIZE = 3
+# rank of an empty cell when comparing rows, before every digit: the canonical form starts
+# with the rows that have the fewest givens, which leaves the fewest orders of new digits to try
+BLANK_RANK = 0
+
+
+class SymmetryTransform:
+    """
+    Symmetry of the sudoku grid: transposition, permutation of the bands, of the stacks,
+    of the rows inside a band and of the columns inside a stack, and relabeling of the digits
+
+    Attributes:
+    - cells: for each cell of the transformed grid, flat index of the cell it comes from
+    - labels: for each digit (0 for an empty cell), the digit it becomes
+    - positions: for each cell of the original grid, flat index of the cell it goes to
+    - digits: for each digit of the transformed grid, the original digit
+    """
+
+    __slots__ = ("cells", "labels", "positions", "digits")
+
+    def __init__(self, cells, labels):
+        self.cells = tuple(cells)
+        self.labels = tuple(labels)
+        positions = [0] * NB_CELLS
+        for index, cell in enumerate(self.cells):
+            positions[cell] = index
+        self.positions = tuple(positions)
+        digits = [0] * (SIZE + 1)
+        for digit, label in enumerate(self.labels):
+            digits[label] = digit
+        self.digits = tuple(digits)
+
+    def to_canonical(self, values):
+        """
+        :param values: the 81 values of the original grid
+        :return: list of the 81 values of the transformed grid
+        """
+        labels = self.labels
+        return [labels[values[cell]] for cell in self.cells]
+
+    def from_canonical(self, values):
+        """
+        :param values: the 81 values of the transformed grid
+        :return: list of the 81 values of the original grid
+        """
+        digits = self.digits
+        return [digits[values[index]] for index in self.positions]
+
+    @staticmethod
+    def relabel_mask(mask, labels):
+        relabeled = 0
+        while mask:
+            low_bit = mask & -mask
+            mask ^= low_bit
+            relabeled |= 1 << (labels[low_bit.bit_length()] - 1)
+        return relabeled
+
+    def step_to_canonical(self, step):
+        """
+        :param step: (kind, strategy, index, data) event of a SolveTrace of the original grid
+        :return: the same event on the transformed grid
+        """
+        return self.transform_step(step, self.positions, self.labels)
+
+    def step_from_canonical(self, step):
+        """
+        :param step: (kind, strategy, index, data) event of a SolveTrace of the transformed grid
+        :return: the same event on the original grid
+        """
+        return self.transform_step(step, self.cells, self.digits)
+
+    @staticmethod
+    def transform_step(step, cells, labels):
+        kind, strategy, index, data = step
+        if kind == EVENT_PLACEMENT:
+            return kind, strategy, cells[index], labels[data]
+        elif kind == EVENT_ELIMINATION:
+            return kind, strategy, cells[index], SymmetryTransform.relabel_mask(data, labels)
+        return kind, strategy, index, data
+
+
+def get_band_rows(rows):
+    """
+    :param rows: rows already placed in the transformed grid, in order
+    :return: the rows that can come next: any row of an unused band when a band starts,
+        otherwise the unused rows of the current band
+    """
+    if len(rows) % BOX_SIZE == 0:
+        used_bands = {row // BOX_SIZE for row in rows}
+        return [row for row in range(SIZE) if row // BOX_SIZE not in used_bands]
+    band = rows[-1] // BOX_SIZE
+    return [
+        row for row in range(band * BOX_SIZE, (band + 1) * BOX_SIZE) if row not in rows
+    ]
+
+
+def get_best_stack_orders(row_values):
+    """
+    Stack orders giving the smallest first row: the stacks with the fewest givens first
+
+    :param row_values: the 9 values of a row
+    :return: sorted numbers of givens of the stacks,
+        and list of the stack orders, each one as a tuple of 3 groups of columns
+    """
+    stacks = [
+        tuple(range(stack * BOX_SIZE, (stack + 1) * BOX_SIZE)) for stack in range(BOX_SIZE)
+    ]
+    counts = [sum(1 for col in stack if row_values[col]) for stack in stacks]
+    best_counts = sorted(counts)
+    return best_counts, [
+        tuple(stacks[stack] for stack in order)
+        for order in permutations(range(BOX_SIZE))
+        if [counts[stack] for stack in order] == best_counts
+    ]
+
+
+def relabel_row(grid, row, groups, labels):
+    """
+    Smallest orders of the columns for a row of the grid.
+    The columns are in ordered groups, the order of the columns inside a group not being decided
+    yet. In a group, the blanks go first and stay together, then the digits already labeled
+    by their label, then the new digits in every order as they get the next labels
+
+    :param grid: the 81 values of a grid
+    :param row: row of the grid to read
+    :param groups: ordered groups of columns
+    :param labels: labels of the digits seen so far, 0 for the others
+    :return: list of (ranks of the row, refined groups, labels) for the smallest ranks
+    """
+    start = row * SIZE
+    branches = [((), (), labels)]
+    for group in groups:
+        values = [grid[start + col] for col in group]
+        if len(group) == 1 and not values[0]:
+            branches = [
+                (ranks + (BLANK_RANK,), new_groups + (group,), labels)
+                for ranks, new_groups, labels in branches
+            ]
+            continue
+        blanks = tuple(col for col, value in zip(group, values) if not value)
+        blank_ranks = (BLANK_RANK,) * len(blanks)
+        blank_groups = (blanks,) if blanks else ()
+        new_branches = []
+        for ranks, new_groups, labels in branches:
+            known = sorted(
+                (labels[value], col) for col, value in zip(group, values) if labels[value]
+            )
+            unknown = [col for col, value in zip(group, values) if value and not labels[value]]
+            next_label = max(labels) + 1
+            ranks += blank_ranks + tuple(label for label, _ in known)
+            ranks += tuple(range(next_label, next_label + len(unknown)))
+            new_groups += blank_groups + tuple((col,) for _, col in known)
+            for order in permutations(unknown):
+                new_labels = labels[:]
+                for label, col in enumerate(order, next_label):
+                    new_labels[grid[start + col]] = label
+                new_branches.append(
+                    (ranks, new_groups + tuple((col,) for col in order), new_labels)
+                )
+        best = min(ranks for ranks, _, _ in new_branches)
+        branches = [branch for branch in new_branches if branch[0] == best]
+    return branches
+
+
+def canonical_form(values):
+    """
+    Smallest representative of a grid among all the grids equivalent to it by the symmetries,
+    found row by row, keeping only the partial transformations that give the smallest rows.
+    Fast on puzzles, whose sparsest rows have few givens, but slow on complete grids,
+    whose first row can be ordered in too many ways
+
+    :param values: the 81 values of the grid, 0 for an empty cell
+    :return: (the canonical grid on one line with . for the blanks,
+        SymmetryTransform from the grid to the canonical grid)
+    """
+    values = tuple(values)
+    if len(values) != NB_CELLS:
+        raise ValueError("Only 9x9 grids have a canonical form")
+    grids = (values, tuple(values[col * SIZE + row] for row in range(SIZE) for col in range(SIZE)))
+
+    # moves: (transposed, rows placed so far, next row, ordered groups of columns, labels),
+    # starting with the rows with the fewest givens
+    moves = []
+    best_counts = None
+    for transposed, grid in enumerate(grids):
+        for row in range(SIZE):
+            counts, stack_orders = get_best_stack_orders(grid[row * SIZE : (row + 1) * SIZE])
+            if best_counts is None or counts < best_counts:
+                best_counts, moves = counts, []
+            if counts == best_counts:
+                for groups in stack_orders:
+                    moves.append((transposed, (), row, groups, [0] * (SIZE + 1)))
+
+    canonical = []
+    for _ in range(SIZE):
+        best, states = None, {}
+        for transposed, rows, row, groups, labels in moves:
+            branches = relabel_row(grids[transposed], row, groups, labels)
+            for ranks, new_groups, new_labels in branches:
+                if best is None or ranks < best:
+                    best, states = ranks, {}
+                if ranks == best:
+                    rows_placed = rows + (row,)
+                    # states with the same rows left, columns and labels have the same future
+                    key = (
+                        transposed,
+                        frozenset(rows_placed),
+                        row // BOX_SIZE,
+                        new_groups,
+                        tuple(new_labels),
+                    )
+                    states.setdefault(key, (transposed, rows_placed, new_groups, new_labels))
+        canonical.append(best)
+        moves = [
+            (transposed, rows, row, groups, labels)
+            for transposed, rows, groups, labels in states.values()
+            for row in get_band_rows(rows)
+        ]
+
+    transposed, rows, groups, labels = next(iter(states.values()))
+    labels = labels[:]
+    cols = [col for group in groups for col in group]
+    next_label = max(labels) + 1
+    for digit in range(1, SIZE + 1):
+        if not labels[digit]:
+            labels[digit] = next_label
+            next_label += 1
+    if transposed:
+        cells = [col * SIZE + row for row in rows for col in cols]
+    else:
+        cells = [row * SIZE + col for row in rows for col in cols]
+    key = "".join(
+        "." if rank == BLANK_RANK else str(rank) for ranks in canonical for rank in ranks
+    )
+    return key, SymmetryTransform(cells, labels)
@@ -0,0 +1,305 @@
+import argparse
+import heapq
+import logging
+import sys
+from array import array
+from bisect import bisect_left
+from hashlib import blake2b
+from itertools import islice
+from multiprocessing import Pool
+
+from sudoku_canonical import canonical_form
+from sudoku_parser import SudokuParser
+
+DEFAULT_CHUNK_SIZE = 256
+# hashes added to an index before they are sorted into a run, scanned by each lookup till then
+ADDED_BUFFER_SIZE = 128
+
+
+def canonical_hash(values):
+    """
+    :param values: the 81 values of a puzzle, 0 for an empty cell
+    :return: 64 bits hash of the canonical form of the puzzle, the same for all the equivalent ones
+    """
+    key, _ = canonical_form(values)
+    return int.from_bytes(blake2b(key.encode("ascii"), digest_size=8).digest(), "little")
+
+
+class DedupIndex:
+    """
+    Set of canonical hashes of puzzles, in arrays of 8 bytes per hash.
+    On disk, it is the sorted array of the hashes, 8 bytes each in little endian order
+
+    Attributes:
+    - hashes: sorted array of the hashes loaded or merged
+    - runs: sorted arrays of the hashes added since, each more than twice as long as the next one
+    - buffer: array of the last added hashes, up to ADDED_BUFFER_SIZE, not sorted yet
+    """
+
+    def __init__(self):
+        self.hashes = array("Q")
+        self.runs = []
+        self.buffer = array("Q")
+
+    @staticmethod
+    def load(path):
+        """
+        :param path: index file written by save
+        :return: the index
+        """
+        index = DedupIndex()
+        with open(path, "rb") as f:
+            index.hashes.frombytes(f.read())
+        if sys.byteorder == "big":
+            index.hashes.byteswap()
+        return index
+
+    def save(self, path):
+        """
+        :param path: index file to write, with the loaded and the added hashes
+        """
+        self.merge_added()
+        hashes = self.hashes
+        if sys.byteorder == "big":
+            hashes = array("Q", hashes)
+            hashes.byteswap()
+        with open(path, "wb") as f:
+            hashes.tofile(f)
+
+    def get_hashes(self):
+        """
+        :return: sorted array of all the hashes of the index
+        """
+        return array("Q", heapq.merge(self.hashes, *self.runs, sorted(self.buffer)))
+
+    def sort_buffer(self):
+        """
+        Sort the buffer into a new run, merged with the last runs while they are not more than
+        twice as long: there are at most log2(len / ADDED_BUFFER_SIZE) runs to look a hash up in
+        """
+        run = array("Q", sorted(self.buffer))
+        self.buffer = array("Q")
+        while self.runs and len(self.runs[-1]) <= 2 * len(run):
+            run = array("Q", heapq.merge(self.runs.pop(), run))
+        self.runs.append(run)
+
+    def merge_added(self):
+        """
+        Merge the added hashes into the sorted array of the hashes
+        """
+        self.hashes = self.get_hashes()
+        self.runs = []
+        self.buffer = array("Q")
+
+    @staticmethod
+    def merge(indexes):
+        """
+        Union of indexes, typically built by several processes on parts of a corpus
+
+        :param indexes: the indexes to merge
+        :return: new index with the hashes of all of them
+        """
+        merged = DedupIndex()
+        last = None
+        for puzzle_hash in heapq.merge(*(index.get_hashes() for index in indexes)):
+            if puzzle_hash != last:
+                merged.hashes.append(puzzle_hash)
+                last = puzzle_hash
+        return merged
+
+    def __len__(self):
+        return len(self.hashes) + sum(map(len, self.runs)) + len(self.buffer)
+
+    def __contains__(self, puzzle_hash):
+        if puzzle_hash in self.buffer:
+            return True
+        for hashes in (self.hashes, *self.runs):
+            position = bisect_left(hashes, puzzle_hash)
+            if position < len(hashes) and hashes[position] == puzzle_hash:
+                return True
+        return False
+
+    def add(self, puzzle_hash):
+        """
+        :param puzzle_hash: canonical hash of a puzzle
+        :return: True if the hash was not in the index yet
+        """
+        if puzzle_hash in self:
+            return False
+        self.buffer.append(puzzle_hash)
+        if len(self.buffer) >= ADDED_BUFFER_SIZE:
+            self.sort_buffer()
+        return True
+
+
+def hash_lines(lines):
+    """
+    Compute the canonical hashes of a chunk of corpus lines, in a worker process
+
+    :param lines: list of (line number, puzzle, solution, to_hash)
+    :return: list of (line number, puzzle, solution, canonical hash), the hash being None
+        for the lines not to hash and for the invalid puzzles
+    """
+    results = []
+    for line_number, puzzle, solution, to_hash in lines:
+        puzzle_hash = None
+        if to_hash:
+            try:
+                puzzle_hash = canonical_hash(SudokuParser.parse_values(puzzle))
+            except ValueError:
+                pass
+        results.append((line_number, puzzle, solution, puzzle_hash))
+    return results
+
+
+def iter_deduplicated(
+    corpus_file, index=None, workers=1, chunk_size=DEFAULT_CHUNK_SIZE, skip_exact_repeats=False
+):
+    """
+    Scan a corpus in one streaming pass, telling for each puzzle if it is equivalent
+    to an earlier one or to one of the index
+
+    :param corpus_file: file with one puzzle per line, as read by SudokuParser.iter_sudoku_lines
+    :param index: DedupIndex of the puzzles already seen, completed with the new ones.
+        A new empty index by default
+    :param workers: number of worker processes computing the canonical forms,
+        1 to compute them in this process, None for the number of CPUs
+    :param chunk_size: number of lines sent to a worker at once
+    :param skip_exact_repeats: keep the hash of every distinct puzzle line in memory, so that
+        its exact repeats are not canonicalized again. Faster on corpora with many repeats,
+        but the memory grows with the number of distinct puzzles, unlike the index
+    :return: generator of (line number, puzzle, solution, canonical hash, is_new),
+        the hash being None for an invalid puzzle
+    """
+    if index is None:
+        index = DedupIndex()
+    # puzzle -> its canonical hash, None until its line is checked
+    exact_hashes = {} if skip_exact_repeats else None
+
+    def iter_chunks():
+        lines = SudokuParser.iter_sudoku_lines(corpus_file)
+        while True:
+            chunk = []
+            for line_number, puzzle, solution in islice(lines, chunk_size):
+                puzzle = puzzle.replace("0", ".")
+                to_hash = exact_hashes is None or puzzle not in exact_hashes
+                if to_hash and exact_hashes is not None:
+                    exact_hashes[puzzle] = None
+                chunk.append((line_number, puzzle, solution, to_hash))
+            if not chunk:
+                return
+            yield chunk
+
+    if workers == 1:
+        pool = None
+        results = map(hash_lines, iter_chunks())
+    else:
+        pool = Pool(workers)
+        results = pool.imap(hash_lines, iter_chunks())
+    try:
+        for chunk in results:
+            for line_number, puzzle, solution, puzzle_hash in chunk:
+                if exact_hashes is not None:
+                    if puzzle_hash is None:
+                        puzzle_hash = exact_hashes.get(puzzle)
+                    else:
+                        exact_hashes[puzzle] = puzzle_hash
+                is_new = puzzle_hash is not None and index.add(puzzle_hash)
+                yield line_number, puzzle, solution, puzzle_hash, is_new
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def scan(args):
+    index = DedupIndex.merge([DedupIndex.load(path) for path in args.known])
+    output = open(args.output, "w") if args.output else None
+    duplicates = open(args.duplicates, "w") if args.duplicates else None
+    counts = {"new": 0, "duplicate": 0, "invalid": 0}
+    try:
+        for line_number, puzzle, solution, puzzle_hash, is_new in iter_deduplicated(
+            args.corpus, index, args.workers, args.chunk_size, args.skip_exact_repeats
+        ):
+            if puzzle_hash is None:
+                counts["invalid"] += 1
+            elif is_new:
+                counts["new"] += 1
+                if output:
+                    output.write(puzzle + (" " + solution if solution else "") + "\n")
+            else:
+                counts["duplicate"] += 1
+                if duplicates:
+                    duplicates.write(f"{line_number} {puzzle}\n")
+    finally:
+        for f in (output, duplicates):
+            if f:
+                f.close()
+    if args.index:
+        index.save(args.index)
+    logging.info(
+        "Scan done: %s, %s puzzles in the index",
+        ", ".join(f"{nb} {kind}" for kind, nb in counts.items()),
+        len(index),
+    )
+
+
+def merge(args):
+    index = DedupIndex.merge([DedupIndex.load(path) for path in args.indexes])
+    index.save(args.index)
+    logging.info("Merged %s indexes: %s puzzles", len(args.indexes), len(index))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Find the puzzles of a corpus equivalent to earlier ones by the symmetries"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scan_parser = commands.add_parser("scan", help="scan a corpus in one pass")
+    scan_parser.add_argument("corpus", help="file with one puzzle per line")
+    scan_parser.add_argument(
+        "-k",
+        "--known",
+        action="append",
+        default=[],
+        help="index of puzzles already seen, their equivalents are duplicates (can be repeated)",
+    )
+    scan_parser.add_argument(
+        "-i", "--index", default=None, help="index file to write, with the known and new puzzles"
+    )
+    scan_parser.add_argument(
+        "-o", "--output", default=None, help="file to write the new puzzles to, in corpus format"
+    )
+    scan_parser.add_argument(
+        "-d", "--duplicates", default=None, help="file to write the duplicate lines to"
+    )
+    scan_parser.add_argument(
+        "-w", "--workers", type=int, default=None, help="number of worker processes"
+    )
+    scan_parser.add_argument(
+        "-c",
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help="lines sent to a worker at once",
+    )
+    scan_parser.add_argument(
+        "-x",
+        "--skip-exact-repeats",
+        action="store_true",
+        help="remember every distinct line to not canonicalize its repeats again (more memory)",
+    )
+    scan_parser.set_defaults(run=scan)
+
+    merge_parser = commands.add_parser("merge", help="merge indexes built separately")
+    merge_parser.add_argument("indexes", nargs="+", help="index files to merge")
+    merge_parser.add_argument("-i", "--index", required=True, help="merged index file to write")
+    merge_parser.set_defaults(run=merge)
+
+    args = parser.parse_args(argv)
+    args.run(args)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
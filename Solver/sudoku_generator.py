@@ -0,0 +1,273 @@
+import argparse
+import logging
+import random
+import sys
+from functools import partial
+from itertools import count, islice
+from multiprocessing import Pool
+
+from sudoku import ALL_CANDIDATES, NB_CELLS, SIZE, SQUARES
+from sudoku_canonical import BOX_SIZE, SymmetryTransform
+from sudoku_grading import TIERS, grade
+from sudoku_parser import SudokuParser
+from sudoku_search import assign, iter_solutions
+
+SYMMETRY_NONE = "none"
+SYMMETRY_ROTATIONAL = "rotational"  # half turn around the center
+SYMMETRY_DIAGONAL = "diagonal"  # mirror on the main diagonal
+SYMMETRIES = (SYMMETRY_NONE, SYMMETRY_ROTATIONAL, SYMMETRY_DIAGONAL)
+DEFAULT_MAX_ATTEMPTS = 50
+
+
+def get_clue_groups(symmetry):
+    """
+    :param symmetry: one of SYMMETRIES
+    :return: tuple of the groups of cells whose clues are kept or removed together
+    """
+    groups = set()
+    for index in range(NB_CELLS):
+        row, col = divmod(index, SIZE)
+        if symmetry == SYMMETRY_ROTATIONAL:
+            groups.add(tuple(sorted({index, NB_CELLS - 1 - index})))
+        elif symmetry == SYMMETRY_DIAGONAL:
+            groups.add(tuple(sorted({index, col * SIZE + row})))
+        else:
+            groups.add((index,))
+    return tuple(sorted(groups))
+
+
+def random_transform(rng):
+    """
+    :param rng: random.Random to draw from
+    :return: SymmetryTransform drawn uniformly, see sudoku_canonical
+    """
+    bands = rng.sample(range(BOX_SIZE), BOX_SIZE)
+    stacks = rng.sample(range(BOX_SIZE), BOX_SIZE)
+    rows = [
+        band * BOX_SIZE + row for band in bands for row in rng.sample(range(BOX_SIZE), BOX_SIZE)
+    ]
+    cols = [
+        stack * BOX_SIZE + col for stack in stacks for col in rng.sample(range(BOX_SIZE), BOX_SIZE)
+    ]
+    if rng.random() < 0.5:
+        cells = [col * SIZE + row for row in rows for col in cols]
+    else:
+        cells = [row * SIZE + col for row in rows for col in cols]
+    return SymmetryTransform(cells, [0] + rng.sample(range(1, SIZE + 1), SIZE))
+
+
+def random_solution(rng):
+    """
+    Random complete grid. The squares of the diagonal share no unit, so they are filled freely,
+    the search completes them, and a random symmetry spreads the result over all the grids
+
+    :param rng: random.Random to draw from
+    :return: list of the 81 values
+    """
+    masks, values = [ALL_CANDIDATES] * NB_CELLS, [0] * NB_CELLS
+    for square in (0, 4, 8):
+        for index, value in zip(SQUARES[square], rng.sample(range(1, SIZE + 1), SIZE)):
+            assign(masks, values, index, value)
+    solution = next(iter_solutions(masks, values))
+    return random_transform(rng).to_canonical(solution)
+
+
+def has_other_solution(givens, solution, indices):
+    """
+    Check if a puzzle with a unique solution keeps it once some clues are removed.
+    Another solution would differ from the known one in a removed cell, so it is enough to
+    search for a solution without the known value, in each removed cell in turn
+
+    :param givens: the 81 values of the puzzle with the clues removed, 0 for an empty cell
+    :param solution: the 81 values of the known solution
+    :param indices: flat indices of the removed clues
+    :return: True if the puzzle has another solution than the known one
+    """
+    masks, values = [ALL_CANDIDATES] * NB_CELLS, [0] * NB_CELLS
+    for index, value in enumerate(givens):
+        if value:
+            assign(masks, values, index, value)
+    for index in indices:
+        new_masks = masks[:]
+        new_masks[index] &= ~(1 << (solution[index] - 1))
+        if new_masks[index] and next(iter_solutions(new_masks, values), None) is not None:
+            return True
+    return False
+
+
+def dig(solution, groups, rng):
+    """
+    Remove clues from a complete grid in a random order, as long as the solution stays unique
+
+    :param solution: the 81 values of the complete grid
+    :param groups: groups of cells removed together, see get_clue_groups
+    :param rng: random.Random to draw from
+    :return: the 81 values of the minimal puzzle, and list of the removed groups in order
+    """
+    givens = list(solution)
+    removed = []
+    for group in rng.sample(groups, len(groups)):
+        for index in group:
+            givens[index] = 0
+        if has_other_solution(givens, solution, group):
+            for index in group:
+                givens[index] = solution[index]
+        else:
+            removed.append(group)
+    return givens, removed
+
+
+def grade_values(values, tier):
+    """
+    :param values: the 81 values of a puzzle
+    :param tier: index in TIERS of the target tier, the grading stops above it
+    :return: result of sudoku_grading.grade
+    """
+    return grade(SudokuParser.make_sudoku(values), min(tier + 1, len(TIERS) - 1))
+
+
+def generate_puzzle(
+    tier=None, symmetry=SYMMETRY_NONE, rng=None, max_attempts=DEFAULT_MAX_ATTEMPTS
+):
+    """
+    Generate a puzzle with a unique solution, in the tier of the hardest technique it needs.
+    Each attempt digs a minimal puzzle out of a random grid. When it is too hard,
+    the last removed clues are given back, found by bisection, until it is in the tier.
+    The master puzzles are rare, about one minimal puzzle in a thousand
+
+    :param tier: name in TIERS of the difficulty to reach, None for any
+    :param symmetry: one of SYMMETRIES, pattern of the clues
+    :param rng: random.Random to draw from, a new one by default
+    :param max_attempts: number of grids to try before giving up
+    :return: dictionary with the puzzle and the solution on one line, the tier, the score
+        and the number of attempts, or None if no puzzle of the tier was found
+    """
+    rng = rng or random.Random()
+    groups = get_clue_groups(symmetry)
+    target = len(TIERS) - 1 if tier is None else TIERS.index(tier)
+    for attempt in range(1, max_attempts + 1):
+        solution = random_solution(rng)
+        givens, removed = dig(solution, groups, rng)
+        result = grade_values(givens, target)
+        if tier is not None and TIERS.index(result["tier"]) > target:
+            # smallest number of the last removed groups to give back to be easy enough
+            low, high, best = 1, len(removed), None
+            while low <= high:
+                middle = (low + high) // 2
+                values = list(givens)
+                for group in removed[-middle:]:
+                    for index in group:
+                        values[index] = solution[index]
+                middle_result = grade_values(values, target)
+                if TIERS.index(middle_result["tier"]) > target:
+                    low = middle + 1
+                else:
+                    high = middle - 1
+                    best = values, middle_result
+            if best is None:
+                continue
+            givens, result = best
+        if tier is not None and result["tier"] != tier:
+            continue
+        return {
+            "puzzle": "".join(str(value) if value else "." for value in givens),
+            "solution": "".join(str(value) for value in solution),
+            "tier": result["tier"],
+            "score": result["score"],
+            "attempts": attempt,
+        }
+    return None
+
+
+def generate_job(seed, tier=None, symmetry=SYMMETRY_NONE, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Generate one puzzle, in a worker process
+
+    :param seed: seed of the random generator, the same seed gives the same puzzle
+    :return: result of generate_puzzle
+    """
+    return generate_puzzle(tier, symmetry, random.Random(seed), max_attempts)
+
+
+def generate_batch(
+    nb_puzzles,
+    tier=None,
+    symmetry=SYMMETRY_NONE,
+    workers=None,
+    seed=None,
+    max_attempts=DEFAULT_MAX_ATTEMPTS,
+):
+    """
+    Generate puzzles on a process pool, in the order of their seeds: with the same seed,
+    the batch is the same for any number of workers
+
+    :param nb_puzzles: number of puzzles to generate
+    :param tier: name in TIERS of the difficulty to reach, None for any
+    :param symmetry: one of SYMMETRIES
+    :param workers: number of worker processes, 1 to generate in this process,
+        None for the number of CPUs
+    :param seed: seed of the whole batch, random by default
+    :param max_attempts: number of grids a worker tries for a puzzle before drawing a new seed
+    :return: generator of the results of generate_puzzle
+    """
+    seeds = count(random.randrange(1 << 32) if seed is None else seed)
+    job = partial(generate_job, tier=tier, symmetry=symmetry, max_attempts=max_attempts)
+    pool = None if workers == 1 else Pool(workers)
+    try:
+        nb_left = nb_puzzles
+        while nb_left > 0:
+            # the pool reads its inputs at once: the seeds are sent one round at a time
+            round_seeds = list(islice(seeds, nb_left))
+            if pool is None:
+                results = map(job, round_seeds)
+            else:
+                results = pool.imap(job, round_seeds)
+            for result in results:
+                if result is not None and nb_left > 0:
+                    nb_left -= 1
+                    yield result
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate puzzles with a unique solution, one 'puzzle solution' line per puzzle"
+    )
+    parser.add_argument("-n", "--number", type=int, default=10, help="number of puzzles")
+    parser.add_argument(
+        "-t", "--tier", choices=TIERS, default=None, help="difficulty of the puzzles"
+    )
+    parser.add_argument(
+        "-s", "--symmetry", choices=SYMMETRIES, default=SYMMETRY_NONE, help="pattern of the clues"
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int, default=None, help="number of worker processes"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=None, help="seed, to generate the same puzzles again"
+    )
+    parser.add_argument(
+        "-o", "--output", default=None, help="output file, standard output by default"
+    )
+    args = parser.parse_args(argv)
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    counts = {}
+    try:
+        for result in generate_batch(
+            args.number, args.tier, args.symmetry, args.workers, args.seed
+        ):
+            counts[result["tier"]] = counts.get(result["tier"], 0) + 1
+            output.write(f"{result['puzzle']} {result['solution']}\n")
+    finally:
+        if args.output:
+            output.close()
+    summary = [f"{counts[tier]} {tier}" for tier in TIERS if tier in counts]
+    logging.info("Generation done: %s", ", ".join(summary))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,209 @@
+import argparse
+import logging
+import sys
+from functools import partial
+
+from sudoku_batch import STATUS_ERROR, STATUS_IMPOSSIBLE, get_status, load_job, map_jobs
+from sudoku_human_solver import (
+    STRATEGY_1,
+    STRATEGY_2,
+    STRATEGY_3,
+    STRATEGY_4,
+    STRATEGY_5,
+    STRATEGY_6,
+    STRATEGY_7,
+    STRATEGY_8,
+    SudokuSolver,
+)
+
+TIERS = ("easy", "medium", "hard", "expert", "master", "extreme")
+# tier of a sudoku needing each strategy, the solver tries them from the easiest tier
+STRATEGY_TIERS = {
+    STRATEGY_1: 0,
+    STRATEGY_2: 1,
+    STRATEGY_3: 1,
+    STRATEGY_4: 1,
+    STRATEGY_7: 2,
+    STRATEGY_6: 3,
+    STRATEGY_5: 4,
+    STRATEGY_8: 5,
+}
+
+
+def get_tier(count_strategies, is_solved=True):
+    """
+    :param count_strategies: strategy stats of a solve, as SudokuSolver.count_strategies
+    :param is_solved: False if the strategies could not solve the sudoku, which makes it extreme
+    :return: index in TIERS of the tier of the hardest strategy that found something
+    """
+    if not is_solved:
+        return len(TIERS) - 1
+    return max(
+        (STRATEGY_TIERS[strategy] for strategy, counts in count_strategies.items() if counts[1]),
+        default=0,
+    )
+
+
+def get_score(count_strategies, tier=None):
+    """
+    :param count_strategies: strategy stats of a solve, as SudokuSolver.count_strategies
+    :param tier: index in TIERS of the tier of the sudoku, from get_tier by default
+    :return: number of calls of the strategies of its tier, to order the sudokus of a tier
+    """
+    if tier is None:
+        tier = get_tier(count_strategies)
+    return sum(
+        counts[0]
+        for strategy, counts in count_strategies.items()
+        if STRATEGY_TIERS[strategy] == tier
+    )
+
+
+class GradingSolver(SudokuSolver):
+    """
+    SudokuSolver stopping as soon as the tier of the sudoku is decided.
+    The tier only grows during a solve, so it is decided once a strategy of stop_tier found
+    something. With the top tier as stop_tier, there is no tier above it to rule out,
+    so the sudokus are solved to the end
+
+    Attributes:
+    - stop_tier: index in TIERS of the tier from which solving further is useless
+    """
+
+    def __init__(self, sudoku, stop_tier=len(TIERS) - 1, **kwargs):
+        super().__init__(sudoku, **kwargs)
+        self.stop_tier = stop_tier
+
+    def is_tier_decided(self):
+        if self.stop_tier == len(TIERS) - 1:
+            return False
+        return get_tier(self.count_strategies) >= self.stop_tier
+
+    def stop(self):
+        return super().stop() or self.is_tier_decided()
+
+
+def grade(sudoku, stop_tier=len(TIERS) - 1, backtracking=False):
+    """
+    Solve a sudoku until its tier is decided
+
+    :param sudoku: the sudoku to grade, solved in place
+    :param stop_tier: index in TIERS of a tier, the sudokus at least that hard are not solved further
+    :param backtracking: finish the sudokus the human strategies cannot solve with a search,
+        otherwise they are extreme
+    :return: dictionary with the status, the tier of the sudoku and its score in the tier (see
+        get_score), and complete: False if the grading stopped early, the score being then
+        a lower bound
+    """
+    solver = GradingSolver(sudoku, stop_tier, backtracking=backtracking)
+    solver.solve()
+    status = get_status(sudoku)
+    is_finished = sudoku.is_sudoku_solved() or sudoku.is_impossible()
+    complete = is_finished or not solver.is_tier_decided()
+    result = {"status": status, "complete": complete}
+    if status == STATUS_IMPOSSIBLE:
+        result["tier"] = None
+        result["score"] = get_score(solver.count_strategies)
+    else:
+        tier = get_tier(solver.count_strategies, sudoku.is_sudoku_solved() or not complete)
+        result["tier"] = TIERS[tier]
+        result["score"] = get_score(solver.count_strategies, tier)
+    return result
+
+
+def grade_job(job, stop_tier=len(TIERS) - 1, backtracking=False):
+    """
+    Grade one puzzle, in a worker process
+
+    :param job: (name, is_file, data) as built by sudoku_batch.iter_jobs
+    :return: dictionary with the name and the grade of the puzzle, see grade
+    """
+    try:
+        sudoku = load_job(job)
+    except ValueError as e:
+        return {"name": job[0], "status": STATUS_ERROR, "error": str(e)}
+    result = {"name": job[0]}
+    result.update(grade(sudoku, stop_tier, backtracking))
+    return result
+
+
+def grade_batch(
+    path, workers=None, chunk_size=64, ordered=True, stop_tier=len(TIERS) - 1, backtracking=False
+):
+    """
+    Grade every puzzle of a directory or corpus file on a process pool
+
+    :param path: directory of CSV files or corpus file
+    :param stop_tier: index in TIERS of a tier, the sudokus at least that hard are not solved further
+    :param backtracking: finish the sudokus the human strategies cannot solve with a search
+    :return: generator of the results of grade_job
+    """
+    grade_puzzle = partial(grade_job, stop_tier=stop_tier, backtracking=backtracking)
+    yield from map_jobs(grade_puzzle, path, workers, chunk_size, ordered)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Grade every puzzle of a directory or corpus file, one CSV line per puzzle."
+        " The tiers of the puzzles not solved to the end are followed by +"
+    )
+    parser.add_argument(
+        "path", help="directory of row,col,value CSV files, or file with one puzzle per line"
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int, default=None, help="number of worker processes"
+    )
+    parser.add_argument(
+        "-c", "--chunk-size", type=int, default=64, help="puzzles sent to a worker at once"
+    )
+    parser.add_argument(
+        "-u", "--unordered", action="store_true", help="output results as they are completed"
+    )
+    parser.add_argument(
+        "-s",
+        "--stop-tier",
+        choices=TIERS,
+        default=TIERS[-1],
+        help="stop solving the puzzles as soon as they reach this tier",
+    )
+    parser.add_argument(
+        "-b",
+        "--backtracking",
+        action="store_true",
+        help="finish the puzzles the human strategies cannot solve with a search",
+    )
+    parser.add_argument(
+        "-o", "--output", default=None, help="output file, standard output by default"
+    )
+    args = parser.parse_args(argv)
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    counts = {}
+    try:
+        output.write("name,tier,score,status\n")
+        for result in grade_batch(
+            args.path,
+            args.workers,
+            args.chunk_size,
+            not args.unordered,
+            TIERS.index(args.stop_tier),
+            args.backtracking,
+        ):
+            tier = result.get("tier") or result["status"]
+            if result.get("complete") is False:
+                # at least this tier
+                tier += "+"
+            counts[tier] = counts.get(tier, 0) + 1
+            score = result.get("score", "")
+            output.write(f"{result['name']},{tier},{score},{result['status']}\n")
+    finally:
+        if args.output:
+            output.close()
+    summary = [f"{counts.pop(tier)} {tier}" for tier in TIERS if tier in counts]
+    summary += [f"{nb} {status}" for status, nb in counts.items()]
+    logging.info("Grading done: %s", ", ".join(summary))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
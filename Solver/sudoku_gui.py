@@ -1,22 +1,37 @@
+from collections import deque
 from tkinter import (
     Button,
     Canvas,
     Checkbutton,
     Frame,
     BOTH,
+    HORIZONTAL,
     IntVar,
     LEFT,
+    OptionMenu,
+    Scale,
     Text,
     filedialog,
 )
 
-from sudoku import Sudoku
+from sudoku import MAX_BOX_SIZE, MIN_BOX_SIZE, VALUE_CHARS, Sudoku
+from sudoku_background import BackgroundSolve
 from sudoku_human_solver import SudokuSolver
-from sudoku_parser import SudokuParser
+from sudoku_parser import CHAR_VALUES, SudokuParser
+from sudoku_search import count_solutions
+from sudoku_trace import EVENT_ELIMINATION, EVENT_PLACEMENT, EVENT_STRATEGY_START, SolveTrace
 
-CELL_SIZE = 50
-GRID_SIZE = 9
-CANVAS_SIZE = CELL_SIZE * GRID_SIZE + 2 * CELL_SIZE
+# side of the grid in pixels, the cells shrink with the size of the grid down to MIN_CELL_SIZE
+GRID_PIXELS = 450
+MIN_CELL_SIZE = 24
+BOX_SIZES = tuple(range(MIN_BOX_SIZE, MAX_BOX_SIZE + 1))
+# fill of the cell backgrounds: not highlighted, peer of the selected cell, selected cell
+HIGHLIGHT_COLORS = ("", "#E0F7FA", "#B2EBF2")
+# milliseconds between two reads of the steps of a background solve
+POLL_INTERVAL = 50
+MAX_STEP_RATE = 200
+# search nodes of the solution count, a fraction of a second on a 25x25 grid
+CHECK_MAX_NODES = 1000
 
 
 class SudokuUI(Frame):
@@ -30,19 +45,47 @@ class SudokuUI(Frame):
         self.canvas = None
         self.stats_text = None
         self.show_candidates = IntVar(value=1)
+        self.use_backtracking = IntVar(value=0)
+        # box size of the grids made by Clear and Import
+        self.box_size = IntVar(value=sudoku.geometry.box_size)
+        # placements and eliminations shown per second during a solve, 0 to show them at once
+        self.step_rate = IntVar(value=0)
+        # solve running on a worker thread, its steps not shown yet, and the progress shown
+        self.background_solve = None
+        self.pending_events = deque()
+        self.step_credit = 0.0
+        self.solve_snapshot = None
+        self.solve_progress = None
+        # snapshots of the sudoku before the last changes, and before the undone ones
+        self.undo_stack = []
+        self.redo_stack = []
+        # geometry of the grid on the canvas, and side of its cells in pixels
+        self.geometry = None
+        self.cell_size = None
+        # persistent canvas items of each cell, and what they show
+        self.background_items = []
+        self.value_items = []
+        self.candidate_items = []
+        self.drawn_cells = []
+        self.drawn_highlights = []
+        # row versions of the drawn sudoku, see Sudoku.get_changed_rows
+        self.drawn_sudoku = None
+        self.drawn_versions = []
+        self.drawn_show_candidates = None
         self.init_ui()
 
     def init_ui(self):
         self.parent.title("Sudoku")
         self.parent.configure(bg="white")
         self.pack(fill=BOTH, expand=1)
-        self.canvas = Canvas(self, width=CANVAS_SIZE, height=CANVAS_SIZE)
+        self.canvas = Canvas(self)
         self.canvas.pack(side=LEFT, fill=BOTH, expand=1)
         self.canvas.bind("<Button-1>", self.cell_clicked)
         self.canvas.bind("<Key>", self.key_pressed)
+        self.canvas.bind("<Control-z>", self.undo)
+        self.canvas.bind("<Control-y>", self.redo)
         self.canvas.configure(bg="white")
         self.canvas.focus_set()
-        self.draw_grid()
         self.draw_sudoku()
 
         button_frame = Frame(self)
@@ -62,6 +105,20 @@ class SudokuUI(Frame):
         )
         solve_button.pack(side=LEFT, padx=5)
 
+        cancel_button = Button(
+            button_frame,
+            text="Cancel",
+            command=self.cancel_solve,
+            font=("Arial", 14, "bold"),
+            bg="#795548",
+            fg="white",
+            relief="raised",
+            borderwidth=3,
+            padx=10,
+            pady=5,
+        )
+        cancel_button.pack(side=LEFT, padx=5)
+
         import_button = Button(
             button_frame,
             text="Import",
@@ -93,6 +150,48 @@ class SudokuUI(Frame):
         )
         remove_candidates_button.pack(side=LEFT, padx=5)
 
+        undo_button = Button(
+            button_frame2,
+            text="Undo",
+            command=self.undo,
+            font=("Arial", 14, "bold"),
+            bg="#9E9E9E",
+            fg="white",
+            relief="raised",
+            borderwidth=3,
+            padx=10,
+            pady=5,
+        )
+        undo_button.pack(side=LEFT, padx=5)
+
+        redo_button = Button(
+            button_frame2,
+            text="Redo",
+            command=self.redo,
+            font=("Arial", 14, "bold"),
+            bg="#9E9E9E",
+            fg="white",
+            relief="raised",
+            borderwidth=3,
+            padx=10,
+            pady=5,
+        )
+        redo_button.pack(side=LEFT, padx=5)
+
+        check_button = Button(
+            button_frame2,
+            text="Check",
+            command=self.check_sudoku,
+            font=("Arial", 14, "bold"),
+            bg="#673AB7",
+            fg="white",
+            relief="raised",
+            borderwidth=3,
+            padx=10,
+            pady=5,
+        )
+        check_button.pack(side=LEFT, padx=5)
+
         clear_button = Button(
             button_frame,
             text="Clear",
@@ -124,118 +223,193 @@ class SudokuUI(Frame):
         )
         candidates_checkbox.pack(side=LEFT, padx=5)
 
+        backtracking_checkbox = Checkbutton(
+            checkbox_frame,
+            text="Backtracking",
+            variable=self.use_backtracking,
+            font=("Arial", 14, "bold"),
+            bg="white",
+        )
+        backtracking_checkbox.pack(side=LEFT, padx=5)
+
+        step_rate_scale = Scale(
+            checkbox_frame,
+            label="Steps per second (0: all)",
+            variable=self.step_rate,
+            from_=0,
+            to=MAX_STEP_RATE,
+            orient=HORIZONTAL,
+            length=200,
+            bg="white",
+        )
+        step_rate_scale.pack(side=LEFT, padx=5)
+
+        box_size_menu = OptionMenu(
+            checkbox_frame, self.box_size, *BOX_SIZES, command=self.change_box_size
+        )
+        box_size_menu.configure(font=("Arial", 14, "bold"), bg="white")
+        box_size_menu.pack(side=LEFT, padx=5)
+
+    def build_canvas(self):
+        """
+        Recreate the grid and the cell items for the geometry of the sudoku, the cells are
+        sized for the grid to keep about the same side whatever its size
+        """
+        geometry = self.sudoku.geometry
+        self.geometry = geometry
+        self.cell_size = max(MIN_CELL_SIZE, GRID_PIXELS // geometry.size)
+        canvas_size = self.cell_size * (geometry.size + 2)
+        self.canvas.delete("all")
+        self.canvas.configure(width=canvas_size, height=canvas_size)
+        self.selected_cell = None
+        self.background_items = []
+        self.value_items = []
+        self.candidate_items = []
+        self.drawn_cells = [None] * geometry.nb_cells
+        self.drawn_highlights = [0] * geometry.nb_cells
+        self.drawn_sudoku = None
+        self.create_cell_items()
+        self.draw_grid()
+
     def draw_grid(self):
-        for i in range(GRID_SIZE + 1):
-            color = "black" if i % 3 == 0 else "gray"
+        cell_size, size = self.cell_size, self.geometry.size
+        end = cell_size * (size + 1)
+        for i in range(size + 1):
+            color = "black" if i % self.geometry.box_size == 0 else "gray"
             self.canvas.create_line(
-                CELL_SIZE,
-                CELL_SIZE + i * CELL_SIZE,
-                CANVAS_SIZE - CELL_SIZE,
-                CELL_SIZE + i * CELL_SIZE,
+                cell_size,
+                cell_size + i * cell_size,
+                end,
+                cell_size + i * cell_size,
                 fill=color,
             )
             self.canvas.create_line(
-                CELL_SIZE + i * CELL_SIZE,
-                CELL_SIZE,
-                CELL_SIZE + i * CELL_SIZE,
-                CANVAS_SIZE - CELL_SIZE,
+                cell_size + i * cell_size,
+                cell_size,
+                cell_size + i * cell_size,
+                end,
                 fill=color,
             )
 
-    def draw_sudoku(self):
-        self.canvas.delete("numbers")
-        for row in range(GRID_SIZE):
-            for col in range(GRID_SIZE):
-                cell = self.sudoku.cells[row][col]
-                if cell.value:
+    def create_cell_items(self):
+        """
+        Create the items of every cell once: a background for the highlight, the value,
+        and a box of candidate slots, 3x3 on a 9x9 grid. Drawing then only changes their text
+        or color
+        """
+        cell_size, size, box_size = self.cell_size, self.geometry.size, self.geometry.box_size
+        slot_size = cell_size / box_size
+        value_font = ("Arial", cell_size * 2 // 5)
+        candidate_font = ("Arial", max(1, round(slot_size * 3 / 5)))
+        for index in range(self.geometry.nb_cells):
+            row, col = divmod(index, size)
+            self.background_items.append(
+                self.canvas.create_rectangle(
+                    cell_size + col * cell_size + 1,
+                    cell_size + row * cell_size + 1,
+                    cell_size * (col + 2) - 1,
+                    cell_size * (row + 2) - 1,
+                    outline="",
+                    fill="",
+                )
+            )
+            self.value_items.append(
+                self.canvas.create_text(
+                    cell_size * (col + 1.5),
+                    cell_size * (row + 1.5),
+                    text="",
+                    font=value_font,
+                    fill="#344861",
+                )
+            )
+            slots = []
+            for i in range(size):
+                x_offset = (i % box_size + 0.5) * slot_size
+                y_offset = (i // box_size + 0.5) * slot_size
+                slots.append(
                     self.canvas.create_text(
-                        CELL_SIZE * (col + 1.5),
-                        CELL_SIZE * (row + 1.5),
-                        text=cell.value,
-                        font=("Arial", 20),
-                        tags="numbers",
-                        fill="#344861",
+                        cell_size * col + x_offset + cell_size,
+                        cell_size * row + y_offset + cell_size,
+                        text="",
+                        font=candidate_font,
+                        fill="#D3D3D3",
                     )
-                elif self.show_candidates.get():
-                    candidates = list(cell.candidates)
-                    for i, candidate in enumerate(candidates):
-                        x_offset = (i % 3) * (CELL_SIZE // 3) + CELL_SIZE // 6
-                        y_offset = (i // 3) * (CELL_SIZE // 3) + CELL_SIZE // 6
-                        self.canvas.create_text(
-                            CELL_SIZE * col + x_offset + CELL_SIZE,
-                            CELL_SIZE * row + y_offset + CELL_SIZE,
-                            text=candidate,
-                            font=("Arial", 10),
-                            tags="numbers",
-                            fill="#D3D3D3",
-                        )
+                )
+            self.candidate_items.append(slots)
+
+    def draw_sudoku(self):
+        """
+        Update the cells that changed since the last draw, the rows without change are skipped
+        """
+        show_candidates = self.show_candidates.get()
+        if self.sudoku.geometry is not self.geometry:
+            self.build_canvas()
+        if self.sudoku is not self.drawn_sudoku or show_candidates != self.drawn_show_candidates:
+            self.drawn_sudoku = self.sudoku
+            self.drawn_show_candidates = show_candidates
+            self.drawn_versions = [None] * self.geometry.size
+        for row in self.sudoku.get_changed_rows(self.drawn_versions):
+            for index in self.geometry.rows[row]:
+                self.draw_cell(index, show_candidates)
+
+    def draw_cell(self, index, show_candidates):
+        size = self.geometry.size
+        cell = self.sudoku.cells[index // size][index % size]
+        candidates = cell.candidates if show_candidates and not cell.value else ()
+        drawn = (cell.value, candidates)
+        if drawn == self.drawn_cells[index]:
+            return
+        old_value, old_candidates = self.drawn_cells[index] or (None, ())
+        self.drawn_cells[index] = drawn
+        if cell.value != old_value:
+            self.canvas.itemconfigure(
+                self.value_items[index], text=VALUE_CHARS[cell.value] if cell.value else ""
+            )
+        slots = self.candidate_items[index]
+        for i in range(max(len(candidates), len(old_candidates))):
+            candidate = VALUE_CHARS[candidates[i]] if i < len(candidates) else ""
+            if i >= len(old_candidates) or VALUE_CHARS[old_candidates[i]] != candidate:
+                self.canvas.itemconfigure(slots[i], text=candidate)
 
     def cell_clicked(self, event):
         x, y = event.x, event.y
-        if (
-            CELL_SIZE <= x <= CANVAS_SIZE - CELL_SIZE
-            and CELL_SIZE <= y <= CANVAS_SIZE - CELL_SIZE
-        ):
-            row, col = (y - CELL_SIZE) // CELL_SIZE, (x - CELL_SIZE) // CELL_SIZE
+        cell_size = self.cell_size
+        end = cell_size * (self.geometry.size + 1)
+        if cell_size <= x < end and cell_size <= y < end:
+            row, col = (y - cell_size) // cell_size, (x - cell_size) // cell_size
             self.selected_cell = (row, col)
             self.draw_selection()
-            self.draw_sudoku()
 
     def draw_selection(self):
-        self.canvas.delete("selection")
+        """
+        Highlight the row, the column and the square of the selected cell,
+        changing the color of the cells whose highlight changed only
+        """
+        highlights = [0] * self.geometry.nb_cells
         if self.selected_cell:
             row, col = self.selected_cell
-
-            # Highlight the row and column
-            for i in range(GRID_SIZE):
-                self.canvas.create_rectangle(
-                    CELL_SIZE + col * CELL_SIZE + 1,
-                    CELL_SIZE + i * CELL_SIZE + 1,
-                    CELL_SIZE * (col + 2) - 1,
-                    CELL_SIZE * (i + 2) - 1,
-                    outline="",
-                    fill="#E0F7FA",
-                    tags="selection",
+            index = row * self.geometry.size + col
+            for peer in self.geometry.peers[index]:
+                highlights[peer] = 1
+            highlights[index] = 2
+        for index, highlight in enumerate(highlights):
+            if highlight != self.drawn_highlights[index]:
+                self.drawn_highlights[index] = highlight
+                self.canvas.itemconfigure(
+                    self.background_items[index], fill=HIGHLIGHT_COLORS[highlight]
                 )
-                self.canvas.create_rectangle(
-                    CELL_SIZE + i * CELL_SIZE + 1,
-                    CELL_SIZE + row * CELL_SIZE + 1,
-                    CELL_SIZE * (i + 2) - 1,
-                    CELL_SIZE * (row + 2) - 1,
-                    outline="",
-                    fill="#E0F7FA",
-                    tags="selection",
-                )
-
-            # Highlight the square
-            start_row, start_col = (row // 3) * 3, (col // 3) * 3
-            for i in range(3):
-                for j in range(3):
-                    self.canvas.create_rectangle(
-                        CELL_SIZE + (start_col + j) * CELL_SIZE + 1,
-                        CELL_SIZE + (start_row + i) * CELL_SIZE + 1,
-                        CELL_SIZE * (start_col + j + 2) - 1,
-                        CELL_SIZE * (start_row + i + 2) - 1,
-                        outline="",
-                        fill="#E0F7FA",
-                        tags="selection",
-                    )
-
-            # Highlight the selected cell
-            self.canvas.create_rectangle(
-                CELL_SIZE + col * CELL_SIZE + 1,
-                CELL_SIZE + row * CELL_SIZE + 1,
-                CELL_SIZE * (col + 2) - 1,
-                CELL_SIZE * (row + 2) - 1,
-                outline="",
-                fill="#B2EBF2",
-                tags="selection",
-            )
 
     def key_pressed(self, event):
-        if self.selected_cell and event.char.isdigit() and 1 <= int(event.char) <= 9:
+        # digits, then letters for the values after 9
+        value = CHAR_VALUES.get(event.char, 0)
+        if self.selected_cell and 1 <= value <= self.geometry.size:
+            # during a solve, the grid only changes by its steps
+            if self.is_solving():
+                return
             row, col = self.selected_cell
-            self.sudoku.set_value(row, col, int(event.char))
+            snapshot = self.sudoku.snapshot()
+            if self.sudoku.set_value(row, col, value):
+                self.push_undo(snapshot)
             self.draw_sudoku()
         # if event is an arrow key move selected cell
         elif event.keysym == "Up":
@@ -248,54 +422,208 @@ class SudokuUI(Frame):
             self.move_selection(0, 1)
 
     def import_sudoku(self):
+        if self.is_solving():
+            return
         file_path = filedialog.askopenfilename(filetypes=[("All files", "*.*")])
         if file_path:
-            self.sudoku = SudokuParser.parse_sudoku(file_path)
+            try:
+                sudoku = SudokuParser.parse_sudoku(file_path, self.box_size.get())
+            except ValueError as e:
+                self.stats_text.delete(1.0, "end")
+                self.stats_text.insert("end", f"Sudoku could not be imported: {e}\n")
+                return
+            self.sudoku = sudoku
             self.solver = SudokuSolver(self.sudoku)
+            self.clear_history()
             self.draw_sudoku()
             self.stats_text.delete(1.0, "end")
 
     def remove_candidates(self):
+        if self.is_solving():
+            return
+        snapshot = self.sudoku.snapshot()
         # self.solver.hidden_n_tuples()
+        self.solver.pointing_and_claiming()
         self.solver.naked_n_tuples()
+        self.push_undo(snapshot)
         self.draw_sudoku()
 
+    def is_solving(self):
+        return self.background_solve is not None
+
     def solve_sudoku(self):
-        self.solver.solve()
-        self.draw_sudoku()
-        self.show_stats()
+        """
+        Start solving on a worker thread, the steps are shown as they come by poll_solve
+        """
+        if self.is_solving():
+            return
+        self.solve_snapshot = self.sudoku.snapshot()
+        self.background_solve = BackgroundSolve(
+            self.sudoku, bool(self.use_backtracking.get()), self.solver.count_strategies
+        )
+        self.solve_progress = {"strategy": None, "placed": 0, "eliminated": 0}
+        self.step_credit = 0.0
+        self.background_solve.start()
+        self.show_progress()
+        self.after(POLL_INTERVAL, self.poll_solve)
 
-    def show_stats(self):
+    def poll_solve(self):
+        """
+        Read the steps sent by the worker thread and show the ones due at the step rate
+        """
+        background_solve = self.background_solve
+        if background_solve is None:
+            return
+        for batch in background_solve.get_batches():
+            self.pending_events.extend(batch)
+        rate = self.step_rate.get()
+        if rate:
+            self.step_credit += rate * POLL_INTERVAL / 1000
+        events = []
+        while self.pending_events and (not rate or self.step_credit >= 1):
+            event = self.pending_events.popleft()
+            events.append(event)
+            kind = event[0]
+            if kind == EVENT_PLACEMENT:
+                self.solve_progress["placed"] += 1
+            elif kind == EVENT_ELIMINATION:
+                self.solve_progress["eliminated"] += 1
+            elif kind == EVENT_STRATEGY_START:
+                self.solve_progress["strategy"] = event[1]
+            if rate and kind in (EVENT_PLACEMENT, EVENT_ELIMINATION):
+                self.step_credit -= 1
+        if not self.pending_events:
+            # no credit saved up while waiting for the worker
+            self.step_credit = min(self.step_credit, 1)
+        if events:
+            SolveTrace.replay(events, self.sudoku)
+            self.draw_sudoku()
+            self.show_progress()
+        if background_solve.is_finished and not self.pending_events:
+            self.finish_solve()
+        else:
+            self.after(POLL_INTERVAL, self.poll_solve)
+
+    def finish_solve(self, cancelled=False):
+        background_solve = self.background_solve
+        self.background_solve = None
+        self.pending_events.clear()
+        self.push_undo(self.solve_snapshot)
+        if cancelled:
+            self.show_progress("Solve cancelled")
+        else:
+            self.solver.count_strategies = background_solve.solver.count_strategies
+            self.show_stats(background_solve.solver.instrumentation)
+
+    def cancel_solve(self):
+        """
+        Stop the solve, the steps already shown are kept and can be undone
+        """
+        if self.is_solving():
+            self.background_solve.cancel()
+            self.finish_solve(cancelled=True)
+
+    def show_progress(self, title="Solving..."):
+        progress = self.solve_progress
+        self.stats_text.delete(1.0, "end")
+        self.stats_text.insert("end", title + "\n")
+        if progress["strategy"]:
+            self.stats_text.insert("end", f"Last strategy: {progress['strategy']}\n")
+        self.stats_text.insert(
+            "end", f"{progress['placed']} placed, {progress['eliminated']} eliminated\n"
+        )
+
+    def get_solutions_message(self):
+        nb_solutions = count_solutions(
+            self.sudoku.masks, self.sudoku.values, max_nodes=CHECK_MAX_NODES
+        )
+        if nb_solutions is None:
+            return "Sudoku has too many possibilities to be checked"
+        elif nb_solutions == 0:
+            return "Sudoku has no solution"
+        elif nb_solutions == 1:
+            return "Sudoku has a unique solution"
+        else:
+            return "Sudoku has several solutions"
+
+    def check_sudoku(self):
+        self.stats_text.delete(1.0, "end")
+        self.stats_text.insert("end", self.get_solutions_message() + "\n")
+
+    def show_stats(self, instrumentation=None):
+        """
+        :param instrumentation: SolverInstrumentation of the last solve, to show its measures
+        """
         self.stats_text.delete(1.0, "end")
         if self.sudoku.is_sudoku_solved():
             self.stats_text.insert("end", "Sudoku solved!\n")
         elif self.sudoku.is_impossible():
             self.stats_text.insert("end", "Sudoku is impossible\n")
         else:
-            self.stats_text.insert("end", "Sudoku could not be solved\n")
+            self.stats_text.insert(
+                "end", f"Sudoku could not be solved: {self.get_solutions_message().lower()}\n"
+            )
         for strategy, counts in self.solver.count_strategies.items():
             self.stats_text.insert(
                 "end", f"{strategy}: {counts[0]} times, {counts[1]} numbers found\n"
             )
+        if instrumentation is not None:
+            self.stats_text.insert(
+                "end", f"\nLast solve: {instrumentation.iterations} iterations\n"
+            )
+            for strategy, stats in instrumentation.strategies.items():
+                self.stats_text.insert(
+                    "end",
+                    f"{strategy}: {stats['time'] * 1000:.2f} ms, {stats['placed']} placed, "
+                    f"{stats['eliminated']} eliminated, {stats['units_scanned']} units scanned\n",
+                )
 
     def clear_sudoku(self):
-        self.sudoku = Sudoku()
+        if self.is_solving():
+            return
+        self.sudoku = Sudoku(self.box_size.get())
         self.solver = SudokuSolver(self.sudoku)
+        self.clear_history()
         self.draw_sudoku()
         self.stats_text.delete(1.0, "end")
 
+    def change_box_size(self, box_size):
+        if self.is_solving():
+            self.box_size.set(self.sudoku.geometry.box_size)
+        elif self.sudoku.geometry.box_size != box_size:
+            self.clear_sudoku()
+
+    def push_undo(self, snapshot):
+        """
+        Record a change of the sudoku, to be able to undo it
+
+        :param snapshot: snapshot of the sudoku before the change
+        """
+        if snapshot != self.sudoku.snapshot():
+            self.undo_stack.append(snapshot)
+            self.redo_stack.clear()
+
+    def undo(self, event=None):
+        if self.undo_stack and not self.is_solving():
+            self.redo_stack.append(self.sudoku.snapshot())
+            self.sudoku.restore(self.undo_stack.pop())
+            self.draw_sudoku()
+
+    def redo(self, event=None):
+        if self.redo_stack and not self.is_solving():
+            self.undo_stack.append(self.sudoku.snapshot())
+            self.sudoku.restore(self.redo_stack.pop())
+            self.draw_sudoku()
+
+    def clear_history(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+
     def move_selection(self, row_move, col_move):
         if self.selected_cell:
             row, col = self.selected_cell
-            if (
-                (row == 0 and row_move == -1)
-                or (row == 8 and row_move == 1)
-                or (col == 0 and col_move == -1)
-                or (col == 8 and col_move == 1)
-            ):
-                return
+            size = self.geometry.size
             new_row, new_col = row + row_move, col + col_move
-            if 0 <= new_row < GRID_SIZE and 0 <= new_col < GRID_SIZE:
+            if 0 <= new_row < size and 0 <= new_col < size:
                 self.selected_cell = (new_row, new_col)
                 self.draw_selection()
-                self.draw_sudoku()
@@ -1,6 +1,9 @@
 import logging
 from collections import defaultdict
-from itertools import combinations
+
+from sudoku import GEOMETRY, candidates_from_mask
+from sudoku_instrumentation import SolverInstrumentation
+from sudoku_search import SearchLimitReached, iter_solutions
 
 STRATEGY_1 = "Only one candidate"
 STRATEGY_2 = "Only position in row"
@@ -8,6 +11,10 @@ STRATEGY_3 = "Only position in column"
 STRATEGY_4 = "Only position in square"
 STRATEGY_5 = "Hidden n-tuples"
 STRATEGY_6 = "Naked n-tuples"
+STRATEGY_7 = "Pointing and claiming"
+STRATEGY_8 = "Backtracking"
+
+DEFAULT_MAX_SUBSET_SIZE = 4
 
 
 class SudokuSolver:
@@ -16,11 +23,21 @@ class SudokuSolver:
 
     Attributes:
     - sudoku: Sudoku object to solve
+    - geometry: GridGeometry of the sudoku, whose tables the strategies use
     - countStrategies: dictionary with stats of the strategies used
+    - seen_versions: for each strategy (and number for the only position strategies),
+      the versions of the units when it last scanned them. Units that did not change since are skipped
+    - max_subset_size: biggest n looked for by the n-tuples strategies
+    - backtracking: finish the sudoku with a search when the human strategies are stuck
+    - nb_units_scanned: number of units scanned by the strategies
+    - instrumentation: None, or SolverInstrumentation measuring the strategies (see instrument)
     """
 
-    def __init__(self, sudoku):
+    def __init__(self, sudoku, max_subset_size=DEFAULT_MAX_SUBSET_SIZE, backtracking=False):
         self.sudoku = sudoku
+        self.geometry = sudoku.geometry
+        self.max_subset_size = max_subset_size
+        self.backtracking = backtracking
         self.count_strategies = {
             STRATEGY_1: [0, 0],
             STRATEGY_2: [0, 0],
@@ -28,23 +45,83 @@ class SudokuSolver:
             STRATEGY_4: [0, 0],
             STRATEGY_5: [0, 0],
             STRATEGY_6: [0, 0],
+            STRATEGY_7: [0, 0],
+            STRATEGY_8: [0, 0],
         }
+        self.seen_versions = {}
+        self.nb_units_scanned = 0
+        self.instrumentation = None
+
+    def instrument(self, instrumentation=None):
+        """
+        Measure the strategies and the placed values from now on
+
+        :param instrumentation: SolverInstrumentation to fill, a new one by default
+        :return: the instrumentation, to read the measures or add hooks to
+        """
+        if instrumentation is None:
+            instrumentation = SolverInstrumentation()
+        self.instrumentation = instrumentation
+        self.sudoku.hooks = instrumentation
+        return instrumentation
+
+    def get_strategies(self):
+        """
+        :return: list of (strategy, method) in the order solve tries them
+        """
+        return [
+            (STRATEGY_1, self.only_one_candidate),
+            (STRATEGY_2, self.only_position_in_row),
+            (STRATEGY_3, self.only_position_in_col),
+            (STRATEGY_4, self.only_position_in_square),
+            (STRATEGY_7, self.pointing_and_claiming),
+            (STRATEGY_6, self.naked_n_tuples),
+            (STRATEGY_5, self.hidden_n_tuples),
+        ]
 
     def stop(self):
         return self.sudoku.is_sudoku_solved() or self.sudoku.is_impossible()
 
-    def solve(self):
+    def get_deadline(self):
+        """
+        :return: time.time() after which the backtracking search gives up, None for no deadline
+        """
+        return None
+
+    def solve(self, trace=None):
+        """
+        Apply the strategies until the sudoku is solved or none of them finds anything
+
+        :param trace: SolveTrace recording the steps of this solve, nothing is recorded by default
+        """
+        if trace is not None:
+            trace.attach(self)
+            try:
+                self.solve()
+            finally:
+                trace.detach()
+            return
+
+        instrumentation = self.instrumentation
+        strategies = self.get_strategies()
         while not self.stop():
-            if not (
-                self.only_one_candidate()
-                or self.only_position_in_row()
-                or self.only_position_in_col()
-                or self.only_position_in_square()
-                or self.hidden_n_tuples()
-                or self.naked_n_tuples()
-            ):
+            if instrumentation is None:
+                found = any(method() for _, method in strategies)
+            else:
+                instrumentation.iterations += 1
+                found = any(
+                    instrumentation.run_strategy(self, strategy, method)
+                    for strategy, method in strategies
+                )
+            if not found:
                 break
 
+        if self.backtracking and not self.stop():
+            if instrumentation is None:
+                self.backtrack()
+            else:
+                instrumentation.run_strategy(self, STRATEGY_8, self.backtrack)
+
         if self.sudoku.is_sudoku_solved():
             logging.debug("Sudoku solved! :)")
         elif self.sudoku.is_impossible():
@@ -52,182 +129,262 @@ class SudokuSolver:
         else:
             logging.debug("Sudoku could not be solved :|")
 
+    def get_dirty_units(self, key, unit_numbers):
+        """
+        Yield the units that changed since they were last scanned under the given key,
+        and record them as scanned.
+        Units are checked lazily, so a unit changed by the scan of a previous one is still yielded,
+        and nothing more is yielded as soon as the sudoku becomes impossible
+
+        :param key: name of the strategy, or any key identifying the scan
+        :param unit_numbers: numbers of the units the strategy works on (indices in geometry.units)
+        :return: generator of the numbers of the units to scan
+        """
+        versions = self.sudoku.unit_versions
+        seen = self.seen_versions.get(key)
+        if seen is None:
+            seen = self.seen_versions[key] = [-1] * len(versions)
+        sudoku = self.sudoku
+        for unit in unit_numbers:
+            if sudoku.nb_empty:
+                return
+            if seen[unit] != versions[unit]:
+                seen[unit] = versions[unit]
+                self.nb_units_scanned += 1
+                yield unit
+
+    def backtrack(self):
+        """
+        Finish the sudoku with the first solution found by a search from the current candidates.
+        Not a human strategy, it is counted apart in the stats
+        """
+        self.count_strategies[STRATEGY_8][0] += 1
+        nb_found = 0
+        solutions = iter_solutions(
+            self.sudoku.masks, self.sudoku.values, deadline=self.get_deadline()
+        )
+        try:
+            solution = next(solutions, None)
+        except SearchLimitReached:
+            logging.debug("Backtracking stopped at the deadline")
+            return False
+        if solution is None:
+            logging.debug("No solution found by backtracking")
+            return False
+        for index, value in enumerate(solution):
+            if not self.sudoku.values[index] and self.sudoku.set_value_at(index, value):
+                nb_found += 1
+        self.count_strategies[STRATEGY_8][1] += nb_found
+        return nb_found > 0
+
     def only_one_candidate(self):
-        logging.debug("Checking for cells with only one candidate")
         self.count_strategies[STRATEGY_1][0] += 1
         nb_found = 0
-        for row in self.sudoku.cells:
-            for cell in row:
+        masks = self.sudoku.masks
+        rows = self.geometry.rows
+        # every change in a cell marks its row, scanning the changed rows covers all the changed cells
+        for row in self.get_dirty_units(STRATEGY_1, self.geometry.row_units):
+            for index in rows[row]:
+                mask = masks[index]
                 if (
-                    cell.nb_remaining_candidates() == 1
-                    and self.sudoku.set_value(
-                        self.sudoku.cells.index(row),
-                        row.index(cell),
-                        int(next(iter(cell.candidates))),
-                    )
-                ) :
+                    mask
+                    and not mask & (mask - 1)
+                    and self.sudoku.set_value_at(index, mask.bit_length())
+                ):
                     nb_found += 1
         self.count_strategies[STRATEGY_1][1] += nb_found
         return nb_found > 0
 
     def only_position_in_row(self):
-        logging.debug("Checking for only position in row")
         self.count_strategies[STRATEGY_2][0] += 1
-        nb_found = 0
-        for number in range(1, 10):
-            for row in self.sudoku.cells:
-                candidates = [cell for cell in row if number in cell.candidates]
-                if len(candidates) == 1:
-                    candidate = candidates[0]
-                    if self.sudoku.set_value(
-                        self.sudoku.cells.index(row), row.index(candidate), number
-                    ):
-                        nb_found += 1
+        nb_found = self.only_position_in_units(STRATEGY_2, self.geometry.row_units)
         self.count_strategies[STRATEGY_2][1] += nb_found
         return nb_found > 0
 
     def only_position_in_col(self):
-        logging.debug("Checking for only position in column")
         self.count_strategies[STRATEGY_3][0] += 1
-        nb_found = 0
-        for number in range(1, 10):
-            for col in range(9):
-                candidates = [
-                    (self.sudoku.cells.index(row), col)
-                    for row in self.sudoku.cells
-                    if number in row[col].candidates
-                ]
-                if len(candidates) == 1:
-                    row, col = candidates[0]
-                    if self.sudoku.set_value(row, col, number):
-                        nb_found += 1
+        nb_found = self.only_position_in_units(STRATEGY_3, self.geometry.col_units)
         self.count_strategies[STRATEGY_3][1] += nb_found
         return nb_found > 0
 
     def only_position_in_square(self):
-        logging.debug("Checking for only position in square")
         self.count_strategies[STRATEGY_4][0] += 1
+        nb_found = self.only_position_in_units(STRATEGY_4, self.geometry.square_units)
+        self.count_strategies[STRATEGY_4][1] += nb_found
+        return nb_found > 0
+
+    def only_position_in_units(self, strategy, unit_numbers):
         nb_found = 0
-        for square in range(9):  # number of the square (latin reading order)
-            # top left corner of the square
-            top_row, left_col = square // 3 * 3, square % 3 * 3
-            for number in range(1, 10):
-                candidates = [
-                    (top_row + i, left_col + j)
-                    for i in range(3)
-                    for j in range(3)
-                    if number
-                    in self.sudoku.cells[top_row + i][left_col + j].candidates
-                ]
+        masks = self.sudoku.masks
+        units = self.geometry.units
+        for number in range(1, self.geometry.size + 1):
+            bit = 1 << (number - 1)
+            for unit in self.get_dirty_units((strategy, number), unit_numbers):
+                candidates = [index for index in units[unit] if masks[index] & bit]
                 if len(candidates) == 1:
-                    row, col = candidates[0]
-                    if self.sudoku.set_value(row, col, number):
+                    if self.sudoku.set_value_at(candidates[0], number):
                         nb_found += 1
-        self.count_strategies[STRATEGY_4][1] += nb_found
-        return nb_found > 0
+        return nb_found
 
     def hidden_n_tuples(self):
-        logging.debug("Checking for hidden n-tuples")
         self.count_strategies[STRATEGY_5][0] += 1
         nb_found = 0
 
-        for row in self.sudoku.cells:
-            nb_found += self.remove_other_candidates_from_n_tuple(row)
-
-        for col in range(9):
-            nb_found += self.remove_other_candidates_from_n_tuple(
-                [row[col] for row in self.sudoku.cells]
-            )
-
-        for square in range(9):
-            square_cells = self.sudoku.get_square_cells(square)
-            nb_found += self.remove_other_candidates_from_n_tuple(square_cells)
+        units = self.geometry.units
+        for unit in self.get_dirty_units(STRATEGY_5, range(len(units))):
+            nb_found += self.remove_other_candidates_from_hidden_subset(units[unit])
 
         self.count_strategies[STRATEGY_5][1] += nb_found
         return nb_found > 0
 
     def naked_n_tuples(self):
-        logging.debug("Checking for naked pairs")
         self.count_strategies[STRATEGY_6][0] += 1
         nb_found = 0
 
-        for row in range(9):
-            self.__naked_n_tuple_row_col_proc__([(row, col) for col in range(9)], 0)
+        units = self.geometry.units
+        for unit in self.get_dirty_units(STRATEGY_6, range(len(units))):
+            nb_found += self.remove_candidates_of_naked_subset(units[unit])
 
-        for col in range(9):
-            self.__naked_n_tuple_row_col_proc__([(row, col) for row in range(9)], 1)
+        self.count_strategies[STRATEGY_6][1] += nb_found
+        return nb_found > 0
 
-        for square in range(9):
-            top_left = square // 3 * 3, square % 3 * 3
-            square_cells_position = [top_left + (i, j) for i in range(3) for j in range(3)]
-            candidates_positions = self.get_candidates_cells_position(square_cells_position)
-            for candidate, positions in candidates_positions.items():
-                if len(positions) == 2:
-                    removable_positions = set(square_cells_position) - set(positions)
-                    removable_positions = [(i,j) for i,j in removable_positions if candidate in self.sudoku.cells[i][j].candidates]
-                    nb_found += self.sudoku.remove_candidate_from_cells(candidate, removable_positions)
+    def remove_candidates_of_naked_subset(self, unit):
+        """
+        Look in the unit for n cells whose candidates are n numbers in total,
+        and remove these numbers from the other cells of the unit.
+        Stops at the first subset that removes candidates, the unit is scanned again on the next call
 
-        self.count_strategies[STRATEGY_6][1] += nb_found
+        :param unit: flat indices of the cells of the unit
+        :return: number of candidates removed
+        """
+        masks = self.sudoku.masks
+        cells = [(index, masks[index]) for index in unit if masks[index]]
+        for n in range(2, min(self.max_subset_size, len(cells) - 1) + 1):
+            for subset, numbers in self.find_subsets(cells, n):
+                keep = self.geometry.all_candidates ^ numbers
+                nb_found = 0
+                for index, _ in cells:
+                    if index not in subset:
+                        nb_found += self.sudoku.keep_candidates_at(index, keep)
+                if nb_found:
+                    return nb_found
+        return 0
+
+    def pointing_and_claiming(self):
+        """
+        When the candidates of a number in a unit are all in another unit too,
+        the number can be removed from the rest of that other unit:
+        pointing goes from a square to a row or column, claiming from a row or column to a square
+        """
+        self.count_strategies[STRATEGY_7][0] += 1
+        nb_found = 0
+
+        for unit in self.get_dirty_units(STRATEGY_7, range(len(self.geometry.units))):
+            nb_found += self.remove_candidates_outside_of_unit(unit)
+
+        self.count_strategies[STRATEGY_7][1] += nb_found
         return nb_found > 0
 
-    def __naked_n_tuple_row_col_proc__(self, cells_position, dimension):
+    def remove_candidates_outside_of_unit(self, unit_number):
         candidates_removed = 0
-        candidates_positions = self.get_candidates_cells_position(cells_position)
+        geometry = self.geometry
+        kind = unit_number // geometry.size  # 0 for row, 1 for column, 2 for square
+        other_kinds = [2] if kind < 2 else [0, 1]
+        candidates_positions = self.get_candidates_cells_position(geometry.units[unit_number])
         for candidate, positions in candidates_positions.items():
-            if (
-                self.are_positions_in_same_square(positions)
-                and self.are_positions_in_same_dimension(positions, dimension)
-            ):
-                square_number = positions[0][0] // 3 * 3 + positions[0][1] // 3
-                square_cells = self.sudoku.get_square_cells(square_number)
-                for cell in set(square_cells) - set([self.sudoku.cells[i][j] for i, j in positions]):
-                    if candidate in cell.candidates:
-                        cell.remove_candidate(candidate)
-                        candidates_removed += 1
+            for other_kind in other_kinds:
+                if self.are_positions_in_same_unit(positions, other_kind, geometry):
+                    other_unit = geometry.units[geometry.cell_units[positions[0]][other_kind]]
+                    candidates_removed += self.sudoku.remove_candidate_at(
+                        candidate, [index for index in other_unit if index not in positions]
+                    )
         return candidates_removed
 
-    @staticmethod
-    def get_candidates_cells(cells):
-        candidates_positions = defaultdict(list)
-        for cell in cells:
-            for candidate in cell.candidates:
-                candidates_positions[candidate].append(cell)
-        return candidates_positions
-
     def get_candidates_cells_position(self, cells_position):
         candidates_positions = defaultdict(list)
-        for pos in cells_position:
-            for candidate in self.sudoku.cells[pos[0]][pos[1]].candidates:
-                candidates_positions[candidate].append(pos)
+        masks = self.sudoku.masks
+        for index in cells_position:
+            for candidate in candidates_from_mask(masks[index]):
+                candidates_positions[candidate].append(index)
         return candidates_positions
 
-    def remove_other_candidates_from_n_tuple(self, cells):
-        nb_found = 0
-        candidates_cells = self.get_candidates_cells(cells)
-        for n in range(1, len(candidates_cells)-1):
-            logging.debug(f"Checking for hidden {n}-tuples")
-            n_tuples = {num: cells for num, cells in candidates_cells.items() if len(cells) == n}
-            for combination in combinations(n_tuples.items(), n):
-                all_cells = set([cell for _, cells in combination for cell in cells])
-                if len(all_cells) != n:
+    def remove_other_candidates_from_hidden_subset(self, unit):
+        """
+        Look in the unit for n candidates that can only be in the same n cells,
+        and remove the other candidates of these cells.
+        Stops at the first subset that removes candidates, the unit is scanned again on the next call
+
+        :param unit: flat indices of the cells of the unit
+        :return: number of candidates removed
+        """
+        masks = self.sudoku.masks
+        # for each candidate, bitmask of the cells of the unit it can be in
+        positions = [0] * self.geometry.size
+        for slot, index in enumerate(unit):
+            mask = masks[index]
+            while mask:
+                low_bit = mask & -mask
+                positions[low_bit.bit_length() - 1] |= 1 << slot
+                mask ^= low_bit
+        numbers = [(number, position) for number, position in enumerate(positions) if position]
+        for n in range(1, min(self.max_subset_size, len(numbers) - 2) + 1):
+            for subset, slots in self.find_subsets(numbers, n):
+                keep = 0
+                for number in subset:
+                    keep |= 1 << number
+                nb_found = 0
+                for slot, index in enumerate(unit):
+                    if slots >> slot & 1:
+                        nb_found += self.sudoku.keep_candidates_at(index, keep)
+                if nb_found:
+                    return nb_found
+        return 0
+
+    @staticmethod
+    def find_subsets(items, size):
+        """
+        Find the subsets of `size` items whose bitmasks have exactly `size` bits in total.
+        The search is depth first and drops a branch as soon as its union has too many bits
+
+        :param items: list of (item, bitmask)
+        :param size: number of items in a subset
+        :return: generator of (list of items, union of their bitmasks)
+        """
+        items = [(item, mask) for item, mask in items if mask.bit_count() <= size]
+        chosen = []
+
+        def search(start, union):
+            if len(chosen) == size:
+                if union.bit_count() == size:
+                    yield list(chosen), union
+                return
+            for k in range(start, len(items) - (size - len(chosen)) + 1):
+                item, mask = items[k]
+                new_union = union | mask
+                if new_union.bit_count() > size:
                     continue
-                for cell in all_cells:
-                    for candidate in set(cell.candidates) - set(num for num, _ in combination):
-                        cell.remove_candidate(candidate)
-                        nb_found += 1
-        return nb_found
+                chosen.append(item)
+                yield from search(k + 1, new_union)
+                chosen.pop()
+
+        return search(0, 0)
 
     @staticmethod
-    def are_positions_in_same_dimension(cells_position, dimension):
-        if dimension not in [0,1]:
-            raise ValueError("dimension must be 0 or 1")
+    def are_positions_in_same_unit(cells_position, kind, geometry=GEOMETRY):
+        """
+        :param cells_position: flat indices of the cells
+        :param kind: 0 for row, 1 for column, 2 for square
+        :param geometry: GridGeometry of the grid of the cells
+        :return: True if all the cells are in the same unit of this kind
+        """
+        if kind not in [0, 1, 2]:
+            raise ValueError("kind must be 0, 1 or 2")
 
+        cell_units = geometry.cell_units
         return (
             len(cells_position) != 0
-            and all(pos[dimension] == cells_position[0][dimension] for pos in cells_position)
+            and all(
+                cell_units[pos][kind] == cell_units[cells_position[0]][kind]
+                for pos in cells_position
+            )
         )
-
-    @staticmethod
-    def are_positions_in_same_square(cells_position):
-        return len(set((pos[0]//3, pos[1]//3) for pos in cells_position)) == 1
-
@@ -0,0 +1,127 @@
+import time
+
+
+class SolverInstrumentation:
+    """
+    Measures of a solve, and hooks called around each strategy and each placed value.
+    Attached to a solver with SudokuSolver.instrument, a solver without it pays nothing
+
+    Attributes:
+    - iterations: number of iterations of the main loop of SudokuSolver.solve
+    - strategies: for each strategy that ran, dictionary with its number of calls,
+      the time spent in it (seconds), the values it placed, the candidates it eliminated
+      (not counting the ones removed by placing values) and the units it scanned
+    - before_strategy: callables called with (solver, strategy) before each strategy call
+    - after_strategy: callables called with (solver, strategy, found) after each strategy call
+    - before_set_value: callables called with (sudoku, index, value) before each Sudoku.set_value
+    - after_set_value: callables called with (sudoku, index, value, is_placed) after it
+    """
+
+    def __init__(self):
+        self.iterations = 0
+        self.strategies = {}
+        self.before_strategy = []
+        self.after_strategy = []
+        self.before_set_value = []
+        self.after_set_value = []
+
+    def run_strategy(self, solver, strategy, method):
+        """
+        Call a strategy of the solver, measuring it and calling the hooks around it
+
+        :param solver: SudokuSolver running the strategy
+        :param strategy: name of the strategy
+        :param method: bound method of the solver applying the strategy
+        :return: what the method returned, True if it found something
+        """
+        for hook in self.before_strategy:
+            hook(solver, strategy)
+        sudoku = solver.sudoku
+        masks = sudoku.masks[:]
+        nb_units_scanned = solver.nb_units_scanned
+        start = time.perf_counter()
+        found = method()
+        elapsed = time.perf_counter() - start
+
+        stats = self.strategies.get(strategy)
+        if stats is None:
+            stats = self.strategies[strategy] = {
+                "calls": 0,
+                "time": 0.0,
+                "placed": 0,
+                "eliminated": 0,
+                "units_scanned": 0,
+            }
+        stats["calls"] += 1
+        stats["time"] += elapsed
+        stats["units_scanned"] += solver.nb_units_scanned - nb_units_scanned
+        placed, eliminated = self.count_changes(masks, sudoku)
+        stats["placed"] += placed
+        stats["eliminated"] += eliminated
+        for hook in self.after_strategy:
+            hook(solver, strategy, found)
+        return found
+
+    @staticmethod
+    def get_changes(old_masks, sudoku):
+        """
+        Compare the candidates of a sudoku with an earlier copy of them.
+        A candidate removed from a peer of a cell that got the same value is a consequence
+        of the placement, not an elimination
+
+        :param old_masks: copy of the masks of the sudoku before the changes
+        :param sudoku: the sudoku after the changes
+        :return: list of the indices of the placed values,
+            and list of (index, bitmask of the eliminated candidates) of the other changed cells
+        """
+        masks, values, peers = sudoku.masks, sudoku.values, sudoku.geometry.peers
+        placed = {}
+        changed = []
+        for index in range(len(masks)):
+            if old_masks[index] != masks[index]:
+                if values[index] and old_masks[index]:
+                    placed[index] = 1 << (values[index] - 1)
+                else:
+                    changed.append(index)
+        eliminations = []
+        for index in changed:
+            removed = old_masks[index] & ~masks[index]
+            if placed:
+                for peer in peers[index]:
+                    removed &= ~placed.get(peer, 0)
+            if removed:
+                eliminations.append((index, removed))
+        return list(placed), eliminations
+
+    @staticmethod
+    def count_changes(old_masks, sudoku):
+        """
+        Same as get_changes, counting the changes
+
+        :return: (number of values placed, number of candidates eliminated)
+        """
+        placed, eliminations = SolverInstrumentation.get_changes(old_masks, sudoku)
+        return len(placed), sum(removed.bit_count() for _, removed in eliminations)
+
+    def set_value(self, sudoku, index, value):
+        """
+        Place a value in a sudoku, calling the hooks around it. Called by Sudoku.set_value_at
+
+        :return: True is value was placed in the cell, False otherwise
+        """
+        for hook in self.before_set_value:
+            hook(sudoku, index, value)
+        is_placed = sudoku.place_value_at(index, value)
+        for hook in self.after_set_value:
+            hook(sudoku, index, value, is_placed)
+        return is_placed
+
+    def get_total(self):
+        """
+        :return: dictionary with the sums of the measures of all the strategies
+        """
+        total = {"calls": 0, "time": 0.0, "placed": 0, "eliminated": 0, "units_scanned": 0}
+        for stats in self.strategies.values():
+            for measure, amount in stats.items():
+                total[measure] += amount
+        return total
@@ -0,0 +1,154 @@
+import numpy as np
+
+from sudoku import CELL_UNITS, NB_CELLS, SIZE, UNITS, Sudoku
+from sudoku_human_solver import (
+    STRATEGY_1,
+    STRATEGY_2,
+    STRATEGY_3,
+    STRATEGY_4,
+    SudokuSolver,
+)
+
+STRATEGIES = (STRATEGY_1, STRATEGY_2, STRATEGY_3, STRATEGY_4)
+UNIT_INDEX = np.array(UNITS)  # (27, 9) flat indices of the cells of each unit
+CELL_UNIT_INDEX = np.array(CELL_UNITS)  # (81, 3) numbers of the units of each cell
+UNIT_KINDS = (slice(0, SIZE), slice(SIZE, 2 * SIZE), slice(2 * SIZE, 3 * SIZE))
+# value of a single bit mask, 0 for any other mask
+VALUE_OF_BIT = np.zeros(1 << SIZE, dtype=np.uint8)
+VALUE_OF_BIT[1 << np.arange(SIZE)] = np.arange(1, SIZE + 1)
+
+
+def once_and_more(unit_masks):
+    """
+    :param unit_masks: (..., 9) masks of the cells of units
+    :return: masks of the bits set in exactly one cell, and in more than one cell, of each unit
+    """
+    once = np.zeros(unit_masks.shape[:-1], dtype=np.uint16)
+    more = np.zeros_like(once)
+    for k in range(unit_masks.shape[-1]):
+        more |= once & unit_masks[..., k]
+        once |= unit_masks[..., k]
+    return once & ~more, more
+
+
+class NumpySinglesSolver:
+    """
+    Vectorized solver applying the singles strategies of SudokuSolver
+    (only one candidate, only position in row, column and square) to many sudokus at once.
+    The sudokus the singles cannot finish are then given to SudokuSolver
+
+    Attributes:
+    - masks: (N, 81) candidate bitmasks of the cells, as in Sudoku.masks
+    - values: (N, 81) values of the cells, 0 for an empty cell
+    - calls, found: (N, 4) stats of the singles strategies for each sudoku.
+      A call is a vectorized pass over the sudoku, and a cell found by several rules in the
+      same pass is counted for the first strategy only
+    """
+
+    def __init__(self, sudokus):
+        sudokus = list(sudokus)
+        self.values = np.array(
+            [np.frombuffer(sudoku.values, dtype=np.uint8) for sudoku in sudokus],
+            dtype=np.uint8,
+        ).reshape(len(sudokus), NB_CELLS)
+        self.masks = np.array(
+            [np.frombuffer(sudoku.masks, dtype=np.uint16) for sudoku in sudokus],
+            dtype=np.uint16,
+        ).reshape(len(sudokus), NB_CELLS)
+        self.calls = np.zeros((len(sudokus), len(STRATEGIES)), dtype=np.int64)
+        self.found = np.zeros((len(sudokus), len(STRATEGIES)), dtype=np.int64)
+
+    def solve_singles(self):
+        """
+        Apply the singles strategies until every sudoku is solved, stalled or has a contradiction.
+        A pass that would place two values in a cell, or the same value twice in a unit,
+        is not applied to the sudoku
+
+        :return: number of vectorized passes
+        """
+        active = np.ones(len(self.values), dtype=bool)
+        nb_passes = 0
+        while True:
+            empty_cells = self.values == 0
+            active &= empty_cells.any(axis=1) & ~(empty_cells & (self.masks == 0)).any(axis=1)
+            puzzles = np.flatnonzero(active)
+            if not puzzles.size:
+                return nb_passes
+            nb_passes += 1
+            masks = self.masks[puzzles]
+
+            found = [np.where(masks & (masks - 1) == 0, masks, 0)]
+            unit_masks = masks[:, UNIT_INDEX]  # (n, 27, 9)
+            single, _ = once_and_more(unit_masks)
+            for units in UNIT_KINDS:
+                cells = np.zeros_like(masks)
+                cells[:, UNIT_INDEX[units].ravel()] = (
+                    unit_masks[:, units] & single[:, units, None]
+                ).reshape(len(puzzles), NB_CELLS)
+                found.append(cells)
+
+            placed = np.zeros_like(masks)
+            nb_found = np.zeros((len(puzzles), len(STRATEGIES)), dtype=np.int64)
+            for k, cells in enumerate(found):
+                nb_found[:, k] = ((cells != 0) & (placed == 0)).sum(axis=1)
+                placed |= cells
+
+            unit_placed, placed_twice = once_and_more(placed[:, UNIT_INDEX])
+            conflict = (placed & (placed - 1) != 0).any(axis=1) | (placed_twice != 0).any(axis=1)
+            applied = (placed != 0).any(axis=1) & ~conflict
+            self.calls[puzzles] += 1
+            self.found[puzzles[applied]] += nb_found[applied]
+            active[puzzles[~applied]] = False
+
+            rows = puzzles[applied]
+            placed, unit_placed = placed[applied], unit_placed[applied]
+            eliminated = np.bitwise_or.reduce(unit_placed[:, CELL_UNIT_INDEX], axis=2)
+            self.values[rows] += VALUE_OF_BIT[placed]
+            self.masks[rows] = np.where(placed != 0, 0, masks[applied] & ~eliminated)
+
+    def get_count_strategies(self):
+        """
+        :return: for each sudoku, dictionary with stats of the strategies used, as in SudokuSolver
+        """
+        return [
+            {
+                strategy: [int(nb_calls), int(nb_found)]
+                for strategy, nb_calls, nb_found in zip(STRATEGIES, calls, found)
+            }
+            for calls, found in zip(self.calls, self.found)
+        ]
+
+    def to_sudokus(self):
+        """
+        :return: the current state of the sudokus as Sudoku objects
+        """
+        sudokus = []
+        for values in self.values:
+            sudoku = Sudoku()
+            for index in np.flatnonzero(values):
+                sudoku.set_value_at(int(index), int(values[index]))
+            sudokus.append(sudoku)
+        return sudokus
+
+    def solve(self, fallback=True, backtracking=False):
+        """
+        Solve the sudokus with the vectorized singles, then with SudokuSolver if needed
+
+        :param fallback: give the sudokus the singles cannot finish to SudokuSolver
+        :param backtracking: let SudokuSolver finish the sudokus with a search when it is stuck
+        :return: list of the sudokus in their final state, and list of their strategy stats
+        """
+        self.solve_singles()
+        sudokus = self.to_sudokus()
+        count_strategies = self.get_count_strategies()
+        if fallback:
+            for sudoku, stats in zip(sudokus, count_strategies):
+                if sudoku.is_sudoku_solved() or sudoku.is_impossible():
+                    continue
+                solver = SudokuSolver(sudoku, backtracking=backtracking)
+                solver.solve()
+                for strategy, counts in solver.count_strategies.items():
+                    total = stats.setdefault(strategy, [0, 0])
+                    total[0] += counts[0]
+                    total[1] += counts[1]
+        return sudokus, count_strategies
@@ -1,13 +1,127 @@
 import logging
-from sudoku import Sudoku
+import mmap
+import os
+from sudoku import BOX_SIZE, NB_CELLS, VALUE_CHARS, Sudoku, get_geometry
+
+# value of each character of a sudoku line, 0 for a blank
+CHAR_VALUES = {char: value for value, char in enumerate(VALUE_CHARS)}
+CHAR_VALUES.update((char.lower(), value) for char, value in list(CHAR_VALUES.items()))
+CHAR_VALUES["0"] = 0
 
 class SudokuParser:
     @staticmethod
-    def parse_sudoku(sudoku_file):
-        logging.debug("Parsing sudoku from file " + sudoku_file)
-        sudoku = Sudoku()
+    def place_given(sudoku, row, col, value):
+        """
+        :raise ValueError: if the cell or the value is out of the grid,
+            or the value is already given in the row, the column or the square
+        """
+        size = sudoku.geometry.size
+        if not (0 <= row < size and 0 <= col < size and 1 <= value <= size):
+            raise ValueError(f"Invalid given {value} at row {row + 1}, column {col + 1}")
+        if not sudoku.set_value(row, col, value):
+            raise ValueError(
+                f"The given {value} at row {row + 1}, column {col + 1} conflicts with another given"
+            )
+
+    @staticmethod
+    def parse_sudoku(sudoku_file, box_size=BOX_SIZE):
+        """
+        :param sudoku_file: path of a file with one row,col,value given per line, from 1
+        :param box_size: number of rows and columns of a box
+        :return: the parsed sudoku
+        :raise ValueError: if a line is malformed, or a given conflicts with another one
+        """
+        logging.debug("Parsing sudoku from file %s", sudoku_file)
+        sudoku = Sudoku(box_size)
         with open(sudoku_file) as f:
             for line in f:
                 row, col, value = line.split(",")
-                sudoku.set_value(int(row) - 1, int(col) - 1, int(value.strip()))
-        return sudoku
\ No newline at end of file
+                SudokuParser.place_given(sudoku, int(row) - 1, int(col) - 1, int(value.strip()))
+        return sudoku
+
+    @staticmethod
+    def parse_sudoku_string(line, box_size=BOX_SIZE):
+        """
+        Parse a sudoku written on one line: 81 values in latin reading order, with . or 0 for the blanks
+
+        :param line: the sudoku line, with letters for the values after 9 in the bigger grids
+        :param box_size: number of rows and columns of a box, 4 for a 16x16 grid...
+        :return: the parsed sudoku
+        :raise ValueError: if the line is malformed, or a given conflicts with another one
+        """
+        return SudokuParser.make_sudoku(SudokuParser.parse_values(line, box_size), box_size)
+
+    @staticmethod
+    def make_sudoku(values, box_size=BOX_SIZE):
+        """
+        :param values: the values of a puzzle in latin reading order, 0 for an empty cell
+        :param box_size: number of rows and columns of a box
+        :return: the sudoku with these values given
+        :raise ValueError: if a given conflicts with another one
+        """
+        sudoku = Sudoku(box_size)
+        size = sudoku.geometry.size
+        for index, value in enumerate(values):
+            if value:
+                SudokuParser.place_given(sudoku, index // size, index % size, value)
+        return sudoku
+
+    @staticmethod
+    def parse_values(line, box_size=BOX_SIZE):
+        """
+        Read the values of a sudoku written on one line, without building the sudoku
+
+        :param line: the sudoku line, as for parse_sudoku_string
+        :param box_size: number of rows and columns of a box
+        :return: list of the values, 0 for the blanks
+        """
+        geometry = get_geometry(box_size)
+        nb_cells, size = geometry.nb_cells, geometry.size
+        puzzle = line.strip()[:nb_cells]
+        if len(puzzle) != nb_cells:
+            raise ValueError("A sudoku line needs " + str(nb_cells) + " characters")
+        values = [CHAR_VALUES.get(char, -1) for char in puzzle]
+        if not all(0 <= value <= size for value in values):
+            raise ValueError("Invalid character in the sudoku line")
+        return values
+
+    @staticmethod
+    def iter_sudoku_lines(corpus_file):
+        """
+        Read lazily a corpus with one sudoku per line, optionally followed by its solution
+        (separated by nothing, a space, a comma, a colon or a semicolon).
+        Empty lines and lines starting with # are skipped. The bytes that are not ASCII are read
+        as U+FFFD, so that only their puzzle is invalid when parsed.
+        The file is memory-mapped, so only the pages being read are loaded
+
+        :param corpus_file: path of the corpus
+        :return: generator of (line number, puzzle, solution), solution being None when absent
+        """
+        logging.debug("Reading sudoku corpus %s", corpus_file)
+        with open(corpus_file, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if hasattr(mmap, "MADV_SEQUENTIAL"):
+                    data.madvise(mmap.MADV_SEQUENTIAL)
+                for line_number, line in enumerate(iter(data.readline, b""), 1):
+                    line = line.strip()
+                    if not line or line.startswith(b"#"):
+                        continue
+                    puzzle = line[:NB_CELLS].decode("ascii", errors="replace")
+                    rest = line[NB_CELLS:].lstrip(b" ,:;\t")
+                    solution = None
+                    if len(rest) >= NB_CELLS:
+                        solution = rest[:NB_CELLS].decode("ascii", errors="replace")
+                    yield line_number, puzzle, solution
+
+    @staticmethod
+    def iter_sudokus(corpus_file):
+        """
+        Parse lazily the sudokus of a corpus with one sudoku per line, see iter_sudoku_lines
+
+        :param corpus_file: path of the corpus
+        :return: generator of the parsed sudokus
+        """
+        for _, puzzle, _ in SudokuParser.iter_sudoku_lines(corpus_file):
+            yield SudokuParser.parse_sudoku_string(puzzle)
@@ -0,0 +1,166 @@
+import sys
+import time
+from itertools import islice
+
+from sudoku import GEOMETRY, PEERS, get_geometry_of_cells
+
+DEFAULT_SOLUTION_LIMIT = 2
+# search nodes between two reads of the clock, when the search has a deadline
+DEADLINE_CHECK_NODES = 64
+
+
+class SearchLimitReached(Exception):
+    """
+    Raised by iter_solutions when the search goes over its number of nodes or its deadline
+    """
+
+
+def assign(masks, values, index, value, peers=PEERS):
+    """
+    Place a value and propagate it: the value is removed from the peers of the cell,
+    and the peers left with a single candidate are placed in turn
+
+    :param masks: list of the 81 candidate bitmasks, updated in place
+    :param values: list of the 81 values, updated in place
+    :param index: flat index of the cell (0-80)
+    :param value: value to place (1-9)
+    :param peers: peers of each cell, GridGeometry.peers for another grid size than 9x9
+    :return: False if a contradiction was found, True otherwise
+    """
+    stack = [(index, value)]
+    while stack:
+        index, value = stack.pop()
+        if values[index]:
+            if values[index] != value:
+                return False
+            continue
+        bit = 1 << (value - 1)
+        if not masks[index] & bit:
+            return False
+        masks[index] = 0
+        values[index] = value
+        for peer in peers[index]:
+            mask = masks[peer]
+            if mask & bit:
+                mask ^= bit
+                masks[peer] = mask
+                if not mask:
+                    return False
+                if not mask & (mask - 1):
+                    stack.append((peer, mask.bit_length()))
+    return True
+
+
+def assign_hidden_singles(masks, values, geometry=GEOMETRY):
+    """
+    Place the values that have only one possible cell left in a unit, until there are none
+
+    :param masks: list of the 81 candidate bitmasks, updated in place
+    :param values: list of the 81 values, updated in place
+    :param geometry: GridGeometry of the grid
+    :return: False if a contradiction was found, True otherwise
+    """
+    all_candidates, peers = geometry.all_candidates, geometry.peers
+    changed = True
+    while changed:
+        changed = False
+        for unit in geometry.units:
+            once = more = placed = 0
+            for index in unit:
+                mask = masks[index]
+                more |= once & mask
+                once |= mask
+                if values[index]:
+                    placed |= 1 << (values[index] - 1)
+            if once | placed != all_candidates:
+                return False
+            single = once & ~more
+            while single:
+                bit = single & -single
+                single ^= bit
+                for index in unit:
+                    if masks[index] & bit:
+                        if not assign(masks, values, index, bit.bit_length(), peers):
+                            return False
+                        changed = True
+                        break
+    return True
+
+
+def iter_solutions(masks, values, max_nodes=None, deadline=None):
+    """
+    Depth first search of the solutions of a grid, starting from its current candidates.
+    Each step branches on the empty cell with the fewest candidates, and propagates the
+    single candidates before going deeper
+
+    :param masks: the candidate bitmasks, as in Sudoku.masks, of a grid of any size
+    :param values: the values, 0 for an empty cell
+    :param max_nodes: number of search nodes after which SearchLimitReached is raised,
+        None for no limit
+    :param deadline: time.time() after which SearchLimitReached is raised, checked every
+        DEADLINE_CHECK_NODES nodes, None for no deadline
+    :return: generator of the solutions, as lists of the values
+    """
+    geometry = get_geometry_of_cells(len(masks))
+    masks, values = list(masks), list(values)
+    for index in range(geometry.nb_cells):
+        mask = masks[index]
+        if not values[index] and not mask:
+            return
+        if mask and not mask & (mask - 1):
+            if not assign(masks, values, index, mask.bit_length(), geometry.peers):
+                return
+    # nodes left to search and deadline, in a list to be shared by the recursive calls
+    budget = [sys.maxsize if max_nodes is None else max_nodes, deadline]
+    yield from _search(masks, values, geometry, budget)
+
+
+def count_solutions(masks, values, limit=DEFAULT_SOLUTION_LIMIT, max_nodes=None, deadline=None):
+    """
+    Count the solutions of a grid from its current candidates, stopping the search at a limit.
+    With the default limit, tells apart the grids without solution, with a unique one
+    and with several ones
+
+    :param masks: the candidate bitmasks, as in Sudoku.masks, of a grid of any size
+    :param values: the values, 0 for an empty cell
+    :param limit: number of solutions after which the search stops
+    :param max_nodes: number of search nodes after which the search gives up, None for no limit
+    :param deadline: time.time() after which the search gives up, None for no deadline
+    :return: number of solutions, at most limit, or None if the search gave up
+    """
+    try:
+        solutions = iter_solutions(masks, values, max_nodes, deadline)
+        return sum(1 for _ in islice(solutions, limit))
+    except SearchLimitReached:
+        return None
+
+
+def _search(masks, values, geometry, budget):
+    budget[0] -= 1
+    if budget[0] < 0 or (
+        budget[1] is not None
+        and not budget[0] % DEADLINE_CHECK_NODES
+        and time.time() > budget[1]
+    ):
+        raise SearchLimitReached
+    if not assign_hidden_singles(masks, values, geometry):
+        return
+    best, best_count = -1, geometry.nb_cells
+    for index in range(geometry.nb_cells):
+        mask = masks[index]
+        if mask:
+            count = mask.bit_count()
+            if count < best_count:
+                best, best_count = index, count
+                if count == 2:
+                    break
+    if best < 0:
+        yield values
+        return
+    mask = masks[best]
+    while mask:
+        low_bit = mask & -mask
+        mask ^= low_bit
+        new_masks, new_values = masks[:], values[:]
+        if assign(new_masks, new_values, best, low_bit.bit_length(), geometry.peers):
+            yield from _search(new_masks, new_values, geometry, budget)
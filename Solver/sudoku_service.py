@@ -0,0 +1,568 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from sudoku import BOX_SIZE, MAX_BOX_SIZE, MIN_BOX_SIZE
+from sudoku_batch import (
+    STATUS_ERROR,
+    STATUS_TIMEOUT,
+    STATUS_UNSOLVED,
+    check_status,
+    get_status,
+)
+from sudoku_human_solver import SudokuSolver
+from sudoku_parser import SudokuParser
+
+STATUS_BUSY = "busy"
+STATUS_CANCELLED = "cancelled"
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_BATCH_DELAY = 0.002  # seconds a batch waits for more requests once it has one
+DEFAULT_MAX_PENDING = 1024
+DEFAULT_TIMEOUT = 10.0
+MAX_TIMEOUT = 300.0
+MAX_BODY_SIZE = 1 << 20  # bytes of an HTTP request body
+
+# HTTP status of the answers to POST /solve, 200 for the other statuses
+HTTP_STATUSES = {STATUS_ERROR: 400, STATUS_BUSY: 503, STATUS_TIMEOUT: 504}
+HTTP_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Content Too Large",
+    503: "Service Unavailable",
+    504: "Gateway Timeout",
+}
+
+
+class DeadlineSolver(SudokuSolver):
+    """
+    SudokuSolver giving up once a deadline is over, checked before each pass of the strategies
+    and during the backtracking search
+
+    Attributes:
+    - deadline: time.time() after which the solve stops
+    """
+
+    def __init__(self, sudoku, deadline, **kwargs):
+        super().__init__(sudoku, **kwargs)
+        self.deadline = deadline
+
+    def is_late(self):
+        return time.time() > self.deadline
+
+    def stop(self):
+        return super().stop() or self.is_late()
+
+    def get_deadline(self):
+        return self.deadline
+
+
+def make_job(message, timeout=DEFAULT_TIMEOUT):
+    """
+    Check a solve request and add its deadline
+
+    :param message: decoded JSON object with the puzzle on one line, and optionally its box_size,
+        backtracking, check (count the solutions first) and timeout in seconds
+    :param timeout: timeout of the requests without one
+    :return: dictionary with the puzzle, box_size, backtracking, check, timeout and deadline
+    :raise ValueError: if the request is malformed, the puzzle itself is checked when parsed
+    """
+    if not isinstance(message, dict):
+        raise ValueError("A request must be a JSON object")
+    puzzle = message.get("puzzle")
+    if not isinstance(puzzle, str):
+        raise ValueError("The puzzle must be a string")
+    box_size = message.get("box_size", BOX_SIZE)
+    if not isinstance(box_size, int) or not MIN_BOX_SIZE <= box_size <= MAX_BOX_SIZE:
+        raise ValueError(f"The box size must be between {MIN_BOX_SIZE} and {MAX_BOX_SIZE}")
+    timeout = message.get("timeout", timeout)
+    if not isinstance(timeout, (int, float)) or not 0 < timeout <= MAX_TIMEOUT:
+        raise ValueError(f"The timeout must be a number of seconds up to {MAX_TIMEOUT}")
+    return {
+        "puzzle": puzzle,
+        "box_size": box_size,
+        "backtracking": bool(message.get("backtracking", False)),
+        "check": bool(message.get("check", False)),
+        "timeout": timeout,
+        "deadline": time.time() + timeout,
+    }
+
+
+def solve_request(job):
+    """
+    Solve one puzzle, in a worker process
+
+    :param job: dictionary built by make_job
+    :return: dictionary with the status, values and strategy stats of the puzzle,
+        or with the error of a puzzle that could not be parsed
+    """
+    if time.time() > job["deadline"]:
+        return {"status": STATUS_TIMEOUT}
+    try:
+        sudoku = SudokuParser.parse_sudoku_string(job["puzzle"], job["box_size"])
+    except ValueError as e:
+        return {"status": STATUS_ERROR, "error": str(e)}
+    status = check_status(sudoku, job["deadline"]) if job["check"] else None
+    if status is not None:
+        return {"status": status, "values": sudoku.to_string(), "strategies": {}}
+    solver = DeadlineSolver(sudoku, job["deadline"], backtracking=job["backtracking"])
+    solver.solve()
+    status = get_status(sudoku)
+    if status == STATUS_UNSOLVED and solver.is_late():
+        status = STATUS_TIMEOUT
+    return {"status": status, "values": sudoku.to_string(), "strategies": solver.count_strategies}
+
+
+def solve_requests(jobs):
+    """
+    Solve a micro-batch of puzzles in a worker process, one round trip for all of them
+
+    :param jobs: list of dictionaries built by make_job
+    :return: list of the results of solve_request
+    """
+    return [solve_request(job) for job in jobs]
+
+
+class SolveService:
+    """
+    Local solve service: requests come from an asyncio front end, wait in a bounded queue, and are
+    sent to a process pool in micro-batches. A connection speaks HTTP (POST /solve with a JSON
+    request or a list of them, GET /health) or, when its first line is a JSON object,
+    the line protocol: one JSON request per line, the answers in the order they are ready,
+    tagged with the id of the request, or its line number. {"cancel": id} cancels a request
+    of the connection.
+
+    Backpressure: with the queue full, an HTTP request is answered busy (503) at once,
+    while a line connection is no longer read until the queue has room again.
+    A request not answered in its timeout is answered timeout; if it was not sent to a worker yet
+    it never is, otherwise the worker stops at its next pass of the strategies,
+    or within a few nodes of its backtracking search or solution count
+
+    Attributes:
+    - workers: number of worker processes
+    - batch_size: maximum number of requests sent to a worker at once
+    - batch_delay: seconds a batch waits for more requests once it has one
+    - timeout: timeout in seconds of the requests without one
+    - queue: (job, future) of the requests waiting for a worker, bounded to max_pending
+    - slots: semaphore of the batches in progress, twice the number of workers
+    - executor: ProcessPoolExecutor of the workers, while the service is started
+    - stats: counts of the requests received, rejected as busy, timed out, cancelled,
+        dropped before reaching a worker and dispatched to the workers, of the batches,
+        and of the restarts of the workers after one of them died
+    """
+
+    def __init__(
+        self,
+        workers=None,
+        batch_size=DEFAULT_BATCH_SIZE,
+        batch_delay=DEFAULT_BATCH_DELAY,
+        max_pending=DEFAULT_MAX_PENDING,
+        timeout=DEFAULT_TIMEOUT,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.timeout = timeout
+        self.queue = asyncio.Queue(max_pending)
+        self.slots = asyncio.Semaphore(2 * self.workers)
+        self.executor = None
+        self.stats = dict.fromkeys(
+            (
+                "received",
+                "rejected",
+                "timeouts",
+                "cancelled",
+                "dropped",
+                "dispatched",
+                "batches",
+                "restarts",
+            ),
+            0,
+        )
+        self._dispatcher = None
+        self._servers = []
+        self._batch_tasks = set()
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def start(self):
+        """
+        Start the workers and the dispatch of the queued requests, from the event loop
+        """
+        self.executor = self.make_executor()
+        self._dispatcher = asyncio.get_running_loop().create_task(self.dispatch())
+
+    def make_executor(self):
+        # forked workers would inherit the sockets of the connections open at the time,
+        # which would then stay open after the service closes them
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        return ProcessPoolExecutor(self.workers, mp_context=context)
+
+    def replace_executor(self, broken):
+        """
+        Start new workers in place of a pool broken by the death of a worker
+
+        :param broken: the broken executor, already replaced if it is no longer the current one
+        """
+        if self.executor is broken:
+            logging.error("A worker process died, starting new workers")
+            self.stats["restarts"] += 1
+            self.executor = self.make_executor()
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """
+        :param port: TCP port to listen on, 0 for any free one
+        :return: the asyncio Server, see server.sockets for its address
+        """
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        self._servers.append(server)
+        return server
+
+    async def close(self):
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers.clear()
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        for task in list(self._batch_tasks):
+            task.cancel()
+        while not self.queue.empty():
+            _, future = self.queue.get_nowait()
+            future.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def submit(self, job, wait=True):
+        """
+        Queue a request
+
+        :param job: dictionary built by make_job
+        :param wait: wait for room in the queue, otherwise raise asyncio.QueueFull when it is full
+        :return: future of the result of solve_request, cancel it to cancel the request
+        """
+        future = asyncio.get_running_loop().create_future()
+        if wait:
+            await self.queue.put((job, future))
+        else:
+            self.queue.put_nowait((job, future))
+        self.stats["received"] += 1
+        return future
+
+    async def get_result(self, future, job):
+        """
+        :param future: future returned by submit
+        :param job: the submitted job
+        :return: the result of the request, or STATUS_TIMEOUT once its timeout is over
+        """
+        try:
+            return await asyncio.wait_for(future, job["deadline"] - time.time())
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            return {"status": STATUS_TIMEOUT}
+
+    async def solve(self, message, wait=True):
+        """
+        Answer one decoded JSON request
+
+        :param message: request, see make_job
+        :param wait: wait for room in the queue, otherwise answer STATUS_BUSY when it is full
+        :return: the result of the request, with the id of the request if it has one
+        """
+        try:
+            job = make_job(message, self.timeout)
+        except ValueError as e:
+            result = {"status": STATUS_ERROR, "error": str(e)}
+        else:
+            try:
+                future = await self.submit(job, wait)
+            except asyncio.QueueFull:
+                self.stats["rejected"] += 1
+                result = {"status": STATUS_BUSY}
+            else:
+                result = await self.get_result(future, job)
+        if isinstance(message, dict) and "id" in message:
+            result = {"id": message["id"], **result}
+        return result
+
+    async def dispatch(self):
+        """
+        Send the queued requests to the workers in batches, for as long as the service runs.
+        A batch is only formed once a worker slot is free, so the requests pile up in the queue,
+        and make bigger batches, while the workers are busy
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.slots.acquire()
+            batch = [await self.queue.get()]
+            end = loop.time() + self.batch_delay
+            while len(batch) < self.batch_size:
+                if self.queue.empty():
+                    delay = end - loop.time()
+                    if delay <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), delay))
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    batch.append(self.queue.get_nowait())
+            # the requests cancelled or timed out while queued are dropped
+            self.stats["dropped"] += sum(1 for _, future in batch if future.done())
+            batch = [(job, future) for job, future in batch if not future.done()]
+            if not batch:
+                self.slots.release()
+                continue
+            self.stats["dispatched"] += len(batch)
+            self.stats["batches"] += 1
+            task = loop.create_task(self.run_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def run_batch(self, batch):
+        try:
+            loop = asyncio.get_running_loop()
+            jobs = [job for job, _ in batch]
+            executor = self.executor
+            try:
+                try:
+                    future = loop.run_in_executor(executor, solve_requests, jobs)
+                except BrokenProcessPool:
+                    # broken by an earlier batch, this one runs on new workers
+                    self.replace_executor(executor)
+                    executor = self.executor
+                    future = loop.run_in_executor(executor, solve_requests, jobs)
+                results = await future
+            except BrokenProcessPool as e:
+                # a worker died during this batch: the batch fails, not the next ones
+                self.replace_executor(executor)
+                results = [{"status": STATUS_ERROR, "error": f"Worker died: {e}"}] * len(batch)
+            except Exception as e:
+                logging.exception("Batch of %d requests failed", len(batch))
+                results = [{"status": STATUS_ERROR, "error": str(e)}] * len(batch)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self.slots.release()
+
+    def get_health(self):
+        return {
+            "workers": self.workers,
+            "queued": self.queue.qsize(),
+            "batches_in_progress": len(self._batch_tasks),
+            **self.stats,
+        }
+
+    async def handle_connection(self, reader, writer):
+        try:
+            first_line = await reader.readline()
+            if first_line.lstrip().startswith(b"{"):
+                await self.serve_lines(first_line, reader, writer)
+            elif first_line.strip():
+                await self.serve_http(first_line, reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_lines(self, line, reader, writer):
+        """
+        Line protocol: each request is answered as soon as it is solved, while the next lines
+        are read. Waiting for room in the queue stops the reading, which pushes back on the client
+        """
+        # tasks of the requests not answered yet, by JSON encoded id
+        pending = {}
+        line_number = 0
+        while line:
+            line_number += 1
+            if line.strip():
+                await self.read_line(line, line_number, pending, writer)
+            line = await reader.readline()
+        # end of the requests, the answers still due are sent before closing
+        if pending:
+            await asyncio.wait(list(pending.values()))
+        await writer.drain()
+
+    async def read_line(self, line, line_number, pending, writer):
+        try:
+            message = json.loads(line)
+            if not isinstance(message, dict):
+                raise ValueError("A request must be a JSON object")
+        except ValueError as e:
+            self.write_line(writer, {"id": line_number, "status": STATUS_ERROR, "error": str(e)})
+            return
+        if "cancel" in message:
+            task = pending.get(json.dumps(message["cancel"]))
+            if task is not None:
+                task.cancel()
+                self.stats["cancelled"] += 1
+                self.write_line(writer, {"id": message["cancel"], "status": STATUS_CANCELLED})
+            return
+        request_id = message.get("id", line_number)
+        try:
+            job = make_job(message, self.timeout)
+        except ValueError as e:
+            self.write_line(writer, {"id": request_id, "status": STATUS_ERROR, "error": str(e)})
+            return
+        future = await self.submit(job)
+        key = json.dumps(request_id)
+        task = asyncio.get_running_loop().create_task(
+            self.answer_line(future, job, request_id, writer)
+        )
+        pending[key] = task
+        task.add_done_callback(lambda _: pending.pop(key, None))
+
+    async def answer_line(self, future, job, request_id, writer):
+        result = await self.get_result(future, job)
+        self.write_line(writer, {"id": request_id, **result})
+        await writer.drain()
+
+    @staticmethod
+    def write_line(writer, result):
+        if not writer.is_closing():
+            writer.write(json.dumps(result).encode() + b"\n")
+
+    async def serve_http(self, request_line, reader, writer):
+        """
+        Minimal HTTP/1.1: one request at a time on a connection, kept alive unless asked otherwise
+        """
+        while request_line.strip():
+            try:
+                method, target, version = request_line.decode("latin-1").split()
+            except ValueError:
+                response = {"status": STATUS_ERROR, "error": "Bad request line"}
+                await self.write_http(writer, 400, response, False)
+                return
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            length = headers.get("content-length", "0")
+            if not (length.isascii() and length.isdigit()):
+                response = {"status": STATUS_ERROR, "error": "Invalid Content-Length"}
+                await self.write_http(writer, 400, response, False)
+                return
+            if int(length) > MAX_BODY_SIZE:
+                response = {"status": STATUS_ERROR, "error": f"Body over {MAX_BODY_SIZE} bytes"}
+                await self.write_http(writer, 413, response, False)
+                return
+            body = await reader.readexactly(int(length))
+            code, response = await self.handle_http(method, target.split("?")[0], body)
+            keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+            await self.write_http(writer, code, response, keep_alive)
+            if not keep_alive:
+                return
+            request_line = await reader.readline()
+
+    async def handle_http(self, method, path, body):
+        """
+        :return: HTTP status code and JSON body of the answer
+        """
+        if path == "/health":
+            if method != "GET":
+                return 405, {"status": STATUS_ERROR, "error": "Use GET"}
+            return 200, self.get_health()
+        if path != "/solve":
+            return 404, {"status": STATUS_ERROR, "error": f"Unknown path {path}"}
+        if method != "POST":
+            return 405, {"status": STATUS_ERROR, "error": "Use POST"}
+        try:
+            message = json.loads(body)
+        except ValueError as e:
+            return 400, {"status": STATUS_ERROR, "error": f"Invalid JSON: {e}"}
+        if isinstance(message, list):
+            # each request of a list is answered on its own, busy ones included
+            return 200, list(await asyncio.gather(*(self.solve(item, False) for item in message)))
+        result = await self.solve(message, False)
+        return HTTP_STATUSES.get(result["status"], 200), result
+
+    @staticmethod
+    async def write_http(writer, code, response, keep_alive):
+        body = json.dumps(response).encode()
+        head = (
+            f"HTTP/1.1 {code} {HTTP_REASONS[code]}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+
+async def run_service(args):
+    service = SolveService(
+        args.workers, args.batch_size, args.batch_delay, args.max_pending, args.timeout
+    )
+    async with service:
+        server = await service.serve(args.host, args.port)
+        address = server.sockets[0].getsockname()
+        logging.info(
+            "Solve service on %s:%s, %s workers", address[0], address[1], service.workers
+        )
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Local solve service: JSON requests over HTTP (POST /solve) or one per line"
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST, help="address to listen on")
+    parser.add_argument("-p", "--port", type=int, default=DEFAULT_PORT, help="port to listen on")
+    parser.add_argument(
+        "-w", "--workers", type=int, default=None, help="number of worker processes"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="requests sent to a worker at once",
+    )
+    parser.add_argument(
+        "--batch-delay",
+        type=float,
+        default=DEFAULT_BATCH_DELAY,
+        help="seconds a batch waits for more requests",
+    )
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        default=DEFAULT_MAX_PENDING,
+        help="requests waiting for a worker before the service pushes back",
+    )
+    parser.add_argument(
+        "-t", "--timeout", type=float, default=DEFAULT_TIMEOUT, help="default timeout in seconds"
+    )
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(run_service(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -1,7 +1,85 @@
+import asyncio
+import contextlib
+import glob
+import io
+import json
+import os
+import random
+import tempfile
+import time
 import unittest
-from sudoku import Sudoku
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from unittest import mock
+from sudoku import (
+    CELL_UNITS,
+    GEOMETRY,
+    PEERS,
+    UNITS,
+    VALUE_CHARS,
+    Sudoku,
+    candidates_from_mask,
+    get_geometry,
+)
 from sudoku_parser import SudokuParser
+from sudoku_background import BackgroundSolve
+from sudoku_cache import SolveCache
+from sudoku_canonical import SymmetryTransform, canonical_form
 from sudoku_human_solver import SudokuSolver
+from sudoku_instrumentation import SolverInstrumentation
+from sudoku_trace import (
+    EVENT_ELIMINATION,
+    EVENT_PLACEMENT,
+    EVENT_STRATEGY_END,
+    EVENT_STRATEGY_START,
+    SolveTrace,
+)
+from sudoku_batch import solve_batch, solve_job
+from sudoku_binary import (
+    PART_GIVENS,
+    PART_SOLUTION,
+    PART_STATE,
+    BinaryCorpus,
+    pack_masks,
+    pack_state,
+    pack_values,
+    unpack_masks,
+    unpack_state,
+    unpack_values,
+    write_records,
+)
+from sudoku_binary import main as binary_main
+from sudoku_dedup import DedupIndex, iter_deduplicated
+from sudoku_grading import TIERS, get_score, get_tier, grade, grade_batch
+from sudoku_dedup import main as dedup_main
+from sudoku_generator import (
+    SYMMETRY_ROTATIONAL,
+    generate_batch,
+    generate_puzzle,
+    has_other_solution,
+    random_solution,
+)
+from sudoku_search import SearchLimitReached, count_solutions, iter_solutions
+from sudoku_service import (
+    MAX_BODY_SIZE,
+    DeadlineSolver,
+    SolveService,
+    make_job,
+    solve_request,
+)
+from sudoku_benchmark import (
+    compare,
+    load_corpus,
+    load_directory,
+    run_benchmark,
+    summarize,
+    time_solve,
+)
+
+try:
+    from sudoku_numpy import NumpySinglesSolver
+except ImportError:
+    NumpySinglesSolver = None
 
 
 class BasicRules(unittest.TestCase):
@@ -49,6 +127,93 @@ class BasicRules(unittest.TestCase):
         new_sudoku.set_value(1, 8, 9)
         self.assertTrue(new_sudoku.is_impossible())
 
+    def test_candidates_mask(self):
+        new_sudoku = Sudoku()
+        new_sudoku.set_value(0, 0, 1)
+        new_sudoku.set_value(1, 1, 5)
+        cell = new_sudoku.cells[0][1]
+        self.assertEqual((2, 3, 4, 6, 7, 8, 9), cell.candidates)
+        self.assertEqual(7, cell.nb_remaining_candidates())
+        self.assertEqual(0, new_sudoku.cells[0][0].nb_remaining_candidates())
+        self.assertEqual((1, 9), candidates_from_mask(0b100000001))
+
+    def test_index_tables(self):
+        self.assertEqual(27, len(UNITS))
+        self.assertTrue(all(len(peers) == 20 for peers in PEERS))
+        self.assertEqual((0, 9, 18), CELL_UNITS[0])
+        self.assertEqual((4, 13, 22), CELL_UNITS[40])
+        self.assertIn(10, PEERS[0])
+        self.assertNotIn(0, PEERS[0])
+        self.assertNotIn(40, PEERS[0])
+
+    def test_cell_position(self):
+        new_sudoku = Sudoku()
+        cell = new_sudoku.cells[4][7]
+        self.assertEqual((4, 7), (cell.row, cell.col))
+        self.assertEqual((4, 7), new_sudoku.get_position_from_cell(cell))
+        self.assertTrue(new_sudoku.set_value_at(4 * 9 + 7, 3))
+        self.assertEqual(3, cell.value)
+
+    def test_snapshot_and_restore(self):
+        new_sudoku = Sudoku()
+        new_sudoku.set_value(0, 0, 1)
+        snapshot = new_sudoku.snapshot()
+        cell = new_sudoku.cells[0][1]
+        for i in range(1, 8):
+            new_sudoku.set_value(0, i, i + 1)
+        new_sudoku.set_value(1, 8, 9)
+        self.assertTrue(new_sudoku.is_impossible())
+        new_sudoku.restore(snapshot)
+        self.assertEqual(snapshot, new_sudoku.snapshot())
+        self.assertEqual(80, new_sudoku.nb_unsolved)
+        self.assertFalse(new_sudoku.is_impossible())
+        self.assertIsNone(cell.value)
+        self.assertEqual((2, 3, 4, 5, 6, 7, 8, 9), cell.candidates)
+
+    def test_solver_rescans_after_restore(self):
+        sudoku = SudokuParser.parse_sudoku("example_sudoku/sudoku_master_1.csv")
+        snapshot = sudoku.snapshot()
+        solver = SudokuSolver(sudoku)
+        solver.solve()
+        solution = sudoku.to_string()
+        sudoku.restore(snapshot)
+        solver.solve()
+        self.assertEqual(solution, sudoku.to_string())
+
+    def test_clone(self):
+        sudoku = SudokuParser.parse_sudoku("example_sudoku/sudoku_easy_1.csv")
+        clone = sudoku.clone()
+        self.assertEqual(sudoku.snapshot(), clone.snapshot())
+        SudokuSolver(clone).solve()
+        self.assertTrue(clone.is_sudoku_solved())
+        self.assertFalse(sudoku.is_sudoku_solved())
+        self.assertEqual(clone.to_string(), clone.clone().to_string())
+
+    def test_changed_rows(self):
+        sudoku = Sudoku()
+        seen = [None] * 9
+        self.assertEqual(list(range(9)), sudoku.get_changed_rows(seen))
+        self.assertEqual([], sudoku.get_changed_rows(seen))
+        # the value is removed from the candidates of its column, in every row
+        sudoku.set_value(1, 4, 5)
+        self.assertEqual(list(range(9)), sudoku.get_changed_rows(seen))
+        sudoku.cells[6][0].remove_candidate(3)
+        sudoku.cells[6][0].remove_candidate(3)
+        self.assertEqual([6], sudoku.get_changed_rows(seen))
+        sudoku.restore(Sudoku().snapshot())
+        self.assertEqual(list(range(9)), sudoku.get_changed_rows(seen))
+
+    def test_solved_and_impossible_counters(self):
+        new_sudoku = Sudoku()
+        self.assertEqual(81, new_sudoku.nb_unsolved)
+        for i in range(8):
+            new_sudoku.set_value(0, i, i + 1)
+        self.assertEqual(73, new_sudoku.nb_unsolved)
+        self.assertFalse(new_sudoku.is_impossible())
+        new_sudoku.cells[0][8].remove_candidate(9)
+        self.assertEqual(1, new_sudoku.nb_empty)
+        self.assertTrue(new_sudoku.is_impossible())
+
 
 class SolverStrategies(unittest.TestCase):
     def test_only_one_candidate(self):
@@ -97,6 +262,36 @@ class SolverStrategies(unittest.TestCase):
         self.assertTrue(is_ok)
         self.assertEqual(9, new_sudoku.cells[2][2].value)
 
+    def test_unchanged_units_are_skipped(self):
+        sudoku = SudokuParser.parse_sudoku("example_sudoku/sudoku_easy_1.csv")
+        solver = SudokuSolver(sudoku)
+        self.assertEqual(9, len(list(solver.get_dirty_units("test", range(9)))))
+        self.assertEqual([], list(solver.get_dirty_units("test", range(9))))
+        sudoku.set_value(2, 0, 6)
+        self.assertEqual([1, 2], list(solver.get_dirty_units("test", range(9))))
+        self.assertEqual(1, sudoku.remove_candidate_at(sudoku.cells[0][1].candidates[0], [1]))
+        self.assertEqual([0], list(solver.get_dirty_units("test", range(9))))
+
+    def test_solve_stats_stay_the_same(self):
+        sudoku = SudokuParser.parse_sudoku("example_sudoku/sudoku_master_1.csv")
+        solver = SudokuSolver(sudoku)
+        solver.solve()
+        self.assertTrue(sudoku.is_sudoku_solved())
+        self.assertEqual([16, 47], solver.count_strategies["Only one candidate"])
+        self.assertEqual([5, 4], solver.count_strategies["Only position in row"])
+        self.assertEqual([1, 4], solver.count_strategies["Pointing and claiming"])
+
+    def test_impossible_sudoku_stops_scanning(self):
+        sudoku = Sudoku()
+        for i in range(8):
+            sudoku.set_value(0, i, i + 1)
+        sudoku.set_value(1, 8, 9)
+        solver = SudokuSolver(sudoku)
+        self.assertEqual([], list(solver.get_dirty_units("test", range(27))))
+        solver.solve()
+        self.assertEqual([0, 0], solver.count_strategies["Only one candidate"])
+
+
 class SolverRemoveCandidates(unittest.TestCase):
     def test_remove_hidden_pair(self):
         sudoku = Sudoku()
@@ -137,18 +332,1006 @@ class SolverRemoveCandidates(unittest.TestCase):
         self.assertNotIn(5, sudoku.cells[0][2].candidates)
         self.assertNotIn(6, sudoku.cells[0][2].candidates)
 
+    def test_hidden_triple_with_two_cells_per_candidate(self):
+        # 1, 2 and 3 only fit in the first 3 cells of the first row, two cells each
+        sudoku = Sudoku()
+        for col in range(5, 9):
+            sudoku.set_value(0, col, col + 1)
+        sudoku.set_value(1, 3, 1)
+        sudoku.set_value(1, 4, 2)
+        sudoku.set_value(2, 3, 3)
+        sudoku.set_value(4, 2, 1)
+        sudoku.set_value(5, 0, 2)
+        sudoku.set_value(6, 1, 3)
+
+        solver = SudokuSolver(sudoku)
+        self.assertTrue(solver.hidden_n_tuples())
+        self.assertEqual((1, 3), sudoku.cells[0][0].candidates)
+        self.assertEqual((1, 2), sudoku.cells[0][1].candidates)
+        self.assertEqual((2, 3), sudoku.cells[0][2].candidates)
+
+    def test_max_subset_size(self):
+        sudoku = Sudoku()
+        for col in range(4, 9):
+            sudoku.set_value(0, col, col + 1)
+        sudoku.set_value(3, 0, 1)
+        sudoku.set_value(4, 0, 2)
+        sudoku.set_value(6, 1, 1)
+        sudoku.set_value(7, 1, 2)
+
+        solver = SudokuSolver(sudoku, max_subset_size=1)
+        self.assertFalse(solver.hidden_n_tuples())
+        self.assertIn(3, sudoku.cells[0][3].candidates)
+
+    def test_find_subsets(self):
+        items = [(1, 0b0011), (2, 0b0110), (3, 0b1100), (4, 0b0101)]
+        self.assertEqual(
+            [([1, 2, 4], 0b0111)], list(SudokuSolver.find_subsets(items, 3))
+        )
+        self.assertEqual([], list(SudokuSolver.find_subsets(items, 1)))
+
     def test_remove_naked_row_triple_from_square(self):
         sudoku = Sudoku()
         for col in range(6):
             sudoku.set_value(0, col, col+1)
 
         solver = SudokuSolver(sudoku)
-        solver.naked_n_tuples()
+        solver.pointing_and_claiming()
 
         for candidate in [7, 8, 9]:
             for row in [1, 2]:
                 for col in [6, 7, 8]:
                     self.assertNotIn(candidate, sudoku.cells[row][col].candidates)
 
+    def test_pointing_from_square_to_row(self):
+        sudoku = Sudoku()
+        for i, value in enumerate(range(2, 8)):
+            sudoku.set_value(1 + i // 3, i % 3, value)
+        # 1 can only be in the first row of the first square
+
+        solver = SudokuSolver(sudoku)
+        self.assertTrue(solver.pointing_and_claiming())
+        for col in range(3, 9):
+            self.assertNotIn(1, sudoku.cells[0][col].candidates)
+        self.assertIn(1, sudoku.cells[0][0].candidates)
+        self.assertGreaterEqual(solver.count_strategies["Pointing and claiming"][1], 6)
+
+    def test_remove_naked_pair(self):
+        sudoku = Sudoku()
+        for i, value in enumerate(range(3, 9)):
+            sudoku.set_value(1 + i // 3, 6 + i % 3, value)
+        sudoku.set_value(4, 7, 9)
+        sudoku.set_value(7, 8, 9)
+        # (0, 7) and (0, 8) can only be 1 or 2, so no other cell of the first row can
+
+        solver = SudokuSolver(sudoku)
+        self.assertTrue(solver.naked_n_tuples())
+        self.assertEqual((1, 2), sudoku.cells[0][7].candidates)
+        self.assertEqual((9,), sudoku.cells[0][6].candidates)
+        for col in range(6):
+            self.assertNotIn(1, sudoku.cells[0][col].candidates)
+            self.assertNotIn(2, sudoku.cells[0][col].candidates)
+
+    def test_naked_triple_is_not_a_pair(self):
+        sudoku = Sudoku()
+        for col in range(3, 9):
+            sudoku.set_value(0, col, col + 1)
+        solver = SudokuSolver(sudoku, max_subset_size=2)
+        self.assertFalse(solver.naked_n_tuples())
+
+
+class Backtracking(unittest.TestCase):
+    # AI Escargot, the human strategies get stuck on it
+    escargot = "1....7.9..3..2...8..96..5....53..9...1..8...26....4...3......1..4......7..7...3.."
+
+    def test_stuck_without_backtracking(self):
+        sudoku = SudokuParser.parse_sudoku_string(self.escargot)
+        solver = SudokuSolver(sudoku)
+        solver.solve()
+        self.assertFalse(sudoku.is_sudoku_solved())
+        self.assertEqual([0, 0], solver.count_strategies["Backtracking"])
+
+    def test_backtracking_finishes_the_sudoku(self):
+        sudoku = SudokuParser.parse_sudoku_string(self.escargot)
+        solver = SudokuSolver(sudoku, backtracking=True)
+        solver.solve()
+        self.assertTrue(sudoku.is_sudoku_solved())
+        self.assertTrue(sudoku.to_string().startswith("162857493"))
+        self.assertEqual(1, solver.count_strategies["Backtracking"][0])
+        self.assertGreater(solver.count_strategies["Backtracking"][1], 0)
+
+    def test_no_solution(self):
+        sudoku = Sudoku()
+        for i in range(8):
+            sudoku.set_value(0, i, i + 1)
+        sudoku.set_value(4, 8, 9)
+        self.assertEqual([], list(iter_solutions(sudoku.masks, sudoku.values)))
+
+    def test_solution_matches_givens(self):
+        sudoku = SudokuParser.parse_sudoku("example_sudoku/sudoku_master_1.csv")
+        expected = SudokuParser.parse_sudoku("example_sudoku/sudoku_master_1.csv")
+        SudokuSolver(expected).solve()
+        solutions = list(iter_solutions(sudoku.masks, sudoku.values))
+        self.assertEqual([list(expected.values)], solutions)
+
+    def test_count_solutions(self):
+        sudoku = SudokuParser.parse_sudoku_string(self.escargot)
+        self.assertEqual(1, count_solutions(sudoku.masks, sudoku.values))
+        # without its first given, the sudoku has several solutions
+        sudoku = SudokuParser.parse_sudoku_string("." + self.escargot[1:])
+        self.assertEqual(2, count_solutions(sudoku.masks, sudoku.values))
+        self.assertEqual(5, count_solutions(sudoku.masks, sudoku.values, limit=5))
+        sudoku = Sudoku()
+        for i in range(8):
+            sudoku.set_value(0, i, i + 1)
+        sudoku.set_value(4, 8, 9)
+        self.assertEqual(0, count_solutions(sudoku.masks, sudoku.values))
+
+    def test_max_nodes(self):
+        sudoku = Sudoku(5)
+        self.assertIsNone(count_solutions(sudoku.masks, sudoku.values, max_nodes=10))
+        with self.assertRaises(SearchLimitReached):
+            next(iter_solutions(sudoku.masks, sudoku.values, max_nodes=10))
+        sudoku = SudokuParser.parse_sudoku_string(self.escargot)
+        self.assertEqual(1, count_solutions(sudoku.masks, sudoku.values, max_nodes=1000))
+
+
+class LargeGrids(unittest.TestCase):
+    @staticmethod
+    def make_puzzle(box_size, seed, keep=0.6):
+        """
+        :return: a puzzle string with a share of the clues of a complete grid, and the grid
+        """
+        sudoku = Sudoku(box_size)
+        solution = next(iter_solutions(sudoku.masks, sudoku.values))
+        rng = random.Random(seed)
+        puzzle = "".join(VALUE_CHARS[value] if rng.random() < keep else "." for value in solution)
+        return puzzle, solution
+
+    def test_geometry(self):
+        self.assertIs(GEOMETRY, get_geometry(3))
+        geometry = get_geometry(4)
+        self.assertIs(geometry, get_geometry(4))
+        self.assertEqual((16, 256, 48), (geometry.size, geometry.nb_cells, len(geometry.units)))
+        self.assertTrue(all(len(peers) == 39 for peers in geometry.peers))
+        self.assertEqual("H", geometry.mask_typecode)
+        geometry = get_geometry(5)
+        self.assertTrue(all(len(peers) == 64 for peers in geometry.peers))
+        self.assertEqual("L", geometry.mask_typecode)
+        self.assertEqual((1 << 25) - 1, Sudoku(5).masks[0])
+        with self.assertRaises(ValueError):
+            get_geometry(6)
+
+    def test_parse_and_print(self):
+        puzzle, _ = self.make_puzzle(4, 0)
+        sudoku = SudokuParser.parse_sudoku_string(puzzle.lower(), 4)
+        self.assertEqual(puzzle, sudoku.to_string())
+        self.assertEqual(puzzle, sudoku.clone().to_string())
+        self.assertEqual(16, sudoku.cells[15][15].row + 1)
+        with self.assertRaises(ValueError):
+            SudokuParser.parse_sudoku_string("G" + "." * 80)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            sudoku.print_sudoku()
+        self.assertEqual(16 + 3, len(output.getvalue().splitlines()))
+
+    def test_solve(self):
+        for box_size in (2, 4, 5):
+            puzzle, solution = self.make_puzzle(box_size, box_size)
+            sudoku = SudokuParser.parse_sudoku_string(puzzle, box_size)
+            SudokuSolver(sudoku, backtracking=True).solve()
+            self.assertTrue(sudoku.is_sudoku_solved())
+            for index, char in enumerate(puzzle):
+                if char != ".":
+                    self.assertEqual(solution[index], sudoku.values[index])
+
+    def test_trace_replay(self):
+        puzzle, _ = self.make_puzzle(4, 1)
+        sudoku = SudokuParser.parse_sudoku_string(puzzle, 4)
+        solver = SudokuSolver(sudoku.clone())
+        trace = SolveTrace()
+        trace.attach(solver)
+        solver.solve()
+        trace.detach()
+        SolveTrace.replay(trace, sudoku)
+        self.assertEqual(solver.sudoku.to_string(), sudoku.to_string())
+
+    def test_canonical_form_is_for_9x9_only(self):
+        with self.assertRaises(ValueError):
+            canonical_form(Sudoku(4).values)
+
+
+class Instrumentation(unittest.TestCase):
+    def test_measures_match_the_stats(self):
+        sudoku = SudokuParser.parse_sudoku("example_sudoku/sudoku_master_1.csv")
+        nb_unsolved = sudoku.nb_unsolved
+        solver = SudokuSolver(sudoku)
+        instrumentation = solver.instrument()
+        solver.solve()
+        self.assertTrue(sudoku.is_sudoku_solved())
+        self.assertGreater(instrumentation.iterations, 0)
+        for strategy, stats in instrumentation.strategies.items():
+            self.assertEqual(solver.count_strategies[strategy][0], stats["calls"])
+        total = instrumentation.get_total()
+        self.assertEqual(nb_unsolved, total["placed"])
+        self.assertEqual(solver.nb_units_scanned, total["units_scanned"])
+        self.assertGreater(total["eliminated"], 0)
+
+    def test_same_stats_as_without_instrumentation(self):
+        sudoku = SudokuParser.parse_sudoku("example_sudoku/sudoku_expert_1.csv")
+        solver = SudokuSolver(sudoku)
+        solver.solve()
+        self.assertIsNone(sudoku.hooks)
+        instrumented = SudokuSolver(SudokuParser.parse_sudoku("example_sudoku/sudoku_expert_1.csv"))
+        instrumented.instrument()
+        instrumented.solve()
+        self.assertEqual(solver.count_strategies, instrumented.count_strategies)
+        self.assertEqual(solver.nb_units_scanned, instrumented.nb_units_scanned)
+
+    def test_hooks(self):
+        sudoku = SudokuParser.parse_sudoku("example_sudoku/sudoku_easy_1.csv")
+        nb_unsolved = sudoku.nb_unsolved
+        solver = SudokuSolver(sudoku)
+        instrumentation = solver.instrument()
+        events = []
+        instrumentation.before_strategy.append(lambda solver, strategy: events.append(strategy))
+        instrumentation.after_strategy.append(
+            lambda solver, strategy, found: events.append(found)
+        )
+        placed = []
+        instrumentation.after_set_value.append(
+            lambda sudoku, index, value, is_placed: is_placed and placed.append((index, value))
+        )
+        solver.solve()
+        self.assertEqual("Only one candidate", events[0])
+        self.assertEqual(2 * instrumentation.get_total()["calls"], len(events))
+        self.assertEqual(nb_unsolved, len(placed))
+        self.assertFalse(sudoku.set_value_at(placed[0][0], placed[0][1]))
+        self.assertEqual(nb_unsolved, len(placed))
+
+    def test_count_changes(self):
+        sudoku = Sudoku()
+        masks = sudoku.masks[:]
+        sudoku.set_value(0, 0, 1)
+        sudoku.remove_candidate_at(2, [80])
+        self.assertEqual((1, 1), SolverInstrumentation.count_changes(masks, sudoku))
+
+
+class Trace(unittest.TestCase):
+    def test_trace_replays_the_solve(self):
+        sudoku = SudokuParser.parse_sudoku("example_sudoku/sudoku_master_1.csv")
+        replay = SudokuParser.parse_sudoku("example_sudoku/sudoku_master_1.csv")
+        solver = SudokuSolver(sudoku)
+        trace = SolveTrace()
+        solver.solve(trace=trace)
+        self.assertIsNone(solver.instrumentation)
+        self.assertIsNone(sudoku.hooks)
+        for kind, strategy, index, data in trace:
+            if kind == EVENT_PLACEMENT:
+                self.assertTrue(replay.set_value_at(index, data))
+            elif kind == EVENT_ELIMINATION:
+                self.assertEqual(data.bit_count(), replay.keep_candidates_at(index, ~data))
+        self.assertEqual(sudoku.to_string(), replay.to_string())
+
+    def test_strategy_events(self):
+        sudoku = SudokuParser.parse_sudoku("example_sudoku/sudoku_easy_1.csv")
+        solver = SudokuSolver(sudoku)
+        trace = SolveTrace()
+        solver.solve(trace=trace)
+        events = list(trace)
+        self.assertEqual((EVENT_STRATEGY_START, "Only one candidate", 0, 0), events[0])
+        self.assertEqual(EVENT_STRATEGY_END, events[-1][0])
+        nb_calls = sum(counts[0] for counts in solver.count_strategies.values())
+        self.assertEqual(nb_calls, sum(event[0] == EVENT_STRATEGY_START for event in events))
+        self.assertEqual(len(events), len(trace))
+
+    def test_json_lines_and_explanations(self):
+        sudoku = SudokuParser.parse_sudoku("example_sudoku/sudoku_easy_1.csv")
+        nb_unsolved = sudoku.nb_unsolved
+        trace = SolveTrace()
+        SudokuSolver(sudoku).solve(trace=trace)
+        self.assertEqual(nb_unsolved, len(trace.explain()))
+        self.assertRegex(trace.explain()[0], r"^Only one candidate: \d placed in \(\d, \d\)$")
+        file = io.StringIO()
+        trace.write_json_lines(file)
+        lines = [json.loads(line) for line in file.getvalue().splitlines()]
+        self.assertEqual(len(trace), len(lines))
+        self.assertEqual({"event": "strategy_start", "strategy": "Only one candidate"}, lines[0])
+        self.assertEqual(nb_unsolved, sum(line["event"] == "placement" for line in lines))
+
+
+def transform_puzzle(values):
+    """
+    :return: a grid equivalent to the given one: transposed, with its bands, stacks, rows, columns
+        and digits permuted
+    """
+    rows = [3, 5, 4, 0, 2, 1, 8, 6, 7]
+    cols = [7, 8, 6, 1, 0, 2, 4, 5, 3]
+    cells = [col * 9 + row for row in rows for col in cols]
+    labels = [0, 5, 2, 9, 1, 7, 3, 8, 4, 6]
+    return SymmetryTransform(cells, labels).to_canonical(values)
+
+
+class Background(unittest.TestCase):
+    @staticmethod
+    def wait(background_solve):
+        background_solve.thread.join()
+        return [event for batch in background_solve.get_batches() for event in batch]
+
+    def test_replayed_batches_solve_the_sudoku(self):
+        sudoku = SudokuParser.parse_sudoku("example_sudoku/sudoku_master_1.csv")
+        expected = sudoku.clone()
+        SudokuSolver(expected).solve()
+        background_solve = BackgroundSolve(sudoku)
+        background_solve.start()
+        events = self.wait(background_solve)
+        self.assertTrue(background_solve.is_finished)
+        self.assertEqual(list(background_solve.trace), events)
+        # the solve works on a copy
+        self.assertFalse(sudoku.is_sudoku_solved())
+        SolveTrace.replay(events, sudoku)
+        self.assertEqual(expected.to_string(), sudoku.to_string())
+
+    def test_stats_added_to_the_given_ones(self):
+        sudoku = SudokuParser.parse_sudoku("example_sudoku/sudoku_easy_1.csv")
+        solver = SudokuSolver(sudoku.clone())
+        solver.solve()
+        background_solve = BackgroundSolve(sudoku, count_strategies=solver.count_strategies)
+        background_solve.start()
+        self.wait(background_solve)
+        self.assertEqual([3, 43], solver.count_strategies["Only one candidate"])
+        self.assertEqual([6, 86], background_solve.solver.count_strategies["Only one candidate"])
+
+    def test_cancel(self):
+        sudoku = SudokuParser.parse_sudoku("example_sudoku/sudoku_master_1.csv")
+        background_solve = BackgroundSolve(sudoku, backtracking=True)
+        background_solve.cancel()
+        background_solve.start()
+        self.assertEqual([], self.wait(background_solve))
+        self.assertTrue(background_solve.is_finished)
+        # stopped before its first strategy
+        self.assertEqual({}, background_solve.solver.instrumentation.strategies)
+
+
+class Canonical(unittest.TestCase):
+    def test_equivalent_puzzles_have_the_same_form(self):
+        for file in sorted(glob.glob("example_sudoku/*.csv")):
+            values = list(SudokuParser.parse_sudoku(file).values)
+            key, transform = canonical_form(values)
+            self.assertEqual(key, canonical_form(transform_puzzle(values))[0])
+            canonical_values = transform.to_canonical(values)
+            self.assertEqual(key, "".join(str(v) if v else "." for v in canonical_values))
+            self.assertEqual(values, transform.from_canonical(transform.to_canonical(values)))
+
+    def test_different_puzzles_have_different_forms(self):
+        forms = {
+            canonical_form(SudokuParser.parse_sudoku(file).values)[0]
+            for file in glob.glob("example_sudoku/*.csv")
+        }
+        self.assertEqual(9, len(forms))
+
+
+class Cache(unittest.TestCase):
+    def test_equivalent_puzzle_is_replayed(self):
+        cache = SolveCache()
+        sudoku = SudokuParser.parse_sudoku("example_sudoku/sudoku_master_1.csv")
+        count_strategies, trace = cache.solve(sudoku)
+        self.assertTrue(sudoku.is_sudoku_solved())
+        self.assertEqual((0, 1), (cache.hits, cache.misses))
+
+        original = SudokuParser.parse_sudoku("example_sudoku/sudoku_master_1.csv")
+        values = transform_puzzle(original.values)
+        equivalent = SudokuParser.parse_sudoku_string("".join(map(str, values)))
+        replayed_strategies, replayed_trace = cache.solve(equivalent)
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        self.assertTrue(equivalent.is_sudoku_solved())
+        self.assertEqual(transform_puzzle(sudoku.values), list(equivalent.values))
+        self.assertEqual(count_strategies, replayed_strategies)
+        self.assertEqual(len(trace), len(replayed_trace))
+
+    def test_disk_tier_and_eviction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cache")
+            with SolveCache(max_size=1, path=path) as cache:
+                for file in ("sudoku_easy_1.csv", "sudoku_expert_1.csv"):
+                    cache.solve(SudokuParser.parse_sudoku("example_sudoku/" + file))
+                self.assertEqual(1, len(cache.entries))
+            with SolveCache(path=path) as cache:
+                sudoku = SudokuParser.parse_sudoku("example_sudoku/sudoku_easy_1.csv")
+                cache.solve(sudoku)
+                self.assertEqual((1, 0), (cache.hits, cache.misses))
+                self.assertTrue(sudoku.is_sudoku_solved())
+            with SolveCache(path=path, backtracking=True) as cache:
+                cache.solve(SudokuParser.parse_sudoku("example_sudoku/sudoku_easy_1.csv"))
+                self.assertEqual((0, 1), (cache.hits, cache.misses))
+
+
+class Dedup(unittest.TestCase):
+    def write_corpus(self, directory):
+        lines = []
+        for file in sorted(glob.glob("example_sudoku/*.csv")):
+            values = SudokuParser.parse_sudoku(file).values
+            lines.append("".join(map(str, values)))
+            lines.append("".join(map(str, transform_puzzle(values))))
+        lines.insert(3, lines[0].replace("0", "."))
+        lines.append("123")
+        path = os.path.join(directory, "corpus.txt")
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        return path
+
+    def test_scan(self):
+        with tempfile.TemporaryDirectory() as directory:
+            corpus = self.write_corpus(directory)
+            for workers, skip_exact_repeats in ((1, False), (2, False), (2, True)):
+                index = DedupIndex()
+                results = list(
+                    iter_deduplicated(corpus, index, workers, 4, skip_exact_repeats)
+                )
+                self.assertEqual(20, len(results))
+                self.assertEqual(list(range(1, 21)), [result[0] for result in results])
+                self.assertEqual(9, sum(result[4] for result in results))
+                self.assertEqual(9, len(index))
+                self.assertIsNone(results[-1][3])
+                self.assertEqual(results[0][3], results[3][3])
+
+    def test_index_runs(self):
+        rng = random.Random(5)
+        hashes = [rng.getrandbits(64) for _ in range(1000)]
+        index = DedupIndex()
+        with mock.patch("sudoku_dedup.ADDED_BUFFER_SIZE", 16):
+            for puzzle_hash in hashes:
+                self.assertTrue(index.add(puzzle_hash))
+            self.assertFalse(any(index.add(puzzle_hash) for puzzle_hash in hashes))
+        self.assertEqual(1000, len(index))
+        self.assertLessEqual(len(index.runs), 6)
+        self.assertEqual(sorted(hashes), list(index.get_hashes()))
+        index.merge_added()
+        self.assertEqual(([], 0), (index.runs, len(index.buffer)))
+        self.assertIn(hashes[0], index)
+
+    def test_index_file_and_merge(self):
+        with tempfile.TemporaryDirectory() as directory:
+            corpus = self.write_corpus(directory)
+            first, second = DedupIndex(), DedupIndex()
+            for _, _, _, puzzle_hash, _ in iter_deduplicated(corpus):
+                if puzzle_hash is not None:
+                    (first if puzzle_hash % 2 else second).add(puzzle_hash)
+            path = os.path.join(directory, "first.idx")
+            first.save(path)
+            self.assertEqual(8 * len(first), os.path.getsize(path))
+            merged = DedupIndex.merge([DedupIndex.load(path), second, first])
+            self.assertEqual(9, len(merged))
+            self.assertEqual(sorted(merged.hashes), list(merged.hashes))
+            new = [result for result in iter_deduplicated(corpus, merged) if result[4]]
+            self.assertEqual([], new)
+
+    def test_command_line(self):
+        with tempfile.TemporaryDirectory() as directory:
+            corpus = self.write_corpus(directory)
+            index = os.path.join(directory, "corpus.idx")
+            output = os.path.join(directory, "unique.txt")
+            dedup_main(["scan", corpus, "-w", "1", "-i", index, "-o", output])
+            with open(output) as f:
+                self.assertEqual(9, len(f.readlines()))
+            all_index = os.path.join(directory, "all.idx")
+            dedup_main(["merge", index, index, "-i", all_index])
+            self.assertEqual(9, len(DedupIndex.load(all_index)))
+
+
+class Grading(unittest.TestCase):
+    def test_example_tiers(self):
+        # the file names have the tiers of the site the puzzles come from, which also counts
+        # the givens: the hard and master ones with singles only are graded by their technique
+        expected = {
+            "easy_1": "easy",
+            "easy_2": "easy",
+            "medium_1": "medium",
+            "hard_1": "easy",
+            "expert_1": "medium",
+            "master_1": "hard",
+            "master_2": "medium",
+            "extreme_1": "expert",
+            "extreme_2": "expert",
+        }
+        for file in sorted(glob.glob("example_sudoku/*.csv")):
+            name = os.path.basename(file)[len("sudoku_") : -len(".csv")]
+            # with the top tier as stop tier, the sudokus are solved to the end
+            result = grade(SudokuParser.parse_sudoku(file))
+            self.assertTrue(result["complete"])
+            self.assertEqual("solved", result["status"])
+            self.assertEqual(expected[name], result["tier"])
+
+    def test_tier_of_the_hardest_strategy(self):
+        stats = {"Only one candidate": [3, 40], "Only position in row": [2, 0]}
+        self.assertEqual("easy", TIERS[get_tier(stats)])
+        self.assertEqual(3, get_score(stats))
+        stats["Pointing and claiming"] = [1, 2]
+        self.assertEqual("hard", TIERS[get_tier(stats)])
+        # the score counts the calls of the strategies of the tier only
+        self.assertEqual(1, get_score(stats))
+        self.assertEqual(3, get_score(stats, TIERS.index("easy")))
+        self.assertEqual("extreme", TIERS[get_tier(stats, is_solved=False)])
+
+    def test_early_termination(self):
+        sudoku = SudokuParser.parse_sudoku("example_sudoku/sudoku_extreme_1.csv")
+        result = grade(sudoku, stop_tier=TIERS.index("expert"))
+        self.assertFalse(result["complete"])
+        self.assertEqual("expert", result["tier"])
+        self.assertFalse(sudoku.is_sudoku_solved())
+        easy = SudokuParser.parse_sudoku("example_sudoku/sudoku_easy_1.csv")
+        self.assertTrue(grade(easy, stop_tier=1)["complete"])
+
+    def test_grade_batch(self):
+        results = list(grade_batch("example_sudoku", workers=2, stop_tier=TIERS.index("master")))
+        self.assertEqual(9, len(results))
+        self.assertEqual(["easy", "easy"], [result["tier"] for result in results[:2]])
+        with tempfile.TemporaryDirectory() as directory:
+            corpus_file = os.path.join(directory, "corpus.txt")
+            with open(corpus_file, "w") as f:
+                f.write(Backtracking.escargot + "\n")
+            # the human strategies get stuck on this one, the search finishes it
+            for backtracking, status in ((False, "unsolved"), (True, "solved")):
+                results = list(grade_batch(corpus_file, workers=1, backtracking=backtracking))
+                self.assertEqual([("extreme", status)], [(r["tier"], r["status"]) for r in results])
+
+
+class Generator(unittest.TestCase):
+    def test_unique_solution_in_tier(self):
+        rng = random.Random(7)
+        for tier in ("easy", "hard", "expert"):
+            result = generate_puzzle(tier, rng=rng)
+            self.assertEqual(tier, result["tier"])
+            sudoku = SudokuParser.parse_sudoku_string(result["puzzle"])
+            solutions = list(islice(iter_solutions(sudoku.masks, sudoku.values), 2))
+            solutions = ["".join(map(str, values)) for values in solutions]
+            self.assertEqual([result["solution"]], solutions)
+            self.assertEqual(tier, grade(sudoku)["tier"])
+
+    def test_hard_puzzle_needs_a_hard_strategy(self):
+        result = generate_puzzle("hard", rng=random.Random(11))
+        sudoku = SudokuParser.parse_sudoku_string(result["puzzle"])
+        solver = SudokuSolver(sudoku)
+        solver.solve()
+        self.assertTrue(sudoku.is_sudoku_solved())
+        # the singles get stuck, pointing and claiming is needed but nothing harder
+        self.assertGreater(solver.count_strategies["Pointing and claiming"][1], 0)
+        self.assertEqual(0, solver.count_strategies["Naked n-tuples"][1])
+        self.assertEqual(0, solver.count_strategies["Hidden n-tuples"][1])
+
+    def test_symmetric_clues(self):
+        result = generate_puzzle(symmetry=SYMMETRY_ROTATIONAL, rng=random.Random(3))
+        puzzle = result["puzzle"]
+        blanks = [char == "." for char in puzzle]
+        self.assertEqual(blanks, blanks[::-1])
+
+    def test_removed_clue_check(self):
+        solution = random_solution(random.Random(1))
+        givens = list(solution)
+        self.assertFalse(has_other_solution(givens, solution, []))
+        # the 1s and 2s can be swapped everywhere
+        removed = [index for index, value in enumerate(solution) if value in (1, 2)]
+        givens = [0 if value in (1, 2) else value for value in solution]
+        self.assertTrue(has_other_solution(givens, solution, removed))
+
+    def test_generate_batch(self):
+        results = list(generate_batch(3, "medium", workers=1, seed=5))
+        self.assertEqual(3, len(results))
+        self.assertEqual(results, list(generate_batch(3, "medium", workers=1, seed=5)))
+        self.assertEqual(results, list(generate_batch(3, "medium", workers=2, seed=5)))
+        self.assertEqual(4, len(list(generate_batch(4, workers=2))))
+
+
+class Batch(unittest.TestCase):
+    def test_parse_sudoku_string(self):
+        sudoku = SudokuParser.parse_sudoku_string("8.7" + "0" * 78)
+        self.assertEqual(8, sudoku.cells[0][0].value)
+        self.assertEqual(7, sudoku.cells[0][2].value)
+        self.assertEqual(79, sudoku.nb_unsolved)
+        self.assertEqual("8.7" + "." * 78, sudoku.to_string())
+        with self.assertRaises(ValueError):
+            SudokuParser.parse_sudoku_string("123")
+
+    def test_conflicting_givens(self):
+        # the same value twice in a row, in a column, and in a square
+        for other in (1, 9, 10):
+            line = "1" + "." * 80
+            line = line[:other] + "1" + line[other + 1 :]
+            with self.assertRaises(ValueError):
+                SudokuParser.parse_sudoku_string(line)
+        line = "11" + Backtracking.escargot[2:]
+        result = solve_job(("1", False, line), backtracking=True, check=True)
+        self.assertEqual("error", result["status"])
+        result = solve_request(make_job({"puzzle": line, "check": True}))
+        self.assertEqual("error", result["status"])
+        with tempfile.TemporaryDirectory() as directory:
+            csv_file = os.path.join(directory, "sudoku.csv")
+            with open(csv_file, "w") as f:
+                f.write("1,1,5\n1,2,5\n")
+            with self.assertRaises(ValueError):
+                SudokuParser.parse_sudoku(csv_file)
+
+    def test_malformed_csv(self):
+        with tempfile.TemporaryDirectory() as directory:
+            rows = ["10,1,5", "0,1,5", "1,1,10", "1,1,0", "1,2", "1,2,x", ""]
+            for k, row in enumerate(rows):
+                with open(os.path.join(directory, f"sudoku_{k}.csv"), "w") as f:
+                    f.write("1,1,5\n" + row + "\n")
+            results = list(solve_batch(directory, workers=1))
+            self.assertEqual(["error"] * len(rows), [result["status"] for result in results])
+
+    def test_iter_sudoku_lines(self):
+        puzzle = SudokuParser.parse_sudoku("example_sudoku/sudoku_easy_1.csv")
+        solved = SudokuParser.parse_sudoku("example_sudoku/sudoku_easy_1.csv")
+        SudokuSolver(solved).solve()
+        with tempfile.TemporaryDirectory() as directory:
+            corpus_file = os.path.join(directory, "corpus.txt")
+            with open(corpus_file, "w") as f:
+                f.write("# comment\n")
+                f.write(puzzle.to_string().replace(".", "0") + "\n\n")
+                f.write(puzzle.to_string() + "," + solved.to_string() + "\n")
+            lines = list(SudokuParser.iter_sudoku_lines(corpus_file))
+            sudokus = list(SudokuParser.iter_sudokus(corpus_file))
+        self.assertEqual([2, 4], [line_number for line_number, _, _ in lines])
+        self.assertIsNone(lines[0][2])
+        self.assertEqual(solved.to_string(), lines[1][2])
+        self.assertEqual([puzzle.to_string()] * 2, [sudoku.to_string() for sudoku in sudokus])
+
+    def test_non_ascii_line(self):
+        puzzle = SudokuParser.parse_sudoku("example_sudoku/sudoku_easy_1.csv").to_string()
+        with tempfile.TemporaryDirectory() as directory:
+            corpus_file = os.path.join(directory, "corpus.txt")
+            with open(corpus_file, "wb") as f:
+                for line in (puzzle, "\xff" + puzzle[1:], puzzle):
+                    f.write(line.encode("latin-1") + b"\n")
+            lines = list(SudokuParser.iter_sudoku_lines(corpus_file))
+            results = list(solve_batch(corpus_file, workers=1))
+        self.assertEqual("\ufffd" + puzzle[1:], lines[1][1])
+        # only the puzzle of the line is an error, the others are solved
+        self.assertEqual(["solved", "error", "solved"], [result["status"] for result in results])
+
+    def test_solve_job(self):
+        line = SudokuParser.parse_sudoku("example_sudoku/sudoku_easy_1.csv").to_string()
+        result = solve_job(("1", False, line))
+        self.assertEqual("solved", result["status"])
+        self.assertEqual([3, 43], result["strategies"]["Only one candidate"])
+
+    def test_solve_batch_directory(self):
+        results = list(solve_batch("example_sudoku", workers=2, chunk_size=2))
+        self.assertEqual(9, len(results))
+        self.assertEqual("sudoku_easy_1.csv", results[0]["name"])
+        self.assertEqual(9, sum(result["status"] == "solved" for result in results))
+
+    @staticmethod
+    def check_batch(engine):
+        # a unique solution out of reach of the strategies, several solutions, and none
+        lines = [
+            Backtracking.escargot,
+            "." + Backtracking.escargot[1:],
+            "12345678" + "." * 36 + "9" + "." * 36,
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            corpus_file = os.path.join(directory, "corpus.txt")
+            with open(corpus_file, "w") as f:
+                f.write("\n".join(lines) + "\n")
+            return list(solve_batch(corpus_file, workers=1, engine=engine, check=True))
+
+    def test_check_before_solving(self):
+        results = self.check_batch("python")
+        statuses = [result["status"] for result in results]
+        self.assertEqual(["unsolved", "multiple", "impossible"], statuses)
+        self.assertEqual({}, results[1]["strategies"])
+
+
+class Service(unittest.IsolatedAsyncioTestCase):
+    easy = SudokuParser.parse_sudoku("example_sudoku/sudoku_easy_1.csv").to_string()
+
+    @staticmethod
+    async def http(port, method, path, message=None, content_length=None):
+        """
+        :param content_length: Content-Length header to send, the length of the body by default
+        :return: HTTP status code and decoded JSON body of the answer
+        """
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        body = json.dumps(message).encode() if message is not None else b""
+        if content_length is None:
+            content_length = len(body)
+        writer.write(
+            f"{method} {path} HTTP/1.1\r\nContent-Length: {content_length}\r\n"
+            "Connection: close\r\n\r\n".encode() + body
+        )
+        answer = await asyncio.wait_for(reader.read(), 10)
+        writer.close()
+        head, _, body = answer.partition(b"\r\n\r\n")
+        return int(head.split()[1]), json.loads(body)
+
+    async def test_http(self):
+        async with SolveService(workers=1) as service:
+            server = await service.serve("127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            code, result = await self.http(port, "POST", "/solve", {"id": 1, "puzzle": self.easy})
+            self.assertEqual((200, 1, "solved"), (code, result["id"], result["status"]))
+            self.assertEqual([3, 43], result["strategies"]["Only one candidate"])
+            code, results = await self.http(
+                port,
+                "POST",
+                "/solve",
+                [{"puzzle": Backtracking.escargot, "backtracking": True}, {"puzzle": "123"}],
+            )
+            self.assertEqual(["solved", "error"], [result["status"] for result in results])
+            code, result = await self.http(port, "POST", "/solve", {"puzzle": "123"})
+            self.assertEqual(400, code)
+            code, health = await self.http(port, "GET", "/health")
+            self.assertEqual((200, 4), (code, health["dispatched"]))
+            code, _ = await self.http(port, "GET", "/solve")
+            self.assertEqual(405, code)
+
+    async def test_invalid_content_length(self):
+        async with SolveService(workers=1) as service:
+            server = await service.serve("127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            for content_length in ("abc", "-5"):
+                code, result = await self.http(port, "POST", "/solve", None, content_length)
+                self.assertEqual((400, "error"), (code, result["status"]))
+            code, _ = await self.http(port, "POST", "/solve", None, MAX_BODY_SIZE + 1)
+            self.assertEqual(413, code)
+            # the service still answers
+            code, _ = await self.http(port, "GET", "/health")
+            self.assertEqual(200, code)
+
+    async def test_line_protocol(self):
+        async with SolveService(workers=1) as service:
+            server = await service.serve("127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            for i in range(3):
+                writer.write(json.dumps({"id": f"p{i}", "puzzle": self.easy}).encode() + b"\n")
+            writer.write(b"not json\n")
+            writer.write(json.dumps({"puzzle": Backtracking.escargot}).encode() + b"\n")
+            writer.write(json.dumps({"cancel": "unknown"}).encode() + b"\n")
+            writer.write_eof()
+            answers = (await asyncio.wait_for(reader.read(), 10)).decode().splitlines()
+            writer.close()
+        results = {result["id"]: result["status"] for result in map(json.loads, answers)}
+        self.assertEqual(
+            {"p0": "solved", "p1": "solved", "p2": "solved", 4: "error", 5: "unsolved"}, results
+        )
+
+    async def test_timeout(self):
+        async with SolveService(workers=1) as service:
+            result = await service.solve({"puzzle": self.easy, "timeout": 1e-6})
+        self.assertEqual("timeout", result["status"])
+        job = make_job({"puzzle": self.easy})
+        job["deadline"] = time.time() - 1
+        self.assertEqual({"status": "timeout"}, solve_request(job))
+        sudoku = SudokuParser.parse_sudoku_string(self.easy)
+        nb_unsolved = sudoku.nb_unsolved
+        DeadlineSolver(sudoku, time.time() - 1).solve()
+        self.assertEqual(nb_unsolved, sudoku.nb_unsolved)
+        with self.assertRaises(ValueError):
+            make_job({"puzzle": self.easy, "timeout": -1})
+
+    def test_search_deadline(self):
+        # 1 to 9 are given in the third and fourth rows out of the first box: its 8 other cells
+        # cannot hold them all, which the strategies miss and the search takes seconds to prove
+        rows = "." * 32 + "....123456789..." + "....56789123.4.."
+        puzzle = rows + "." * (256 - len(rows))
+        sudoku = SudokuParser.parse_sudoku_string(puzzle, box_size=4)
+        self.assertIsNone(count_solutions(sudoku.masks, sudoku.values, max_nodes=1000))
+        for check in (False, True):
+            start = time.time()
+            job = make_job(
+                {
+                    "puzzle": puzzle,
+                    "box_size": 4,
+                    "backtracking": True,
+                    "check": check,
+                    "timeout": 0.2,
+                }
+            )
+            self.assertEqual("timeout", solve_request(job)["status"])
+            self.assertLess(time.time() - start, 1)
+
+    async def test_worker_death(self):
+        async with SolveService(workers=1) as service:
+            with self.assertRaises(BrokenProcessPool):
+                await asyncio.wrap_future(service.executor.submit(os._exit, 1))
+            result = await service.solve({"puzzle": self.easy})
+            self.assertEqual("solved", result["status"])
+            self.assertEqual(1, service.stats["restarts"])
+
+    async def test_backpressure_and_cancel(self):
+        service = SolveService(workers=1, max_pending=1)
+        # not started: the requests stay queued
+        job = make_job({"puzzle": self.easy})
+        future = await service.submit(job)
+        self.assertEqual({"status": "busy"}, await service.solve({"puzzle": self.easy}, False))
+        future.cancel()
+        service.start()
+        try:
+            result = await service.solve({"puzzle": self.easy})
+        finally:
+            await service.close()
+        self.assertEqual("solved", result["status"])
+        stats = service.stats
+        self.assertEqual((1, 1, 1), (stats["rejected"], stats["dropped"], stats["dispatched"]))
+
+
+class Benchmark(unittest.TestCase):
+    def test_summarize(self):
+        summary = summarize([0.001, 0.002, 0.003])
+        self.assertEqual(3, summary["count"])
+        self.assertAlmostEqual(2, summary["median"])
+        self.assertAlmostEqual(3, summary["max"])
+        self.assertAlmostEqual(1, summarize([0.001])["p99"])
+        self.assertEqual(0, summarize([])["count"])
+        self.assertIsNone(summarize([])["median"])
+
+    def test_empty_tier(self):
+        with tempfile.TemporaryDirectory() as directory:
+            corpus_file = os.path.join(directory, "empty.txt")
+            open(corpus_file, "w").close()
+            results = run_benchmark(load_corpus(corpus_file), repeat=1)
+        empty = results["tiers"]["empty"]
+        self.assertEqual(0, empty["nb_puzzles"])
+        self.assertIsNone(empty["solve"]["median"])
+        self.assertEqual([], compare(results, results))
+
+    def test_run_and_compare(self):
+        tiers = load_directory("example_sudoku")
+        self.assertEqual(2, len(tiers["easy"]))
+        results = run_benchmark({"easy": tiers["easy"]}, repeat=2)
+        easy = results["tiers"]["easy"]
+        self.assertEqual(4, easy["solve"]["count"])
+        self.assertEqual(2, easy["nb_solved"])
+        self.assertIn("Only one candidate", easy["strategies"])
+        self.assertEqual([], compare(results, results))
+
+        faster = json.loads(json.dumps(results))
+        faster["tiers"]["easy"]["solve"]["median"] /= 10
+        self.assertEqual(["solve"], [measure for _, measure, _, _ in compare(results, faster)])
+
+    def test_time_solve(self):
+        sudoku = SudokuParser.parse_sudoku("example_sudoku/sudoku_easy_1.csv")
+        with mock.patch.object(
+            SudokuSolver, "instrument", autospec=True, side_effect=SudokuSolver.instrument
+        ) as instrument:
+            solve_time, times = time_solve(sudoku)
+        self.assertTrue(sudoku.is_sudoku_solved())
+        self.assertGreater(solve_time, 0)
+        self.assertIn("Only one candidate", times)
+        # only the copy solved after the timing is instrumented
+        self.assertIsNot(sudoku, instrument.call_args.args[0].sudoku)
+
+
+class Binary(unittest.TestCase):
+    @staticmethod
+    def get_partial_state():
+        sudoku = SudokuParser.parse_sudoku("example_sudoku/sudoku_master_1.csv")
+        solver = SudokuSolver(sudoku)
+        solver.only_one_candidate()
+        solver.pointing_and_claiming()
+        return sudoku
+
+    def test_values_and_masks(self):
+        sudoku = self.get_partial_state()
+        values = list(sudoku.values)
+        self.assertEqual(41, len(pack_values(values)))
+        self.assertEqual(values, unpack_values(pack_values(values)))
+        for invalid in ([1] * 79, [10] + [0] * 80, [-1] + [0] * 80):
+            with self.assertRaises(ValueError):
+                pack_values(invalid)
+        self.assertEqual(92, len(pack_masks(sudoku.masks)))
+        self.assertEqual(list(sudoku.masks), unpack_masks(pack_masks(sudoku.masks)))
+
+    def test_state(self):
+        sudoku = self.get_partial_state()
+        self.assertEqual(sudoku.snapshot(), unpack_state(pack_state(sudoku)).snapshot())
+        impossible = Sudoku()
+        for i in range(8):
+            impossible.set_value(0, i, i + 1)
+        impossible.set_value(4, 8, 9)
+        self.assertTrue(unpack_state(pack_state(impossible)).is_impossible())
+        with self.assertRaises(ValueError):
+            pack_state(Sudoku(4))
+
+    def test_corpus(self):
+        puzzle = SudokuParser.parse_sudoku("example_sudoku/sudoku_easy_1.csv")
+        solved = puzzle.clone()
+        SudokuSolver(solved).solve()
+        records = [
+            {"givens": puzzle.to_string(), "solution": solved.to_string()},
+            {"givens": list(solved.values)},
+            {"givens": "11" + "." * 79},
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "corpus.sdb")
+            self.assertEqual(3, write_records(path, records, PART_GIVENS | PART_SOLUTION))
+            self.assertEqual(16 + 3 * 82, os.path.getsize(path))
+            with BinaryCorpus(path) as corpus:
+                self.assertEqual(3, len(corpus))
+                self.assertEqual(list(solved.values), corpus[0]["solution"])
+                self.assertIsNone(corpus[-1]["solution"])
+                self.assertEqual(puzzle.snapshot(), corpus.get_sudoku(0).snapshot())
+                # conflicting givens are rejected as when parsing the puzzle
+                with self.assertRaises(ValueError):
+                    corpus.get_sudoku(2)
+                with self.assertRaises(IndexError):
+                    corpus.get_givens(3)
+                with self.assertRaises(KeyError):
+                    corpus.get_state(0)
+                if NumpySinglesSolver is not None:
+                    values = corpus.get_values_array(PART_GIVENS)
+                    self.assertEqual((3, 81), values.shape)
+                    self.assertEqual(list(solved.values), values[1].tolist())
+
+            state = self.get_partial_state()
+            write_records(path, [{"state": state}], PART_STATE)
+            with BinaryCorpus(path) as corpus:
+                self.assertEqual(state.snapshot(), corpus.get_sudoku(0).snapshot())
+            with open(path, "ab") as f:
+                f.write(b"\0")
+            with self.assertRaises(ValueError):
+                BinaryCorpus(path)
+
+    def test_pack_and_unpack_corpus(self):
+        puzzle = SudokuParser.parse_sudoku("example_sudoku/sudoku_easy_1.csv").to_string()
+        lines = [puzzle, Backtracking.escargot]
+        with tempfile.TemporaryDirectory() as directory:
+            text_file = os.path.join(directory, "corpus.txt")
+            with open(text_file, "w") as f:
+                f.write("\n".join([lines[0], "123", "x" * 81, lines[1]]) + "\n")
+            binary_file = os.path.join(directory, "corpus.sdb")
+            # the malformed lines are skipped
+            with self.assertLogs(level="WARNING") as logs:
+                binary_main(["pack", text_file, binary_file])
+            self.assertEqual(2, len(logs.records))
+            binary_main(["unpack", binary_file, text_file])
+            with open(text_file) as f:
+                self.assertEqual(lines, f.read().splitlines())
+
+
+@unittest.skipIf(NumpySinglesSolver is None, "NumPy is not installed")
+class NumpyEngine(unittest.TestCase):
+    def test_same_solutions_as_solver(self):
+        files = sorted(glob.glob("example_sudoku/*.csv"))
+        sudokus, count_strategies = NumpySinglesSolver(
+            SudokuParser.parse_sudoku(file) for file in files
+        ).solve()
+        for file, sudoku in zip(files, sudokus):
+            expected = SudokuParser.parse_sudoku(file)
+            SudokuSolver(expected).solve()
+            self.assertEqual(expected.to_string(), sudoku.to_string())
+        self.assertEqual([3, 22], count_strategies[0]["Only one candidate"])
+
+    def test_singles_only(self):
+        sudoku = SudokuParser.parse_sudoku("example_sudoku/sudoku_easy_1.csv")
+        engine = NumpySinglesSolver([sudoku, Sudoku()])
+        engine.solve_singles()
+        solved, empty = engine.to_sudokus()
+        self.assertTrue(solved.is_sudoku_solved())
+        self.assertEqual(81, empty.nb_unsolved)
+
+    def test_conflicting_singles_are_not_applied(self):
+        sudoku = Sudoku()
+        for i in range(8):
+            self.assertTrue(sudoku.set_value(0, i, i + 1))
+            self.assertTrue(sudoku.set_value(5, i, (i + 1) % 8 + 1))
+        # both (0, 8) and (5, 8) can only be a 9
+        sudokus, _ = NumpySinglesSolver([sudoku]).solve(fallback=False)
+        self.assertIsNone(sudokus[0].cells[0][8].value)
+        self.assertIsNone(sudokus[0].cells[5][8].value)
+
+    def test_batch_engine(self):
+        results = list(solve_batch("example_sudoku", workers=2, chunk_size=4, engine="numpy"))
+        self.assertEqual(9, len(results))
+        self.assertEqual(9, sum(result["status"] == "solved" for result in results))
+
+    def test_check_before_solving(self):
+        results = Batch.check_batch("numpy")
+        statuses = [result["status"] for result in results]
+        self.assertEqual(["unsolved", "multiple", "impossible"], statuses)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,205 @@
+import json
+from array import array
+
+from sudoku import SIZE, candidates_from_mask
+from sudoku_human_solver import (
+    STRATEGY_1,
+    STRATEGY_2,
+    STRATEGY_3,
+    STRATEGY_4,
+    STRATEGY_5,
+    STRATEGY_6,
+    STRATEGY_7,
+    STRATEGY_8,
+)
+from sudoku_instrumentation import SolverInstrumentation
+
+# kinds of the events
+EVENT_STRATEGY_START = 0
+EVENT_STRATEGY_END = 1
+EVENT_PLACEMENT = 2
+EVENT_ELIMINATION = 3
+EVENT_NAMES = ("strategy_start", "strategy_end", "placement", "elimination")
+# strategies, by the code stored in the events
+STRATEGIES = (
+    STRATEGY_1,
+    STRATEGY_2,
+    STRATEGY_3,
+    STRATEGY_4,
+    STRATEGY_5,
+    STRATEGY_6,
+    STRATEGY_7,
+    STRATEGY_8,
+)
+STRATEGY_CODES = {strategy: code for code, strategy in enumerate(STRATEGIES)}
+EVENT_SIZE = 4
+
+
+class SolveTrace:
+    """
+    Step by step record of a solve, given to SudokuSolver.solve.
+    Each event takes 4 unsigned integers in the buffer: kind, strategy code, cell index, and
+    the placed value, the bitmask of the eliminated candidates, or 1 if the strategy found something.
+    They are shorts, or wider for the grids bigger than 16x16 whose bitmasks need it.
+    The eliminations of a strategy call are recorded together, at its end
+
+    Attributes:
+    - events: flat array of the events
+    - size: size of the traced grid, to locate the cells
+    - solver: the solver being traced, None outside of a solve
+    """
+
+    def __init__(self):
+        self.events = array("H")
+        self.size = SIZE
+        self.solver = None
+        self._strategy = 0
+        self._masks = None
+        self._created_instrumentation = False
+
+    @staticmethod
+    def from_events(events):
+        """
+        :param events: (kind, strategy, index, data) tuples
+        :return: SolveTrace holding the events
+        """
+        trace = SolveTrace()
+        for kind, strategy, index, data in events:
+            trace.events.extend((kind, STRATEGY_CODES[strategy], index, data))
+        return trace
+
+    def __len__(self):
+        return len(self.events) // EVENT_SIZE
+
+    def attach(self, solver):
+        """
+        Start recording the strategies and the placements of a solver
+
+        :param solver: SudokuSolver to trace
+        """
+        self.solver = solver
+        geometry = solver.sudoku.geometry
+        self.size = geometry.size
+        if self.events.itemsize < array(geometry.mask_typecode).itemsize:
+            self.events = array(geometry.mask_typecode, self.events)
+        instrumentation = solver.instrumentation
+        self._created_instrumentation = instrumentation is None
+        if instrumentation is None:
+            instrumentation = solver.instrument()
+        instrumentation.before_strategy.append(self.on_strategy_start)
+        instrumentation.after_strategy.append(self.on_strategy_end)
+        instrumentation.after_set_value.append(self.on_set_value)
+
+    def detach(self):
+        """
+        Stop recording, the solver is left as it was before attach
+        """
+        solver = self.solver
+        instrumentation = solver.instrumentation
+        instrumentation.before_strategy.remove(self.on_strategy_start)
+        instrumentation.after_strategy.remove(self.on_strategy_end)
+        instrumentation.after_set_value.remove(self.on_set_value)
+        if self._created_instrumentation:
+            solver.instrumentation = None
+            solver.sudoku.hooks = None
+        self.solver = None
+
+    def on_strategy_start(self, solver, strategy):
+        self._strategy = STRATEGY_CODES[strategy]
+        self._masks = solver.sudoku.masks[:]
+        self.events.extend((EVENT_STRATEGY_START, self._strategy, 0, 0))
+
+    def on_strategy_end(self, solver, strategy, found):
+        _, eliminations = SolverInstrumentation.get_changes(self._masks, solver.sudoku)
+        for index, removed in eliminations:
+            self.events.extend((EVENT_ELIMINATION, self._strategy, index, removed))
+        self.events.extend((EVENT_STRATEGY_END, self._strategy, 0, 1 if found else 0))
+
+    def on_set_value(self, sudoku, index, value, is_placed):
+        if is_placed:
+            self.events.extend((EVENT_PLACEMENT, self._strategy, index, value))
+
+    def __iter__(self):
+        """
+        :return: generator of the events, as (kind, strategy, index, data) tuples
+        """
+        return self.iter_events()
+
+    def iter_events(self, first=0):
+        """
+        :param first: number of the first event, to read only the events added since
+        :return: generator of the events from this one, as (kind, strategy, index, data) tuples
+        """
+        events = self.events
+        for start in range(first * EVENT_SIZE, len(events), EVENT_SIZE):
+            kind, code, index, data = events[start : start + EVENT_SIZE]
+            yield kind, STRATEGIES[code], index, data
+
+    @staticmethod
+    def to_dict(event, size=SIZE):
+        """
+        :param event: (kind, strategy, index, data) tuple
+        :param size: size of the grid
+        :return: JSON-serializable dictionary describing the event
+        """
+        kind, strategy, index, data = event
+        result = {"event": EVENT_NAMES[kind], "strategy": strategy}
+        if kind == EVENT_PLACEMENT:
+            result.update(row=index // size, col=index % size, value=data)
+        elif kind == EVENT_ELIMINATION:
+            result.update(row=index // size, col=index % size)
+            result["candidates"] = list(candidates_from_mask(data))
+        elif kind == EVENT_STRATEGY_END:
+            result["found"] = bool(data)
+        return result
+
+    @staticmethod
+    def describe(event, size=SIZE):
+        """
+        :param event: (kind, strategy, index, data) tuple
+        :param size: size of the grid
+        :return: sentence explaining the event
+        """
+        kind, strategy, index, data = event
+        row, col = divmod(index, size)
+        if kind == EVENT_PLACEMENT:
+            return f"{strategy}: {data} placed in ({row}, {col})"
+        elif kind == EVENT_ELIMINATION:
+            candidates = ", ".join(str(candidate) for candidate in candidates_from_mask(data))
+            return f"{strategy}: {candidates} removed from the candidates of ({row}, {col})"
+        elif kind == EVENT_STRATEGY_START:
+            return f"Trying {strategy}"
+        else:
+            return f"{strategy} " + ("found something" if data else "found nothing")
+
+    def explain(self, with_strategies=False):
+        """
+        :param with_strategies: also describe the strategy calls, not only their results
+        :return: list of the sentences describing the solve
+        """
+        return [
+            self.describe(event, self.size)
+            for event in self
+            if with_strategies or event[0] in (EVENT_PLACEMENT, EVENT_ELIMINATION)
+        ]
+
+    @staticmethod
+    def replay(events, sudoku):
+        """
+        Apply the placements and eliminations of a solve to a sudoku in the same starting state
+
+        :param events: (kind, strategy, index, data) tuples, as iterated from a SolveTrace
+        :param sudoku: the sudoku to change
+        """
+        for kind, _, index, data in events:
+            if kind == EVENT_PLACEMENT:
+                sudoku.set_value_at(index, data)
+            elif kind == EVENT_ELIMINATION:
+                sudoku.keep_candidates_at(index, ~data)
+
+    def write_json_lines(self, file):
+        """
+        :param file: text file object to write one JSON event per line to
+        """
+        for event in self:
+            file.write(json.dumps(self.to_dict(event, self.size)) + "\n")